@@ -0,0 +1,6 @@
+"""
+Performance Benchmarks
+
+These are not unit tests. They are scripts that are run by hand against
+a database (and later a running service) to measure performance.
+"""
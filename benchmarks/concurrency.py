@@ -0,0 +1,135 @@
+"""
+Concurrency Benchmark
+
+Compares how gunicorn worker modes cope with slow requests. A few clients
+keep asking for a slow listing while the others read single Pets, and the
+latency of the fast reads is reported for each mode:
+
+- sync: one worker that handles one request at a time, as the service
+  used to run
+- gthread: one worker with a pool of threads, so fast reads are served
+  while other threads wait on the database
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python -m benchmarks.concurrency --threads 8 --clients 16
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from urllib.error import URLError
+from concurrent.futures import ThreadPoolExecutor
+from service import create_app
+from service.models import Pet, db
+from benchmarks.common import seed_pets
+
+
+def start_gunicorn(port: int, worker_class: str, workers: int, threads: int) -> subprocess.Popen:
+    """Starts the service under gunicorn and waits until it is live"""
+    env = dict(os.environ, DB_MIGRATE_ON_STARTUP="false")
+    env.pop("GUNICORN_CMD_ARGS", None)
+    command = [
+        sys.executable, "-m", "gunicorn", f"--bind=127.0.0.1:{port}", f"--worker-class={worker_class}",
+        f"--workers={workers}", f"--threads={threads}", "--log-level=warning", "wsgi:app",
+    ]
+    server = subprocess.Popen(command, env=env)  # pylint: disable=consider-using-with
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/live", timeout=1):
+                return server
+        except (URLError, ConnectionError):
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def run_client(base_url: str, paths, deadline: float) -> list:
+    """Sends requests one after the other until the deadline
+
+    :return: a list of (path kind, seconds) for the successful requests
+    """
+    results = []
+    while time.monotonic() < deadline:
+        kind, path = paths()
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + path, timeout=60) as response:
+                response.read()
+        except (URLError, ConnectionError):
+            continue
+        results.append((kind, time.perf_counter() - start))
+    return results
+
+
+def run_load(base_url: str, clients: list, duration: float) -> list:
+    """Runs one thread per client for duration seconds and returns all results
+
+    :param clients: for each client, a function that returns the next
+        (kind, path) to request
+    """
+    deadline = time.monotonic() + duration
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        futures = [executor.submit(run_client, base_url, paths, deadline) for paths in clients]
+        return [result for future in futures for result in future.result()]
+
+
+def percentiles(seconds: list) -> tuple:
+    """Returns the (p50, p95, p99) of the latencies in milliseconds"""
+    if len(seconds) < 2:
+        return (seconds[0] * 1000,) * 3 if seconds else (0.0,) * 3
+    cuts = statistics.quantiles(seconds, n=100)
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+def report(name: str, results: list, duration: float) -> None:
+    """Prints the throughput and latencies of one mode"""
+    fast_p50, fast_p95, fast_p99 = percentiles([seconds for kind, seconds in results if kind == "fast"])
+    slow_p50 = percentiles([seconds for kind, seconds in results if kind == "slow"])[0]
+    print(
+        f"{name:<14}{len(results) / duration:>8.0f}{fast_p50:>10.1f}{fast_p95:>10.1f}{fast_p99:>10.1f}{slow_p50:>10.1f}"
+    )
+
+
+def main():
+    """Runs the same mixed load against each worker mode"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pets", type=int, default=10_000, help="number of pets to seed")
+    parser.add_argument("--clients", type=int, default=16, help="number of concurrent clients")
+    parser.add_argument("--slow-clients", type=int, default=2, help="clients that only send slow requests")
+    parser.add_argument("--slow-path", default="/pets/stats?birthday_from=1900-01-01", help="the slow request")
+    parser.add_argument("--threads", type=int, default=8, help="threads of the gthread worker")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load for each mode")
+    parser.add_argument("--port", type=int, default=8089, help="port for gunicorn")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f"Seeded {seed_pets(args.pets)} pets")
+        ids = [row.id for row in db.session.execute(db.select(Pet.id)).all()]
+
+    def fast_path():
+        return "fast", f"/pets/{random.choice(ids)}"
+
+    def slow_path():
+        return "slow", args.slow_path
+
+    clients = [slow_path if client < args.slow_clients else fast_path for client in range(args.clients)]
+    modes = [("sync", "sync", 1), (f"gthread x{args.threads}", "gthread", args.threads)]
+    print(f"{'mode':<14}{'req/s':>8}{'fast p50':>10}{'fast p95':>10}{'fast p99':>10}{'slow p50':>10}  (ms)")
+    for name, worker_class, threads in modes:
+        server = start_gunicorn(args.port, worker_class, 1, threads)
+        try:
+            results = run_load(f"http://127.0.0.1:{args.port}", clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        report(name, results, args.duration)
+
+
+if __name__ == "__main__":
+    main()
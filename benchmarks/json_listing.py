@@ -0,0 +1,51 @@
+"""
+JSON Listing Benchmark
+
+Compares how fast 10,000 Pets are written as a JSON array with:
+
+- default: Flask's default provider encoding one dictionary per Pet
+- orjson: the OrjsonProvider encoding the same dictionaries, when orjson
+  is installed
+- text: Pet.rows_to_json(), which GET /pets uses to write the rows
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python -m benchmarks.json_listing --pets 10000
+"""
+import argparse
+import statistics
+from flask.json.provider import DefaultJSONProvider
+from service import create_app
+from service.models import Pet, JSON_FIELDS
+from service.common import json_provider
+from service.common.json_provider import OrjsonProvider
+from benchmarks.common import seed_pets, timed
+
+
+def main():
+    """Seeds the database and times each way of writing the listing"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pets", type=int, default=10_000, help="number of pets to list")
+    parser.add_argument("--runs", type=int, default=20, help="times to write the listing each way")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f"Seeded {seed_pets(args.pets)} pets")
+        rows = Pet.find_rows(limit=args.pets)
+
+        def encode(provider):
+            return lambda: provider.dumps([Pet.serialize_fields(row, JSON_FIELDS) for row in rows])
+
+        writers = {"default": encode(DefaultJSONProvider(app))}
+        if json_provider.orjson is not None:
+            writers["orjson"] = encode(OrjsonProvider(app))
+        writers["text"] = lambda: Pet.rows_to_json(rows)
+
+        print(f"{'writer':<10}{'median (ms)':>14}{'pets/s':>14}")
+        for name, write in writers.items():
+            seconds = statistics.median(timed(write)[1] for _ in range(args.runs))
+            print(f"{name:<10}{seconds * 1000:>14.1f}{len(rows) / seconds:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
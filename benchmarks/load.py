@@ -0,0 +1,313 @@
+"""
+Load Benchmark
+
+Seeds the database with fake Pets, starts the service under gunicorn and
+drives each route of the API in turn with concurrent clients. For every
+route it reports the throughput and the p50/p95/p99 latency of the
+successful requests, counts the 4xx and 5xx responses apart, and writes
+them with the commit and settings to a JSON file.
+
+The seeded Pets are only read. The write scenarios change Pets of the
+loadtest category that the benchmark creates as it runs, and deletes at
+the start and end of each run, so every run measures the same requests.
+
+Given the JSON file of an earlier run with --baseline, it also prints the
+change of each route and exits with status 1 when a route got slower or
+served fewer requests per second by more than --threshold percent.
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python -m benchmarks.load --pets 10000 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import platform
+import subprocess
+import http.client
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, quote
+from concurrent.futures import ThreadPoolExecutor
+import factory.random
+from service import create_app
+from service.models import Pet, db
+from tests.factories import PetFactory
+from benchmarks.common import seed_pets
+from benchmarks.concurrency import start_gunicorn, percentiles
+
+# Category of the Pets written by the benchmark, which it deletes at the end
+CATEGORY = "loadtest"
+
+NDJSON = {"Accept": "application/x-ndjson"}
+
+
+def pet_json(category: str = CATEGORY) -> str:
+    """Returns the JSON of a new fake Pet"""
+    data = PetFactory().serialize()
+    del data["id"]
+    data["category"] = category
+    return json.dumps(data)
+
+
+def seed(app, count: int) -> tuple:
+    """Seeds the database and returns the (ids, names) of its Pets
+
+    The Pets left behind by an earlier run are deleted first.
+    """
+    with app.app_context():
+        Pet.delete_where(category=CATEGORY)
+        print(f"Seeded {seed_pets(count)} pets")
+        rows = db.session.execute(db.select(Pet.id, Pet.name)).all()
+    return [row.id for row in rows], [row.name for row in rows]
+
+
+class PetPool:  # pylint: disable=too-few-public-methods
+    """Available Pets of the load test category for the write scenarios
+
+    Each Pet is handed out once, so that every purchase or delete finds
+    a Pet it can act on. The pool is refilled in batches that are
+    inserted directly, outside of the timed requests.
+    """
+
+    def __init__(self, app, batch_size: int = 500):
+        self.app = app
+        self.batch_size = batch_size
+        self._ids = []
+        self._lock = threading.Lock()
+
+    def take(self) -> int:
+        """Returns the id of a Pet that no request has changed yet"""
+        with self._lock:
+            if not self._ids:
+                with self.app.app_context():
+                    pets = [PetFactory(category=CATEGORY, available=True) for _ in range(self.batch_size)]
+                    self._ids = Pet.bulk_create(pets)
+            return self._ids.pop()
+
+
+def scenarios(ids: list, names: list, pool: PetPool) -> dict:
+    """Returns the requests of each scenario
+
+    Each scenario is a function that returns the (method, path, body,
+    headers) of its next request. The reads use the seeded Pets and the
+    writes use Pets from the pool. They run in this order, so the ones
+    that delete Pets come last.
+    """
+    json_headers = {"Content-Type": "application/json"}
+    updated_ids = [pool.take() for _ in range(100)]
+    return {
+        "index": lambda: ("GET", "/", None, {}),
+        "live": lambda: ("GET", "/live", None, {}),
+        "ready": lambda: ("GET", "/ready", None, {}),
+        "metrics": lambda: ("GET", "/metrics", None, {}),
+        "pool_stats": lambda: ("GET", "/pool/stats", None, {}),
+        "cache_stats": lambda: ("GET", "/cache/stats", None, {}),
+        "get_pet": lambda: ("GET", f"/pets/{random.choice(ids)}", None, {}),
+        "list_pets": lambda: ("GET", "/pets?limit=100", None, {}),
+        "list_pets_filtered": lambda: ("GET", "/pets?category=dog&available=true&sort=-birthday&limit=100", None, {}),
+        "list_pets_count": lambda: ("GET", "/pets?category=cat&limit=20&count=true", None, {}),
+        "stream_pets": lambda: ("GET", "/pets?limit=1000", None, NDJSON),
+        "search_pets": lambda: ("GET", f"/pets?q={quote(random.choice(names)[:3])}&limit=20", None, {}),
+        "pet_stats": lambda: ("GET", "/pets/stats", None, {}),
+        "create_pet": lambda: ("POST", "/pets", pet_json(), json_headers),
+        "bulk_create_pets": lambda: ("POST", "/pets/bulk", f"[{','.join(pet_json() for _ in range(10))}]", json_headers),
+        "update_pet": lambda: ("PUT", f"/pets/{random.choice(updated_ids)}", pet_json(), json_headers),
+        "purchase_pet": lambda: ("PUT", f"/pets/{pool.take()}/purchase", None, {}),
+        # a few Pets at a time, concurrent updates of the same rows would deadlock
+        "bulk_update_pets": lambda: (
+            "PATCH", f"/pets?category={CATEGORY}&name={quote(random.choice(names))}", '{"available": true}', json_headers
+        ),
+        "delete_pet": lambda: ("DELETE", f"/pets/{pool.take()}", None, {}),
+        "bulk_delete_pets": lambda: ("DELETE", f"/pets?category={CATEGORY}", None, {}),
+    }
+
+
+######################################################################
+#  L O A D
+######################################################################
+def run_client(base_url: str, requests, deadline: float) -> list:
+    """Sends requests over one keep-alive connection until the deadline
+
+    A request whose connection was closed by the server, e.g. when a
+    worker is recycled, is sent again once on a new connection.
+
+    :return: a list of (status, seconds), with status 0 for requests that
+        failed without a response
+    """
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+    results = []
+    while time.monotonic() < deadline:
+        method, path, body, headers = requests()
+        start = time.perf_counter()
+        for attempt in range(2):
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                results.append((response.status, time.perf_counter() - start))
+                break
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if attempt:
+                    results.append((0, time.perf_counter() - start))
+    conn.close()
+    return results
+
+
+def run_scenario(base_url: str, requests, concurrency: int, duration: float, warmup: float) -> dict:
+    """Runs one scenario with concurrent clients and summarizes the results"""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if warmup:
+            deadline = time.monotonic() + warmup
+            list(executor.map(lambda _: run_client(base_url, requests, deadline), range(concurrency)))
+        deadline = time.monotonic() + duration
+        futures = [executor.submit(run_client, base_url, requests, deadline) for _ in range(concurrency)]
+        results = [result for future in futures for result in future.result()]
+    return summarize(results, duration)
+
+
+def summarize(results: list, duration: float) -> dict:
+    """Returns the throughput and latencies of the successful requests
+
+    Responses below 400 count as successes. 4xx responses are counted as
+    client errors, and 5xx or no response at all as errors.
+    """
+    seconds = [elapsed for response_status, elapsed in results if 0 < response_status < 400]
+    client_errors = sum(1 for response_status, _ in results if 400 <= response_status < 500)
+    statuses = {}
+    for response_status, _ in results:
+        statuses[str(response_status)] = statuses.get(str(response_status), 0) + 1
+    p50, p95, p99 = percentiles(seconds)
+    return {
+        "requests": len(results),
+        "client_errors": client_errors,
+        "errors": len(results) - len(seconds) - client_errors,
+        "throughput": round(len(seconds) / duration, 1),
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "max_ms": round(max(seconds, default=0) * 1000, 2),
+        "statuses": statuses,
+    }
+
+
+######################################################################
+#  R E P O R T
+######################################################################
+def git_commit() -> str:
+    """Returns the commit of the working tree, marked when it has changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Prints the change of each route since the baseline
+
+    :return: the names of the routes that regressed by more than threshold
+        percent in throughput or p95 latency
+    """
+    regressions = []
+    print(f"\nCompared with {baseline['meta']['commit']}:")
+    print(f"{'route':<20}{'req/s':>10}{'p95':>10}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if not before or not before["throughput"] or not before["p95_ms"]:
+            continue
+        throughput = (result["throughput"] / before["throughput"] - 1) * 100
+        p95 = (result["p95_ms"] / before["p95_ms"] - 1) * 100
+        regressed = throughput < -threshold or p95 > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<20}{throughput:>+9.1f}%{p95:>+9.1f}%  {'REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def write_report(args, results: dict) -> None:
+    """Writes the results with the commit and settings to a JSON file"""
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmarks", "results", f"load-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+
+def main():
+    """Seeds the database, runs every scenario and writes the report"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pets", type=int, default=10_000, help="number of pets to seed")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load for each route")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds of load before each route is measured")
+    parser.add_argument("--scenarios", help="comma separated routes to run, all of them by default")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="threads of each gunicorn worker")
+    parser.add_argument("--port", type=int, default=8089, help="port for gunicorn")
+    parser.add_argument("--url", help="URL of a running service to use instead of starting gunicorn")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the random pets and requests")
+    parser.add_argument("--output", help="JSON file for the results, benchmarks/results/load-<commit>.json by default")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=10, help="percent change that counts as a regression")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    factory.random.reseed_random(args.seed)
+    app = create_app()
+    requests = scenarios(*seed(app, args.pets), PetPool(app))
+    selected = args.scenarios.split(",") if args.scenarios else list(requests)
+    unknown = set(selected) - set(requests)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    server = None if args.url else start_gunicorn(args.port, "gthread", args.workers, args.threads)
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    results = {}
+    print(f"{'route':<20}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'4xx':>8}{'errors':>8}  (ms)")
+    try:
+        for name in selected:
+            results[name] = run_scenario(base_url, requests[name], args.concurrency, args.duration, args.warmup)
+            result = results[name]
+            print(
+                f"{name:<20}{result['throughput']:>9.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                f"{result['p99_ms']:>9.1f}{result['client_errors']:>8}{result['errors']:>8}"
+            )
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        with app.app_context():
+            Pet.delete_where(category=CATEGORY)
+
+    write_report(args, results)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Query Plan Benchmark
+
+Shows the Postgres query plan and execution time of each Pet query path
+with and without the indexes added by schema migration 2.
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python -m benchmarks.query_plans --pets 200000
+
+The indexes are dropped inside a transaction that is rolled back, so the
+database is left as it was apart from the seeded pets.
+"""
+import argparse
+from service import create_app
+from service.models import Pet, Gender, db
+from benchmarks.common import seed_pets
+
+PAGE = 101  # the default page size plus the look-ahead row
+
+QUERIES = {
+    "find_by_name": lambda: Pet.find_by_name("Fido", limit=PAGE),
+    "find_by_category": lambda: Pet.find_by_category("fish", limit=PAGE),
+    "find_by_availability": lambda: Pet.find_by_availability(True, limit=PAGE),
+    "find_by_gender": lambda: Pet.find_by_gender(Gender.UNKNOWN, limit=PAGE),
+    "category_and_available": lambda: Pet.find_by_attributes(category="fish", available=True, limit=PAGE),
+    "sort_by_birthday": lambda: Pet.find_by_attributes(sort="birthday", limit=PAGE),
+}
+
+
+def explain(conn, query) -> tuple:
+    """Returns the (plan, execution ms) of a query"""
+    sql = query.statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    plan = [row[0] for row in conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")]
+    execution = next(line for line in plan if line.startswith("Execution Time"))
+    return plan, float(execution.split(":")[1].split()[0])
+
+
+def run_queries(conn, verbose: bool) -> dict:
+    """Explains every query and returns their execution times"""
+    timings = {}
+    for name, make_query in QUERIES.items():
+        plan, timings[name] = explain(conn, make_query())
+        if verbose:
+            print(f"--- {name} ---")
+            print("\n".join(plan))
+    return timings
+
+
+def main():
+    """Seeds the database and compares the query plans"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pets", type=int, default=100_000, help="number of pets to seed")
+    parser.add_argument("--verbose", action="store_true", help="print the full query plans")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            raise SystemExit("The query plan benchmark needs a PostgreSQL DATABASE_URI")
+        print(f"Seeded {seed_pets(args.pets)} pets")
+
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("ANALYZE pet")
+            conn.commit()
+            after = run_queries(conn, args.verbose)
+            for index in Pet.__table__.indexes:
+                conn.exec_driver_sql(f"DROP INDEX {index.name}")
+            before = run_queries(conn, args.verbose)
+            conn.rollback()
+
+    print(f"{'query':<25}{'no indexes (ms)':>18}{'indexes (ms)':>15}")
+    for name in QUERIES:
+        print(f"{name:<25}{before[name]:>18.3f}{after[name]:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Read Path Benchmark
+
+Compares the ORM and the SQLAlchemy Core read paths on the same listing
+queries. For each query it reports the median time to fetch the rows and
+to serialize them, and the memory allocated while doing so:
+
+- orm: Pet.find_by_attributes() loading Pets, then Pet.serialize()
+- core: Pet.find_rows() loading plain rows, then Pet.rows_to_json()
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python -m benchmarks.read_path --pets 10000
+"""
+import json
+import argparse
+import statistics
+import tracemalloc
+from service import create_app
+from service.models import Pet, db
+from benchmarks.common import seed_pets, timed
+
+
+def orm_listing(**query) -> str:
+    """Lists Pets through the ORM the way GET /pets used to"""
+    pets = Pet.find_by_attributes(**query).all()
+    return json.dumps([pet.serialize() for pet in pets], sort_keys=True, separators=(",", ":"))
+
+
+def core_listing(**query) -> str:
+    """Lists Pets through the Core read path"""
+    return Pet.rows_to_json(Pet.find_rows(**query))
+
+
+def measure(listing, runs: int, **query) -> tuple:
+    """Returns the (median ms, peak KiB allocated) of a listing"""
+    times = []
+    for _ in range(runs):
+        times.append(timed(listing, **query)[1])
+        # start every run with an empty identity map, like a new request
+        db.session.remove()
+    tracemalloc.start()
+    listing(**query)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    return statistics.median(times) * 1000, peak / 1024
+
+
+def main():
+    """Seeds the database and compares the read paths"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pets", type=int, default=10_000, help="number of pets to seed")
+    parser.add_argument("--runs", type=int, default=20, help="times to run each listing")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f"Seeded {seed_pets(args.pets)} pets")
+        queries = {
+            "all": {"limit": args.pets},
+            "page of 100": {"limit": 100},
+            "sorted by birthday": {"limit": args.pets, "sort": "birthday"},
+            "available dogs": {"limit": args.pets, "category": "dog", "available": True},
+        }
+        assert orm_listing(limit=100) == core_listing(limit=100), "the read paths disagree"
+
+        print(f"{'query':<20}{'orm (ms)':>10}{'core (ms)':>11}{'speedup':>9}{'orm (KiB)':>11}{'core (KiB)':>12}")
+        for name, query in queries.items():
+            orm_ms, orm_kib = measure(orm_listing, args.runs, **query)
+            core_ms, core_kib = measure(core_listing, args.runs, **query)
+            print(
+                f"{name:<20}{orm_ms:>10.1f}{core_ms:>11.1f}{orm_ms / core_ms:>8.1f}x"
+                f"{orm_kib:>11,.0f}{core_kib:>12,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Startup Benchmark
+
+Compares the boot time of a worker with DB_MIGRATE_ON_STARTUP on and off.
+Each boot runs in a fresh interpreter, like a newly spawned gunicorn
+worker, and reports how long create_app() took and how many statements
+it sent to the database.
+
+Usage:
+    DATABASE_URI=postgresql+psycopg://... python -m benchmarks.startup --runs 10
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Runs in the child interpreter: counts statements and times create_app()
+BOOT_SCRIPT = """
+import json, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+from service import create_app
+start = time.perf_counter()
+create_app()
+print(json.dumps({"seconds": time.perf_counter() - start, "statements": len(statements)}))
+"""
+
+
+def boot(migrate: bool) -> dict:
+    """Boots the service once in a new interpreter"""
+    env = dict(os.environ, DB_MIGRATE_ON_STARTUP=str(migrate).lower())
+    output = subprocess.run(
+        [sys.executable, "-c", BOOT_SCRIPT], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    """Compares worker boots with the migrations on and off"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="boots to time in each mode")
+    args = parser.parse_args()
+
+    # the first boot may have to migrate the schema, which would skew the timings
+    boot(migrate=True)
+    for migrate in (True, False):
+        results = [boot(migrate) for _ in range(args.runs)]
+        seconds = [result["seconds"] * 1000 for result in results]
+        print(
+            f"DB_MIGRATE_ON_STARTUP={str(migrate).lower():5}  "
+            f"median {statistics.median(seconds):7.1f} ms  "
+            f"max {max(seconds):7.1f} ms  "
+            f"statements {results[0]['statements']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,6 @@ from behave import given  # pylint: disable=no-name-in-module
 # HTTP Return Codes
 HTTP_200_OK = 200
 HTTP_201_CREATED = 201
-HTTP_204_NO_CONTENT = 204
 
 WAIT_TIMEOUT = 60
 
@@ -38,23 +37,21 @@ WAIT_TIMEOUT = 60
 def step_impl(context):
     """ Delete all Pets and load new ones """
 
-    # Get a list all of the pets
+    # Delete all of the pets in a single request
     rest_endpoint = f"{context.base_url}/pets"
-    context.resp = requests.get(rest_endpoint, timeout=WAIT_TIMEOUT)
+    context.resp = requests.delete(rest_endpoint, params={"all": "true"}, timeout=WAIT_TIMEOUT)
     expect(context.resp.status_code).equal_to(HTTP_200_OK)
-    # and delete them one by one
-    for pet in context.resp.json():
-        context.resp = requests.delete(f"{rest_endpoint}/{pet['id']}", timeout=WAIT_TIMEOUT)
-        expect(context.resp.status_code).equal_to(HTTP_204_NO_CONTENT)
-
-    # load the database with new pets
-    for row in context.table:
-        payload = {
+
+    # load the database with new pets in a single request
+    payload = [
+        {
             "name": row['name'],
             "category": row['category'],
             "available": row['available'] in ['True', 'true', '1'],
             "gender": row['gender'],
             "birthday": row['birthday']
         }
-        context.resp = requests.post(rest_endpoint, json=payload, timeout=WAIT_TIMEOUT)
-        expect(context.resp.status_code).equal_to(HTTP_201_CREATED)
+        for row in context.table
+    ]
+    context.resp = requests.post(f"{rest_endpoint}/bulk", json=payload, timeout=WAIT_TIMEOUT)
+    expect(context.resp.status_code).equal_to(HTTP_201_CREATED)
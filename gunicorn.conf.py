@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration
+
+Gunicorn reads this file from the working directory. Every setting comes
+from service.common.server, which reads it from the environment, so it
+can be changed without rebuilding the image. Command line options still
+take precedence over these settings.
+"""
+# the server hooks are found by gunicorn by their names in this module
+from service.common.server import (  # noqa: F401 pylint: disable=unused-import
+    settings,
+    on_starting,
+    post_fork,
+    worker_exit,
+    child_exit,
+)
+
+_settings = settings()
+
+bind = _settings["bind"]
+workers = _settings["workers"]
+threads = _settings["threads"]
+worker_class = _settings["worker_class"]
+timeout = _settings["timeout"]
+graceful_timeout = _settings["graceful_timeout"]
+keepalive = _settings["keepalive"]
+max_requests = _settings["max_requests"]
+max_requests_jitter = _settings["max_requests_jitter"]
+preload_app = _settings["preload_app"]
@@ -22,6 +22,13 @@ import sys
 from flask import Flask
 from service import config
 from service.common import log_handlers
+from service.common.json_provider import init_json
+from service.common.cache import cache
+from service.common.pool_metrics import pool_metrics
+from service.common.metrics import metrics
+from service.common.readiness import readiness
+from service.common.replicas import replicas
+from service.common.startup import wait_for_database
 
 
 ############################################################
@@ -32,21 +39,44 @@ def create_app():
     # Create Flask application
     app = Flask(__name__)
     app.config.from_object(config)
+    init_json(app)
 
     # Initialize Plugins
     # pylint: disable=import-outside-toplevel
     from service.models import db
+    pool_metrics.init_app(app)
+    replicas.init_app(app)
     db.init_app(app)
+    cache.init_app(app)
+    metrics.init_app(app)
+    readiness.init_app(app)
 
     with app.app_context():
+        pool_metrics.instrument(db.engine)
+        replicas.instrument(db.engines)
+        for engine in db.engines.values():
+            metrics.instrument(engine)
+
         # Dependencies require we import the routes AFTER the Flask app is created
         # pylint: disable=wrong-import-position, wrong-import-order, unused-import
-        from service import routes, models  # noqa: F401 E402
+        from service import routes, models, migrations  # noqa: F401 E402
         from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
         try:
-            # models.init_db(app)  # make our sqlalchemy tables
-            db.create_all()
+            # the database may still be starting or failing over
+            wait_for_database(
+                db.engine,
+                tries=app.config["RETRY_COUNT"],
+                delay=app.config["RETRY_DELAY"],
+                backoff=app.config["RETRY_BACKOFF"],
+                max_delay=app.config["RETRY_MAX_DELAY"],
+                max_wait=app.config["RETRY_MAX_WAIT"],
+            )
+            if app.config["DB_MIGRATE_ON_STARTUP"]:
+                # bring the database schema up to the latest version
+                migrations.upgrade(db.engine)
+            else:
+                app.logger.info("Skipping schema migrations, they are run by: flask db-migrate")
         except Exception as error:  # pylint: disable=broad-except
             app.logger.critical("%s: Cannot continue", error)
             # gunicorn requires exit code 4 to stop spawning workers when they die
@@ -0,0 +1,242 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Read-Through Cache
+
+This module contains a read-through cache with LRU, Redis and null backends
+"""
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("flask.app")
+
+
+######################################################################
+#  C A C H E   B A C K E N D S
+######################################################################
+class CacheBackend:
+    """Interface that every cache backend implements"""
+
+    def get(self, key: str):
+        """Returns the value stored under key, or None if there is none"""
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float) -> None:
+        """Stores a value under key for ttl seconds"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Removes the value stored under key"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Removes every value"""
+        raise NotImplementedError
+
+    def size(self):
+        """Returns the number of values stored, or None if unknown"""
+        return None
+
+
+class LRUCache(CacheBackend):
+    """In-process least recently used cache with a time to live
+
+    It is thread safe, but each worker process has its own copy, so a write
+    handled by one worker only invalidates that worker's copy. Keep the ttl
+    short or use the RedisCache when running several workers.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._items = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def size(self):
+        return len(self._items)
+
+
+class RedisCache(CacheBackend):
+    """Cache stored in a Redis compatible server and shared by all workers
+
+    Values are stored as JSON under keys that start with the prefix. Any
+    client with the get, set, delete and scan_iter methods of redis-py
+    can be passed in, otherwise one is created from the url, which needs
+    the optional redis package to be installed.
+    """
+
+    def __init__(self, url: str = None, client=None, prefix: str = "petshop:"):
+        if client is None:
+            import redis  # pylint: disable=import-outside-toplevel,import-error
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, value, ttl: float) -> None:
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(int(ttl), 1))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class NullCache(CacheBackend):
+    """Backend that stores nothing, so every read goes to the database"""
+
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value, ttl: float) -> None:
+        return None
+
+    def delete(self, key: str) -> None:
+        return None
+
+    def clear(self) -> None:
+        return None
+
+
+######################################################################
+#  R E A D - T H R O U G H   C A C H E
+######################################################################
+class Cache:
+    """Read-through cache that counts its hits and misses"""
+
+    def __init__(self, backend: CacheBackend = None, ttl: float = 30):
+        self.backend = backend or LRUCache()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fill_lock = threading.Lock()
+        self._loads = {}  # key -> an Event for each load in progress, set when it is stale
+
+    def init_app(self, app) -> None:
+        """Creates the backend from the application configuration"""
+        backend = app.config.get("CACHE_BACKEND", "lru").lower()
+        if backend == "redis":
+            self.backend = RedisCache(app.config["CACHE_REDIS_URL"])
+        elif backend == "none":
+            self.backend = NullCache()
+        else:
+            self.backend = LRUCache(app.config.get("CACHE_MAX_SIZE", 10000))
+        self.ttl = app.config.get("CACHE_TTL", 30)
+        self.reset_stats()
+        logger.info("Cache initialized with the %s backend", type(self.backend).__name__)
+
+    def get_or_load(self, key: str, loader):
+        """Returns the cached value for key, calling loader on a miss
+
+        Values of None are not cached so that a missing record is not
+        remembered after it is created. A value whose key is invalidated
+        while it loads is returned but not cached, because it may be older
+        than the change that invalidated it.
+        """
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not None:
+            return value
+        load = threading.Event()
+        with self._fill_lock:
+            self._loads.setdefault(key, []).append(load)
+        try:
+            value = loader()
+        finally:
+            with self._fill_lock:
+                loads = self._loads[key]
+                loads.remove(load)
+                if not loads:
+                    del self._loads[key]
+                if value is not None and not load.is_set():
+                    self.backend.set(key, value, self.ttl)
+        return value
+
+    def delete(self, key: str) -> None:
+        """Invalidates the value stored under key"""
+        with self._fill_lock:
+            for load in self._loads.get(key, []):
+                load.set()
+            self.backend.delete(key)
+
+    def clear(self) -> None:
+        """Invalidates every value"""
+        with self._fill_lock:
+            for loads in self._loads.values():
+                for load in loads:
+                    load.set()
+            self.backend.clear()
+
+    def reset_stats(self) -> None:
+        """Sets the hit and miss counters back to zero"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters of this process"""
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": self.backend.size(),
+        }
+
+
+# The cache used by the models
+cache = Cache()
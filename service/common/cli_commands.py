@@ -1,8 +1,10 @@
 """
 Flask CLI Command Extensions
 """
+import click
 from flask import current_app as app  # Import Flask application
-from service.models import db
+from service.models import db, PetSummary
+from service import migrations
 
 
 ######################################################################
@@ -17,5 +19,37 @@ def db_create():
     production. ;-)
     """
     db.drop_all()
-    db.create_all()
+    migrations.reset(db.engine)
+    migrations.upgrade(db.engine)
     db.session.commit()
+
+
+######################################################################
+# Command to upgrade the database schema
+# Usage:
+#   flask db-migrate [--target VERSION]
+######################################################################
+@app.cli.command("db-migrate")
+@click.option("--target", type=int, default=None, help="Schema version to upgrade to, defaults to the latest")
+def db_migrate(target):
+    """
+    Upgrades the database schema by running the pending migrations. Run
+    it once before starting the service with DB_MIGRATE_ON_STARTUP=false
+    """
+    version = migrations.upgrade(db.engine, target=target)
+    click.echo(f"Database schema is at version {version}")
+
+
+######################################################################
+# Command to refresh the pet summary used by /pets/stats
+# Usage:
+#   flask refresh-stats
+######################################################################
+@app.cli.command("refresh-stats")
+def refresh_stats():
+    """
+    Recounts the pets into the summary that /pets/stats reads when
+    STATS_SUMMARY is true. Run it periodically, e.g. from a CronJob
+    """
+    groups = PetSummary.refresh()
+    click.echo(f"Pet summary refreshed with {groups} groups")
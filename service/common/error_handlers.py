@@ -16,7 +16,7 @@ Module: error_handlers
 """
 from flask import jsonify
 from flask import current_app as app  # Import Flask application
-from service.models import DataValidationError
+from service.models import DataValidationError, DataConflictError
 from . import status
 
 
@@ -29,6 +29,12 @@ def request_validation_error(error):
     return bad_request(error)
 
 
+@app.errorhandler(DataConflictError)
+def request_conflict_error(error):
+    """Handles records that were changed by someone else"""
+    return conflict(error)
+
+
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
@@ -68,6 +74,32 @@ def method_not_supported(error):
     )
 
 
+@app.errorhandler(status.HTTP_409_CONFLICT)
+def conflict(error):
+    """Handles conflicts with the current state with 409_CONFLICT"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(status=status.HTTP_409_CONFLICT, error="Conflict", message=message),
+        status.HTTP_409_CONFLICT,
+    )
+
+
+@app.errorhandler(status.HTTP_412_PRECONDITION_FAILED)
+def precondition_failed(error):
+    """Handles failed If-Match preconditions with 412_PRECONDITION_FAILED"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_412_PRECONDITION_FAILED,
+            error="Precondition Failed",
+            message=message,
+        ),
+        status.HTTP_412_PRECONDITION_FAILED,
+    )
+
+
 @app.errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 def mediatype_not_supported(error):
     """Handles unsupported media requests with 415_UNSUPPORTED_MEDIA_TYPE"""
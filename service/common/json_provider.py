@@ -0,0 +1,87 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+JSON Providers
+
+This module contains the Flask JSON providers of the service. The orjson
+provider is used when the optional orjson package is installed,
+otherwise the service falls back to the standard library json module.
+"""
+import logging
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # pylint: disable=import-error
+except ImportError:  # pragma: no cover
+    orjson = None
+
+logger = logging.getLogger("flask.app")
+
+
+class PetJSONProvider(DefaultJSONProvider):
+    """The default provider of Flask, which uses the json module
+
+    Pet listings do not go through the provider at all, they are written
+    straight to JSON text by Pet.rows_to_json()
+    """
+
+    def is_pretty(self) -> bool:
+        """Tells if responses are indented, as in debug mode"""
+        return (self.compact is None and self._app.debug) or self.compact is False
+
+
+class OrjsonProvider(PetJSONProvider):
+    """Provider that encodes and decodes JSON with orjson
+
+    The output is the same as the default provider's, dates included,
+    except that non-ASCII characters are written as UTF-8 instead of
+    being escaped.
+    """
+
+    def _encode(self, obj, default=None, sort_keys=None, indent=None) -> bytes:
+        # dates go to default() so they are formatted like Flask does
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default or self.default, option=option)
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self._encode(obj, kwargs.get("default"), kwargs.get("sort_keys"), kwargs.get("indent")).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = self._encode(obj, indent=self.is_pretty()) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app) -> None:
+    """Sets the JSON provider of the application from JSON_BACKEND
+
+    JSON_BACKEND is "orjson", "stdlib" or "auto", which uses orjson when
+    it is installed.
+    """
+    backend = app.config.get("JSON_BACKEND", "auto").lower()
+    if backend == "orjson" and orjson is None:
+        logger.warning("JSON_BACKEND is orjson but orjson is not installed, using the json module")
+    use_orjson = backend in ("auto", "orjson") and orjson is not None
+    app.json = OrjsonProvider(app) if use_orjson else PetJSONProvider(app)
+    logger.info("JSON provider: %s", type(app.json).__name__)
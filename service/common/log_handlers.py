@@ -20,17 +20,203 @@ Log Handlers
 This module contains utility functions to set up logging
 consistently
 """
+import os
+import copy
+import json
+import time
+import queue
+import atexit
+import random
 import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+# Attributes of every LogRecord, anything else was passed in extra
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
 
 
 def init_logging(app, logger_name: str):
-    """Set up logging for production"""
+    """Set up logging for production
+
+    The handlers of the logger_name logger, normally gunicorn's, are used
+    with the format, queue, rate limit and sampling from the LOG_*
+    settings of the application.
+    """
     app.logger.propagate = False
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
+    handlers = list(gunicorn_logger.handlers)
     app.logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
-    for handler in app.logger.handlers:
+    if app.config.get("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT, DATE_FORMAT)
+    for handler in handlers:
         handler.setFormatter(formatter)
+
+    log_queue.stop()
+    if app.config.get("LOG_QUEUE", False):
+        handlers = [log_queue.start(handlers)]
+    app.logger.handlers = handlers
+
+    # init_logging() runs once per application, so replace earlier filters
+    for logger in [app.logger] + [logging.getLogger(name) for name in logging.root.manager.loggerDict]:
+        for log_filter in list(logger.filters):
+            if isinstance(log_filter, (RateLimitFilter, SamplingFilter)):
+                logger.removeFilter(log_filter)
+    if app.config.get("LOG_RATE_LIMIT"):
+        app.logger.addFilter(RateLimitFilter(app.config["LOG_RATE_LIMIT"]))
+    for name, rate in parse_sample_rates(app.config.get("LOG_SAMPLE_RATES", "")).items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
     app.logger.info("Logging handler established")
+
+
+######################################################################
+#  F O R M A T T I N G
+######################################################################
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line
+
+    The fields passed to a logging call with extra={...} are added to the
+    object, so they can be searched without parsing the message.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+######################################################################
+#  Q U E U E
+######################################################################
+class LogQueueHandler(QueueHandler):
+    """Puts records on the queue without formatting them
+
+    Only the message is merged with its arguments, because they may change
+    after the logging call returns. Everything else, including exception
+    tracebacks, is formatted by the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LogQueue:
+    """The queue of log records of this process and its listener thread"""
+
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+
+    def start(self, handlers: list) -> QueueHandler:
+        """Starts a thread that writes the queued records to the handlers
+
+        :return: the handler that puts records on the queue
+        """
+        records = queue.SimpleQueue()
+        self.handler = LogQueueHandler(records)
+        self.listener = QueueListener(records, *handlers, respect_handler_level=True)
+        self.listener.start()
+        return self.handler
+
+    def stop(self) -> None:
+        """Writes the records left on the queue and stops the thread"""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+    def restart_after_fork(self) -> None:
+        """Gives a forked process its own queue and listener thread
+
+        Threads do not survive a fork, so a gunicorn worker forked from a
+        preloaded master would otherwise never write its records.
+        """
+        if self.listener:
+            records = queue.SimpleQueue()
+            self.handler.queue = records
+            self.listener = QueueListener(records, *self.listener.handlers, respect_handler_level=True)
+            self.listener.start()
+
+
+# The log queue of this process
+log_queue = LogQueue()
+os.register_at_fork(after_in_child=log_queue.restart_after_fork)
+atexit.register(log_queue.stop)
+
+
+######################################################################
+#  R A T E   L I M I T I N G   A N D   S A M P L I N G
+######################################################################
+class RateLimitFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """Lets each logging call site write at most rate records per second
+
+    Records of level ERROR and above are never dropped. The first record
+    let through after some were dropped says how many were.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._lock = threading.Lock()
+        self._buckets = {}  # call site -> [tokens, last refill, dropped]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        now = time.monotonic()
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            bucket = self._buckets.setdefault(key, [self.burst, now, 0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            dropped, bucket[2] = bucket[2], 0
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+            record.suppressed = dropped
+        return True
+
+
+class SamplingFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """Keeps a random fraction of the records below WARNING of a logger"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def parse_sample_rates(text: str) -> dict:
+    """Parses "logger=rate,logger=rate" into a dictionary of rates"""
+    rates = {}
+    for item in text.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
@@ -0,0 +1,252 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Service Metrics
+
+This module collects request and database query metrics in the
+Prometheus text format, summed across workers when METRICS_MULTIPROC_DIR
+is set
+"""
+import os
+import json
+import glob
+import time
+import logging
+import threading
+from flask import request, g
+from sqlalchemy import event
+
+logger = logging.getLogger("flask.app")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the histogram buckets in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# name: (type, help text, buckets)
+METRICS = {
+    "http_requests_total": ("counter", "Number of HTTP requests handled", None),
+    "http_request_duration_seconds": ("histogram", "Time spent handling HTTP requests", REQUEST_BUCKETS),
+    "http_requests_in_flight": ("gauge", "Number of HTTP requests being handled", None),
+    "db_query_duration_seconds": ("histogram", "Time spent executing database statements", QUERY_BUCKETS),
+}
+
+
+def format_labels(**labels) -> str:
+    """Returns the labels in the exposition format, sorted by name"""
+    return ",".join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+
+
+######################################################################
+#  M E T R I C S
+######################################################################
+class Metrics:
+    """Request and database metrics of one worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.directory = None
+        self.flush_interval = 5.0
+        self._flushed_at = 0.0
+        self.samples = {}
+        self.reset()
+
+    def init_app(self, app) -> None:
+        """Adds the request hooks to the application"""
+        self.set_directory(app.config.get("METRICS_MULTIPROC_DIR"))
+        self.flush_interval = app.config.get("METRICS_FLUSH_INTERVAL", 5.0)
+        app.before_request(self._before_request)
+        app.after_request(self.record_status)
+        app.teardown_request(self._teardown_request)
+        self.reset()
+
+    def instrument(self, engine) -> None:
+        """Times every statement that the engine executes"""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def reset(self) -> None:
+        """Sets every metric of this process back to zero"""
+        with self._lock:
+            # name -> labels -> value, or {"buckets", "sum", "count"} for histograms
+            self.samples = {name: {} for name in METRICS}
+
+    ##################################################
+    # Recording
+    ##################################################
+
+    def inc(self, name: str, labels: str, amount: float = 1) -> None:
+        """Adds an amount to a counter or gauge"""
+        with self._lock:
+            series = self.samples[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, labels: str, value: float) -> None:
+        """Records a value in a histogram"""
+        bounds = METRICS[name][2]
+        with self._lock:
+            series = self.samples[name].setdefault(labels, {"buckets": [0] * len(bounds), "sum": 0.0, "count": 0})
+            for position, bound in enumerate(bounds):
+                if value <= bound:
+                    series["buckets"][position] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def _before_request(self) -> None:
+        g.metrics_start = time.perf_counter()
+        self.inc("http_requests_in_flight", "")
+
+    def _teardown_request(self, error=None) -> None:  # pylint: disable=unused-argument
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        # use the route pattern, not the path, to keep the number of series small
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        response_status = g.pop("metrics_status", 500)
+        self.inc("http_requests_in_flight", "", -1)
+        self.inc("http_requests_total", format_labels(method=request.method, route=route, status=response_status))
+        self.observe("http_request_duration_seconds", format_labels(method=request.method, route=route), duration)
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def record_status(self, response):
+        """Remembers the status of the response for the request counter"""
+        g.metrics_status = response.status_code
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, *_) -> None:  # pylint: disable=unused-argument
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, *_) -> None:  # pylint: disable=unused-argument
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        self.observe("db_query_duration_seconds", format_labels(operation=operation), duration)
+
+    ##################################################
+    # Multiprocess aggregation
+    ##################################################
+
+    def set_directory(self, directory: str) -> None:
+        """Sets the directory shared by the worker processes, None for none"""
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def clear_directory(self) -> None:
+        """Removes the files of earlier runs, before any worker starts"""
+        for path in glob.glob(os.path.join(self.directory, "metrics_*.json*")):
+            os.remove(path)
+
+    def _path(self, pid) -> str:
+        return os.path.join(self.directory, f"metrics_{pid}.json")
+
+    @staticmethod
+    def _write(path: str, data: str) -> None:
+        # write a new file and rename it so that readers never see half a file
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+
+    def flush(self) -> None:
+        """Writes the metrics of this process to its file"""
+        pid = os.getpid()
+        with self._lock:
+            data = json.dumps({"pid": pid, "samples": self.samples})
+            self._flushed_at = time.monotonic()
+        self._write(self._path(pid), data)
+
+    def mark_process_dead(self, pid: int) -> None:
+        """Moves the counters of a worker that has exited to the archive
+
+        The gauges of the worker are dropped. Its counters and histograms
+        are added to a single archive file and its own file is removed, so
+        workers recycled by max_requests do not pile up files to read.
+        """
+        path = self._path(pid)
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as file:
+            samples = json.load(file)["samples"]
+        archive_path = self._path("archive")
+        archive = {name: {} for name in METRICS}
+        if os.path.exists(archive_path):
+            with open(archive_path, encoding="utf-8") as file:
+                archive.update(json.load(file)["samples"])
+        for name, (kind, _, _) in METRICS.items():
+            if kind != "gauge":
+                merge(archive[name], samples.get(name, {}))
+        self._write(archive_path, json.dumps({"pid": None, "samples": archive}))
+        os.remove(path)
+
+    def collect(self) -> dict:
+        """Returns the metrics of every process added together"""
+        if not self.directory:
+            with self._lock:
+                return json.loads(json.dumps(self.samples))
+        self.flush()
+        totals = {name: {} for name in METRICS}
+        for path in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    samples = json.load(file)["samples"]
+            except (OSError, ValueError, KeyError) as error:
+                logger.warning("Skipping metrics file %s: %s", path, error)
+                continue
+            for name, series in samples.items():
+                if name in totals:
+                    merge(totals[name], series)
+        return totals
+
+    def render(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format"""
+        samples = self.collect()
+        lines = []
+        for name, (kind, help_text, bounds) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(samples[name].items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+                    continue
+                prefix = f"{labels}," if labels else ""
+                for bound, count in zip(bounds, value["buckets"]):
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {value["count"]}')
+                lines.append(f"{name}_sum{{{labels}}} {value['sum']}")
+                lines.append(f"{name}_count{{{labels}}} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def merge(totals: dict, series: dict) -> None:
+    """Adds the series of one process to the totals"""
+    for labels, value in series.items():
+        if isinstance(value, dict):
+            total = totals.setdefault(labels, {"buckets": [0] * len(value["buckets"]), "sum": 0.0, "count": 0})
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], value["buckets"])]
+            total["sum"] += value["sum"]
+            total["count"] += value["count"]
+        else:
+            totals[labels] = totals.get(labels, 0) + value
+
+
+# The metrics of this process
+metrics = Metrics()
@@ -0,0 +1,143 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Connection Pool Metrics
+
+This module counts connection pool checkouts and the time spent waiting
+for a connection
+"""
+import time
+import logging
+import threading
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger("flask.app")
+
+# Engine options that only apply to a QueuePool
+QUEUE_POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout")
+
+COUNTERS = ("connects", "checkouts", "checkins", "invalidations", "waits", "timeouts")
+
+
+class PoolMetrics:
+    """Counters for the connection pool of one worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.engine = None
+        self.counters = {}
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.reset()
+
+    def init_app(self, app) -> None:
+        """Adds the metered pool to the engine options of the application
+
+        Must be called before the engine is created
+        """
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+        if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+            # SQLite uses its own pool classes that do not take these options
+            for option in QUEUE_POOL_OPTIONS:
+                options.pop(option, None)
+        else:
+            options.setdefault("poolclass", MeteredQueuePool)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+        self.reset()
+
+    def instrument(self, engine) -> None:
+        """Listens to the connection events of the engine's pool"""
+        self.engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def reset(self) -> None:
+        """Sets all of the counters back to zero"""
+        with self._lock:
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        """Records the time spent waiting for a connection"""
+        with self._lock:
+            self.counters["waits"] += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            if timed_out:
+                self.counters["timeouts"] += 1
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _on_connect(self, *_) -> None:
+        self._count("connects")
+
+    def _on_checkout(self, *_) -> None:
+        self._count("checkouts")
+
+    def _on_checkin(self, *_) -> None:
+        self._count("checkins")
+
+    def _on_invalidate(self, *_) -> None:
+        self._count("invalidations")
+
+    def stats(self) -> dict:
+        """Returns the pool state and the counters of this process"""
+        # the engine replaces its pool when it is disposed
+        pool = self.engine.pool if self.engine else None
+        with self._lock:
+            stats = {"pool": type(pool).__name__ if pool else None, **self.counters}
+            waits = self.counters["waits"]
+            stats.update(
+                wait_seconds_total=round(self.wait_seconds, 6),
+                wait_seconds_max=round(self.max_wait_seconds, 6),
+                wait_seconds_avg=round(self.wait_seconds / waits, 6) if waits else 0.0,
+            )
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                max_overflow=pool._max_overflow,  # pylint: disable=protected-access
+            )
+        return stats
+
+
+# The metrics of the connection pool used by the models
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            pool_metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            logger.warning("Timed out waiting for a database connection")
+            raise
+        pool_metrics.record_wait(time.perf_counter() - start)
+        return connection
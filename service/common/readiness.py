@@ -0,0 +1,89 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Readiness Check
+
+This module checks that the database answers and that the connection
+pool has a free connection
+"""
+import time
+import logging
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger("flask.app")
+
+
+class ReadinessCheck:
+    """Cached check of the database and the connection pool"""
+
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked_at = 0.0
+
+    def init_app(self, app) -> None:
+        """Reads the time the result is remembered from the configuration"""
+        self.ttl = app.config.get("READY_CACHE_SECONDS", 5.0)
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the last result so that the next check runs again"""
+        with self._lock:
+            self._result = None
+            self._checked_at = 0.0
+
+    def check(self, engine) -> tuple:
+        """Returns (ready, checks) for the engine, cached for ttl seconds
+
+        Only one thread runs the check at a time, the others wait for it and
+        use its result.
+        """
+        with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at >= self.ttl:
+                self._result = self._run(engine)
+                self._checked_at = time.monotonic()
+            return self._result
+
+    @staticmethod
+    def _run(engine) -> tuple:
+        checks = {}
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)  # pylint: disable=protected-access
+            checks["pool"] = {"capacity": capacity, "in_use": pool.checkedout()}
+            if pool._max_overflow >= 0 and pool.checkedout() >= capacity:  # pylint: disable=protected-access
+                # asking for a connection now would wait for the pool timeout
+                logger.warning("Not ready: all %d database connections are in use", capacity)
+                checks["database"] = "skipped"
+                return False, checks
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            checks["database"] = "ok"
+        except SQLAlchemyError as error:
+            logger.error("Not ready: the database check failed: %s", error)
+            checks["database"] = "unavailable"
+            return False, checks
+        return True, checks
+
+
+# The readiness check of this worker
+readiness = ReadinessCheck()
@@ -0,0 +1,253 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Read Replicas
+
+This module sends the reads of GET and HEAD requests to read replicas
+and everything else to the primary database
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError, InterfaceError
+
+logger = logging.getLogger("flask.app")
+
+# Methods whose requests only read, and can be answered from a replica
+READ_METHODS = ("GET", "HEAD")
+
+# Cookie with the time of the last write of a client
+WRITE_COOKIE = "pets_last_write"
+
+# Errors that mean that a replica cannot be reached
+CONNECTION_ERRORS = (OperationalError, InterfaceError)
+
+
+def bind_key(number: int) -> str:
+    """Returns the Flask-SQLAlchemy bind key of a replica"""
+    return f"replica_{number}"
+
+
+######################################################################
+#  R E P L I C A   R O U T E R
+######################################################################
+class ReplicaRouter:
+    """Chooses the database of each request among the primary and replicas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.keys = []
+        self.read_your_writes = 5.0
+        self.retry = 30.0
+        self._turn = 0
+        self._down_until = {}
+
+    def init_app(self, app) -> None:
+        """Adds a bind for each of the DATABASE_REPLICA_URIS
+
+        Also adds the hooks that start each request without a replica and
+        remember the writes of each client. Must be called before the
+        engines are created.
+        """
+        uris = [uri.strip() for uri in app.config.get("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()]
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        with self._lock:
+            self.keys = [bind_key(number) for number in range(len(uris))]
+            self.read_your_writes = app.config.get("DATABASE_READ_YOUR_WRITES", 5.0)
+            self.retry = app.config.get("DATABASE_REPLICA_RETRY", 30.0)
+            self._turn = 0
+            self._down_until = {}
+        binds.update(zip(self.keys, uris))
+        app.config["SQLALCHEMY_BINDS"] = binds
+        app.before_request(self._before_request)
+        app.after_request(self.record_write)
+        if uris:
+            logger.info("Reading from %d database replicas", len(uris))
+
+    def instrument(self, engines: dict) -> None:
+        """Listens for connection errors on the engines of the replicas"""
+        for key in self.keys:
+            event.listen(engines[key], "handle_error", self._handle_error(key))
+
+    def _handle_error(self, key: str):
+        def handle_error(context) -> None:
+            if context.is_disconnect or isinstance(context.sqlalchemy_exception, CONNECTION_ERRORS):
+                self.mark_down(key)
+
+        return handle_error
+
+    ##################################################
+    # Health
+    ##################################################
+
+    def mark_down(self, key: str) -> None:
+        """Skips a replica for the next retry seconds"""
+        with self._lock:
+            self._down_until[key] = time.monotonic() + self.retry
+        logger.warning("Database replica %s is down, retrying in %.0f seconds", key, self.retry)
+
+    def is_healthy(self, key: str, engines: dict) -> bool:
+        """Tells if a replica can be read from
+
+        A replica that is down is checked with a query once its retry time
+        has passed, and stays down if it still does not answer.
+        """
+        with self._lock:
+            down_until = self._down_until.get(key)
+        if down_until is None:
+            return True
+        if time.monotonic() < down_until:
+            return False
+        try:
+            with engines[key].connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except CONNECTION_ERRORS:
+            self.mark_down(key)
+            return False
+        with self._lock:
+            self._down_until.pop(key, None)
+        logger.info("Database replica %s is back up", key)
+        return True
+
+    def status(self) -> dict:
+        """Returns "up" or "down" for each replica"""
+        now = time.monotonic()
+        with self._lock:
+            return {key: "down" if self._down_until.get(key, 0) > now else "up" for key in self.keys}
+
+    ##################################################
+    # Routing
+    ##################################################
+
+    def next_replica(self, engines: dict):
+        """Returns the key of the next healthy replica, or None for none"""
+        for _ in range(len(self.keys)):
+            with self._lock:
+                key = self.keys[self._turn % len(self.keys)]
+                self._turn += 1
+            if self.is_healthy(key, engines):
+                return key
+        return None
+
+    @staticmethod
+    def _before_request() -> None:
+        # the application context, and g, may outlive a request in tests
+        g.pop("db_replica", None)
+
+    def wrote_recently(self) -> bool:
+        """Tells if the client of the request has written in the last seconds"""
+        try:
+            written_at = float(request.cookies.get(WRITE_COOKIE, "0"))
+        except ValueError:
+            return False
+        return time.time() - written_at < self.read_your_writes
+
+    def read_key(self, engines: dict):
+        """Returns the key of the replica to read from, or None for the primary
+
+        Only the reads of GET and HEAD requests go to a replica, and all of
+        the reads of a request go to the same one.
+        """
+        if not self.keys or not has_request_context() or g.get("db_primary"):
+            return None
+        if "db_replica" not in g:
+            if request.method not in READ_METHODS or self.wrote_recently():
+                g.db_replica = None
+            else:
+                g.db_replica = self.next_replica(engines)
+        return g.db_replica
+
+    def fail_over(self) -> bool:
+        """Sends the rest of the reads of the request to the primary
+
+        :return: True if the request was reading from a replica, so that a
+            read that failed on it can be run again
+        """
+        if not has_request_context() or g.get("db_replica") is None:
+            return False
+        logger.warning("Reading from the primary after database replica %s failed", g.db_replica)
+        g.db_replica = None
+        return True
+
+    @contextmanager
+    def primary(self):
+        """Sends the reads made inside the block to the primary"""
+        if not has_request_context():
+            yield
+            return
+        previous = g.get("db_primary", False)
+        g.db_primary = True
+        try:
+            yield
+        finally:
+            g.db_primary = previous
+
+    def record_write(self, response):
+        """Remembers when a client has changed something"""
+        if self.keys and request.method not in READ_METHODS and response.status_code < 400:
+            response.set_cookie(
+                WRITE_COOKIE,
+                f"{time.time():.3f}",
+                max_age=max(int(self.read_your_writes), 1),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica when the router chooses one
+
+    A statement that cannot reach its replica is run again on the primary
+    after the transaction is rolled back.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing:
+            key = replicas.read_key(self._db.engines)
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        """Runs a statement, on the primary if its replica cannot be reached"""
+        return self._fail_over(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        """Returns the first column of the first row, see execute()"""
+        return self._fail_over(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        """Returns the first column of the rows, see execute()"""
+        return self._fail_over(super().scalars, *args, **kwargs)
+
+    def _fail_over(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except CONNECTION_ERRORS:
+            if not replicas.fail_over():
+                raise
+            self.rollback()
+            return method(*args, **kwargs)
+
+
+# The replica router of this worker
+replicas = ReplicaRouter()
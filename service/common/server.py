@@ -0,0 +1,150 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Gunicorn Server Settings
+
+This module computes the gunicorn settings of the service from environment
+variables and from the CPU limit of the container, and provides the server
+hooks. It is loaded by gunicorn.conf.py, so the same image can be scaled by
+changing its environment or its CPU limit instead of being rebuilt.
+"""
+import os
+import math
+from service import config
+from service.common.metrics import metrics
+from service.common.pool_metrics import pool_metrics
+from service.common.readiness import readiness
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def cpu_limit(root: str = CGROUP_ROOT) -> float:
+    """Returns the number of CPUs the container may use, or None if unlimited
+
+    Both cgroup v2 (cpu.max) and cgroup v1 (cpu.cfs_quota_us) are read
+    """
+    try:
+        with open(os.path.join(root, "cpu.max"), encoding="utf-8") as file:
+            quota, period = file.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us"), encoding="utf-8") as file:
+            quota = int(file.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us"), encoding="utf-8") as file:
+            period = int(file.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus(root: str = CGROUP_ROOT) -> float:
+    """Returns the number of CPUs this process can use"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    limit = cpu_limit(root)
+    return min(cpus, limit) if limit else cpus
+
+
+def is_true(value: str) -> bool:
+    """Checks if an environment variable is set to true"""
+    return value.lower() in ("true", "yes", "1")
+
+
+def settings(env: dict = None, cpus: float = None) -> dict:
+    """Returns the gunicorn settings for the environment
+
+    There is one worker process per available CPU, rounded up, because
+    JSON encoding is CPU bound. Waiting on the database is covered by the
+    threads of each worker instead, which are much cheaper than processes.
+
+    :param env: the environment variables, defaults to os.environ
+    :param cpus: the number of CPUs, defaults to available_cpus()
+
+    :return: the gunicorn settings by name
+    :rtype: dict
+    """
+    env = os.environ if env is None else env
+    cpus = available_cpus() if cpus is None else cpus
+    threads = int(env.get("GUNICORN_THREADS", "4"))
+    max_requests = int(env.get("GUNICORN_MAX_REQUESTS", "10000"))
+    return {
+        "bind": env.get("GUNICORN_BIND", f"0.0.0.0:{env.get('PORT', '8080')}"),
+        "workers": int(env.get("WEB_CONCURRENCY", max(1, math.ceil(cpus)))),
+        "threads": threads,
+        "worker_class": env.get("GUNICORN_WORKER_CLASS", "gthread" if threads > 1 else "sync"),
+        "timeout": int(env.get("GUNICORN_TIMEOUT", "30")),
+        "graceful_timeout": int(env.get("GUNICORN_GRACEFUL_TIMEOUT", "30")),
+        # longer than the idle timeout of a proxy would close reused connections under it
+        "keepalive": int(env.get("GUNICORN_KEEPALIVE", "5")),
+        # recycle workers now and then, at different times so they do not all restart at once
+        "max_requests": max_requests,
+        "max_requests_jitter": int(env.get("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)),
+        "preload_app": is_true(env.get("GUNICORN_PRELOAD", "false")),
+    }
+
+
+######################################################################
+#  S E R V E R   H O O K S
+######################################################################
+def on_starting(server) -> None:
+    """Runs in the master process before any worker starts"""
+    if config.METRICS_MULTIPROC_DIR:
+        metrics.set_directory(config.METRICS_MULTIPROC_DIR)
+        metrics.clear_directory()
+    capacity = config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW
+    server.log.info(
+        "Starting %d %s workers with %d threads each", server.cfg.workers, server.cfg.worker_class_str, server.cfg.threads
+    )
+    if server.cfg.threads > capacity:
+        server.log.warning(
+            "Each worker has %d threads but only %d database connections, raise DB_POOL_SIZE",
+            server.cfg.threads,
+            capacity,
+        )
+
+
+def post_fork(server, worker) -> None:  # pylint: disable=unused-argument
+    """Runs in each new worker process before it handles requests
+
+    With preload_app the application, and so the connection pool, was
+    created by the master. The pool is dropped without closing the
+    connections, which still belong to the master, so that the worker
+    opens its own. The counters inherited from the master are reset.
+    """
+    if server.cfg.preload_app:
+        from service.models import db  # pylint: disable=import-outside-toplevel
+
+        with server.app.wsgi().app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+    pool_metrics.reset()
+    metrics.reset()
+    readiness.reset()
+
+
+def worker_exit(server, worker) -> None:  # pylint: disable=unused-argument
+    """Runs in a worker process as it exits, e.g. after max_requests"""
+    if metrics.directory:
+        # the counts since the last periodic flush would be lost otherwise
+        metrics.flush()
+
+
+def child_exit(server, worker) -> None:  # pylint: disable=unused-argument
+    """Runs in the master process after a worker has exited"""
+    if config.METRICS_MULTIPROC_DIR:
+        metrics.mark_process_dead(worker.pid)
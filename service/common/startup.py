@@ -0,0 +1,94 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Startup Checks
+
+This module waits for the database when the service starts, so that a
+worker survives a database that is restarting or failing over instead of
+exiting at once and being restarted in a loop.
+"""
+import time
+import logging
+from itertools import count
+from retry.api import retry_call
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, InterfaceError
+
+logger = logging.getLogger("flask.app")
+
+# Errors raised while the database cannot be reached
+CONNECTION_ERRORS = (OperationalError, InterfaceError)
+
+
+class DatabaseUnavailableError(Exception):
+    """Used when the database cannot be reached before giving up"""
+
+
+def wait_for_database(  # pylint: disable=too-many-arguments
+    engine, *, tries: int = 10, delay: float = 1.0, backoff: float = 2.0, max_delay: float = 10.0, max_wait: float = 60.0
+) -> int:
+    """Waits until the database accepts a connection
+
+    The delay between attempts starts at delay seconds and is multiplied by
+    backoff after each failure up to max_delay. It gives up after tries
+    attempts, or before the next attempt if that would take the total wait
+    past max_wait seconds.
+
+    :param engine: the SQLAlchemy engine of the database
+    :param tries: the maximum number of attempts
+    :param delay: the seconds to wait after the first failure
+    :param backoff: the multiplier applied to the delay after each failure
+    :param max_delay: the longest wait between two attempts
+    :param max_wait: the longest total wait
+
+    :return: the number of attempts it took
+    :rtype: int
+
+    :raises DatabaseUnavailableError: when the database never answered
+    """
+    deadline = time.monotonic() + max_wait
+    attempts = count(1)
+
+    def attempt() -> int:
+        number = next(attempts)
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except CONNECTION_ERRORS as error:
+            # the same delays that retry_call sleeps between attempts
+            wait = min(delay * backoff ** (number - 1), max_delay)
+            fields = {"attempt": number, "max_attempts": tries, "retry_in": wait, "error": str(error).strip()}
+            if number >= tries or time.monotonic() + wait > deadline:
+                logger.error("Database connection failed: attempt=%d max_attempts=%d giving up: %s",
+                             number, tries, fields["error"], extra=fields)
+                raise DatabaseUnavailableError(f"Database not available after {number} attempts") from error
+            logger.warning("Database connection failed: attempt=%d max_attempts=%d retry_in=%.1fs: %s",
+                           number, tries, wait, fields["error"], extra=fields)
+            raise
+        logger.info("Database connection established: attempt=%d", number, extra={"attempt": number})
+        return number
+
+    # attempt() logs each failure itself, so retry_call does not log them again
+    return retry_call(
+        attempt,
+        exceptions=CONNECTION_ERRORS,
+        tries=tries,
+        delay=delay,
+        backoff=backoff,
+        max_delay=max_delay,
+        logger=None,
+    )
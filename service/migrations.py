@@ -0,0 +1,227 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Database Schema Migrations
+
+The schema is versioned in the schema_version table. Each migration
+upgrades the schema by exactly one version and is written against the
+schema as it was at that version, not against the current models, so
+that a database at any version can be brought up to date.
+
+To change the schema, add the new columns or indexes to the models AND
+append a migration to MIGRATIONS that makes the same change.
+"""
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import (
+    MetaData,
+    Table,
+    Column,
+    Index,
+    Integer,
+    String,
+    Boolean,
+    Date,
+    DateTime,
+    Enum,
+    func,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.exc import SQLAlchemyError
+from service.models import Gender
+
+logger = logging.getLogger("flask.app")
+
+# Arbitrary key for the Postgres advisory lock that serializes migrations
+MIGRATION_LOCK_ID = 7_031_994
+
+# Indexes that are only created when the pg_trgm extension is installed
+TRIGRAM_INDEXES = ("ix_pet_name_trgm", "ix_pet_category_trgm")
+
+version_table = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+######################################################################
+#  M I G R A T I O N S
+######################################################################
+def create_pet_table(conn) -> None:
+    """Creates the pet table as it was first released"""
+    metadata = MetaData()
+    Table(
+        "pet",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String(63), nullable=False),
+        Column("category", String(63), nullable=False),
+        Column("available", Boolean(), nullable=False),
+        Column("gender", Enum(Gender), nullable=False, server_default=Gender.UNKNOWN.name),
+        Column("birthday", Date(), nullable=False),
+        Column("created_at", DateTime, nullable=False),
+        Column("last_updated", DateTime, nullable=False),
+    )
+    # databases created before migrations existed already have the table
+    metadata.create_all(conn, checkfirst=True)
+
+
+def available_index(pet: Table) -> Index:
+    """Returns the partial index of the available Pets
+
+    The predicate must be "WHERE available" and not "IS TRUE", because
+    Postgres only uses a partial index for queries whose condition implies
+    it, and the queries filter on "available = true".
+    """
+    return Index(
+        "ix_pet_available",
+        pet.c.id,
+        postgresql_where=pet.c.available,
+        sqlite_where=pet.c.available,
+    )
+
+
+def add_pet_query_indexes(conn) -> None:
+    """Adds the indexes used by the Pet query paths"""
+    pet = Table("pet", MetaData(), autoload_with=conn)
+    indexes = [
+        Index("ix_pet_name", pet.c.name, pet.c.id),
+        Index("ix_pet_category_available", pet.c.category, pet.c.available),
+        Index("ix_pet_gender", pet.c.gender),
+        Index("ix_pet_birthday", pet.c.birthday, pet.c.id),
+        available_index(pet),
+    ]
+    for index in indexes:
+        index.create(conn, checkfirst=True)
+
+
+def add_pet_version_column(conn) -> None:
+    """Adds the version column used for optimistic locking"""
+    columns = {column["name"] for column in inspect(conn).get_columns("pet")}
+    if "version" not in columns:
+        conn.execute(text("ALTER TABLE pet ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def create_pet_summary_table(conn) -> None:
+    """Creates the table of Pet counts read by the stats endpoint"""
+    metadata = MetaData()
+    table = Table(
+        "pet_summary",
+        metadata,
+        Column("category", String(63), primary_key=True),
+        Column("gender", Enum(Gender), primary_key=True),
+        Column("available", Boolean(), primary_key=True),
+        Column("count", Integer, nullable=False),
+        Column("refreshed_at", DateTime, nullable=False),
+    )
+    table.create(conn, checkfirst=True)
+
+
+def add_pet_search_indexes(conn) -> None:
+    """Adds the full-text and trigram indexes of the Pet search on Postgres
+
+    The trigram indexes need the pg_trgm extension, which is installed
+    when the database has it and the user may install it. Without it the
+    search only matches the prefixes of words.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_pet_search ON pet "
+            "USING gin (to_tsvector('simple'::regconfig, name || ' ' || category))"
+        )
+    )
+    if conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first():
+        try:
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except SQLAlchemyError as error:
+            logger.warning("Cannot install pg_trgm, fuzzy search is disabled: %s", error)
+    if conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_pet_name_trgm ON pet USING gin (name gin_trgm_ops)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_pet_category_trgm ON pet USING gin (category gin_trgm_ops)"))
+    else:
+        logger.warning("The pg_trgm extension is not installed, fuzzy search is disabled")
+
+
+# (version, description, migration) in the order they must be applied
+MIGRATIONS = [
+    (1, "Create the pet table", create_pet_table),
+    (2, "Add indexes for the pet query paths", add_pet_query_indexes),
+    (3, "Add the pet version column", add_pet_version_column),
+    (4, "Create the pet summary table", create_pet_summary_table),
+    (5, "Add the pet search indexes", add_pet_search_indexes),
+]
+
+
+######################################################################
+#  M I G R A T I O N   R U N N E R
+######################################################################
+def current_version(conn) -> int:
+    """Returns the schema version of the database, 0 if it has none"""
+    if not inspect(conn).has_table(version_table.name):
+        return 0
+    return conn.execute(select(func.max(version_table.c.version))).scalar() or 0
+
+
+def upgrade(engine, target: int = None) -> int:
+    """Upgrades the database schema to the target version
+
+    All pending migrations run in a single transaction. On Postgres an
+    advisory lock is held while they run so that several processes
+    starting at once do not race each other.
+
+    :param engine: the SQLAlchemy engine of the database to upgrade
+    :param target: the version to upgrade to, defaults to the latest
+
+    :return: the schema version of the database after the upgrade
+    :rtype: int
+    """
+    target = target or MIGRATIONS[-1][0]
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        version_table.create(conn, checkfirst=True)
+        version = current_version(conn)
+        for number, description, migrate in MIGRATIONS:
+            if version < number <= target:
+                logger.info("Applying schema migration %d: %s", number, description)
+                migrate(conn)
+                conn.execute(
+                    version_table.insert().values(
+                        version=number,
+                        description=description,
+                        applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                    )
+                )
+                version = number
+    logger.info("Database schema is at version %d", version)
+    return version
+
+
+def reset(engine) -> None:
+    """Forgets all applied migrations so the next upgrade starts over
+
+    This must only be used after the tables have been dropped
+    """
+    version_table.drop(engine, checkfirst=True)
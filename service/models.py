@@ -20,6 +20,7 @@ All of the models are stored in this module
 Models
 ------
 Pet - A Pet used in the Pet Store
+PetSummary - The counts of Pets, refreshed periodically for cheap stats
 
 Attributes:
 -----------
@@ -30,21 +31,46 @@ gender (enum) - the gender of the pet
 birthday (date) - the day the pet was born
 
 """
+# pylint: disable=too-many-lines
+import re
+import hashlib
 import logging
-from datetime import date
+from datetime import date, datetime, timezone
+from json.encoder import encode_basestring_ascii
 from enum import Enum
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm.exc import StaleDataError
+from service.common.cache import cache
+from service.common.replicas import RoutingSession, replicas
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+# Pets keep their values after a commit, so serializing a Pet that was just
+# saved does not SELECT it again. Sessions only last for one request, and
+# send the reads of GET requests to the read replicas when there are any
+db = SQLAlchemy(session_options={"expire_on_commit": False, "class_": RoutingSession})
+
+
+# Fields that listings can be sorted by
+SORT_FIELDS = ("id", "name", "category", "birthday")
+
+# Fields of a serialized Pet, which are also the fields that can be selected
+JSON_FIELDS = ("id", "name", "category", "available", "gender", "birthday")
+
+# Longest search query, and most words of it that are matched
+SEARCH_MAX_LENGTH = 63
+SEARCH_MAX_TERMS = 5
 
 
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class DataConflictError(Exception):
+    """Used when a record was changed by someone else since it was read"""
+
+
 class Gender(Enum):
     """Enumeration of valid Pet Genders"""
 
@@ -53,7 +79,7 @@ class Gender(Enum):
     UNKNOWN = 3
 
 
-class Pet(db.Model):
+class Pet(db.Model):  # pylint: disable=too-many-public-methods
     """
     Class that represents a Pet
 
@@ -63,6 +89,7 @@ class Pet(db.Model):
 
     ##################################################
     # Table Schema
+    # NOTE: Schema changes must also be added to service/migrations.py
     ##################################################
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(63), nullable=False)
@@ -75,6 +102,35 @@ class Pet(db.Model):
     # Database auditing fields
     created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
     last_updated = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now(), nullable=False)
+    # Optimistic locking: every UPDATE checks and increments the version
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # eager_defaults fetches the generated timestamps with INSERT/UPDATE ... RETURNING
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
+
+    # Indexes for the query paths. Names are kept in step with the migrations.
+    # The trigram indexes of the search depend on the pg_trgm extension and
+    # are only created by the migrations, see add_pet_search_indexes()
+    __table_args__ = (
+        db.Index("ix_pet_name", "name", "id"),
+        db.Index("ix_pet_category_available", "category", "available"),
+        db.Index("ix_pet_gender", "gender"),
+        db.Index("ix_pet_birthday", "birthday", "id"),
+        db.Index(
+            "ix_pet_available",
+            "id",
+            postgresql_where=db.text("available"),
+            sqlite_where=db.text("available"),
+        ),
+        db.Index(
+            "ix_pet_search",
+            db.func.to_tsvector(
+                db.literal_column("'simple'::regconfig"),
+                name.op("||")(db.literal_column("' '")).op("||")(category),
+            ),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
 
     ##################################################
     # INSTANCE METHODS
@@ -83,6 +139,11 @@ class Pet(db.Model):
     def __repr__(self):
         return f"<Pet {self.name} id=[{self.id}]>"
 
+    @property
+    def etag(self) -> str:
+        """Returns a strong entity tag for this version of the Pet"""
+        return f"{self.id}-{self.version}"
+
     def create(self) -> None:
         """
         Saves a Pet to the database
@@ -97,6 +158,7 @@ class Pet(db.Model):
             db.session.rollback()
             logger.error("Error creating record: %s", self)
             raise DataValidationError(e) from e
+        cache.delete(self.cache_key(self.id))
 
     def update(self) -> None:
         """
@@ -107,10 +169,16 @@ class Pet(db.Model):
             raise DataValidationError("Update called with empty ID field")
         try:
             db.session.commit()
+        except StaleDataError as e:
+            db.session.rollback()
+            logger.warning("Conflict updating record: %s", self)
+            raise DataConflictError(f"Pet with id '{self.id}' was changed by another request") from e
         except Exception as e:
             db.session.rollback()
             logger.error("Error updating record: %s", self)
             raise DataValidationError(e) from e
+        finally:
+            cache.delete(self.cache_key(self.id))
 
     def delete(self) -> None:
         """
@@ -120,10 +188,16 @@ class Pet(db.Model):
         try:
             db.session.delete(self)
             db.session.commit()
+        except StaleDataError as e:
+            db.session.rollback()
+            logger.warning("Conflict deleting record: %s", self)
+            raise DataConflictError(f"Pet with id '{self.id}' was changed by another request") from e
         except Exception as e:
             db.session.rollback()
             logger.error("Error deleting record: %s", self)
             raise DataValidationError(e) from e
+        finally:
+            cache.delete(self.cache_key(self.id))
 
     def serialize(self) -> dict:
         """Serializes a Pet into a dictionary"""
@@ -136,6 +210,48 @@ class Pet(db.Model):
             "birthday": self.birthday.isoformat()
         }
 
+    @staticmethod
+    def values_to_json(values) -> str:
+        """Serializes the values of a Pet straight to compact JSON text
+
+        The text is the same as the default JSON provider makes from
+        serialize(), with sorted keys, but no dictionary is built
+
+        :param values: a row from find_rows() without fields, or any tuple
+            that starts with the id, name, category, available, gender and
+            birthday of a Pet
+        """
+        pet_id, name, category, available, gender, birthday = values[:6]
+        return (
+            f'{{"available":{"true" if available else "false"},'
+            f'"birthday":"{birthday.isoformat()}",'
+            f'"category":{encode_basestring_ascii(category)},'
+            f'"gender":"{gender.name}",'
+            f'"id":{pet_id},'
+            f'"name":{encode_basestring_ascii(name)}}}'
+        )
+
+    @staticmethod
+    def serialize_fields(pet, fields) -> dict:
+        """Serializes some of the fields of a Pet or of a row from find_rows()
+
+        :param pet: a Pet or any object with the Pet fields as attributes
+        :param fields: the names of the fields to serialize
+        """
+        data = {}
+        for name in fields:
+            value = getattr(pet, name)
+            if name == "gender":
+                value = value.name
+            elif name == "birthday":
+                value = value.isoformat()
+            data[name] = value
+        return data
+
+    def values(self) -> dict:
+        """Returns the values of the fields that clients can change"""
+        return {name: getattr(self, name) for name in JSON_FIELDS if name != "id"}
+
     def deserialize(self, data: dict):
         """
         Deserializes a Pet from a dictionary
@@ -143,8 +259,8 @@ class Pet(db.Model):
             data (dict): A dictionary containing the Pet data
         """
         try:
-            self.name = data["name"]
-            self.category = data["category"]
+            self.name = self.text_value("name", data["name"])
+            self.category = self.text_value("category", data["category"])
             if isinstance(data["available"], bool):
                 self.available = data["available"]
             else:
@@ -162,6 +278,8 @@ class Pet(db.Model):
             raise DataValidationError(
                 "Invalid pet: body of request contained bad or no data " + str(error)
             ) from error
+        except ValueError as error:
+            raise DataValidationError("Invalid pet: " + str(error)) from error
         return self
 
     ##################################################
@@ -169,10 +287,408 @@ class Pet(db.Model):
     ##################################################
 
     @classmethod
-    def all(cls) -> list:
+    def text_value(cls, field: str, value) -> str:
+        """
+        Checks that the value of a text field is a string that fits its column
+
+        :param field: the name of the field
+        :param value: the value from the request
+
+        :return: the value
+        """
+        if not isinstance(value, str):
+            raise DataValidationError(f"Invalid type for string [{field}]: {type(value)}")
+        max_length = cls.__table__.c[field].type.length
+        if len(value) > max_length:
+            raise DataValidationError(f"Invalid value for [{field}]: longer than {max_length} characters")
+        return value
+
+    @classmethod
+    def deserialize_values(cls, data: dict) -> dict:
+        """
+        Deserializes a partial Pet from a dictionary into column values
+
+        Only the attributes present in the dictionary are returned, which is
+        what a bulk update needs to set.
+        Args:
+            data (dict): A dictionary containing some of the Pet data
+        """
+        if not isinstance(data, dict) or not data:
+            raise DataValidationError("Invalid pet: body of request contained bad or no data")
+        values = {}
+        try:
+            for field, value in data.items():
+                if field in ("name", "category"):
+                    values[field] = cls.text_value(field, value)
+                elif field == "available":
+                    if not isinstance(value, bool):
+                        raise DataValidationError("Invalid type for boolean [available]: " + str(type(value)))
+                    values[field] = value
+                elif field == "gender":
+                    values[field] = getattr(Gender, value)  # create enum from string
+                elif field == "birthday":
+                    values[field] = date.fromisoformat(value)
+                else:
+                    raise DataValidationError("Invalid attribute: " + field)
+        except (AttributeError, TypeError, ValueError) as error:
+            raise DataValidationError(f"Invalid value for [{field}]: {error}") from error
+        return values
+
+    @classmethod
+    def update_where(cls, values: dict, **filters) -> int:
+        """
+        Updates every Pet that matches the filters with one UPDATE statement
+
+        No Pets are loaded into the session to do this.
+
+        :param values: the column values to set
+        :param filters: any of the attributes accepted by filter_criteria()
+
+        :return: the number of Pets that were updated
+        """
+        logger.info("Updating Pets matching %s with %s", filters, values)
+        statement = (
+            db.update(cls)
+            .where(*cls.filter_criteria(**filters))
+            .values(**values, version=cls.version + 1)
+        )
+        try:
+            result = db.session.execute(statement, execution_options={"synchronize_session": False})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error updating records matching: %s", filters)
+            raise DataValidationError(e) from e
+        finally:
+            cache.clear()  # the ids that changed are not known
+        return result.rowcount
+
+    @classmethod
+    def update_by_id(cls, pet_id: int, values: dict, version: int = None, criteria: tuple = ()) -> tuple:
+        """
+        Updates one Pet with a single UPDATE ... RETURNING statement
+
+        The Pet is not read first, so the update costs one round trip and
+        nothing can change the Pet between reading and writing it. On
+        Postgres the same statement also reads the version and availability
+        the Pet had, so that a failed update can be explained without
+        another query. Other databases read them with a second query.
+
+        :param pet_id: the id of the Pet to update
+        :param values: the column values to set
+        :param version: if given, the version the Pet must still be at
+        :param criteria: any other SQL criteria the Pet must match
+
+        :return: the updated Pet, or None if no Pet matched, and the
+            (version, available) of the Pet before the update, or None if
+            there is no Pet with the id
+        :rtype: tuple
+        """
+        logger.info("Updating Pet with id %s with %s", pet_id, values)
+        statement = (
+            db.update(cls)
+            .where(cls.id == pet_id, *criteria)
+            .values(**values, version=cls.version + 1)
+            .returning(cls)
+        )
+        if version is not None:
+            statement = statement.where(cls.version == version)
+        options = {"populate_existing": True}
+        try:
+            if db.session.get_bind().dialect.name == "postgresql":
+                # every part of the statement sees the Pet as it was before the update
+                updated = db.aliased(cls, statement.cte("updated"), name="updated")
+                current = db.aliased(cls, name="current")
+                row = db.session.execute(
+                    db.select(updated, current.version, current.available)
+                    .select_from(current)
+                    .outerjoin(updated, db.true())
+                    .where(current.id == pet_id),
+                    execution_options=options,
+                ).one_or_none()
+                pet, current = (row[0], tuple(row[1:])) if row else (None, None)
+            else:
+                pet = db.session.scalars(statement, execution_options=options).one_or_none()
+                current = None
+                if pet is None:
+                    row = db.session.execute(db.select(cls.version, cls.available).where(cls.id == pet_id)).one_or_none()
+                    current = tuple(row) if row else None
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error updating record: %s", pet_id)
+            raise DataValidationError(e) from e
+        finally:
+            cache.delete(cls.cache_key(pet_id))
+        return pet, current
+
+    @classmethod
+    def purchase(cls, pet_id: int, version: int = None) -> tuple:
+        """
+        Atomically makes an available Pet unavailable
+
+        This is a single conditional UPDATE ... WHERE available RETURNING
+        statement, so two concurrent purchases can never both succeed.
+
+        :param pet_id: the id of the Pet to purchase
+        :param version: if given, the version the Pet must still be at
+
+        :return: the purchased Pet or None, and the Pet before the purchase
+            as returned by update_by_id()
+        :rtype: tuple
+        """
+        logger.info("Purchasing Pet with id %s", pet_id)
+        return cls.update_by_id(pet_id, {"available": False}, version, criteria=(cls.available.is_(True),))
+
+    @classmethod
+    def delete_where(cls, **filters) -> int:
+        """
+        Removes every Pet that matches the filters with one DELETE statement
+
+        No Pets are loaded into the session to do this.
+
+        :param filters: any of the attributes accepted by filter_criteria()
+
+        :return: the number of Pets that were removed
+        """
+        logger.info("Deleting Pets matching %s", filters)
+        statement = db.delete(cls).where(*cls.filter_criteria(**filters))
+        try:
+            result = db.session.execute(statement, execution_options={"synchronize_session": False})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error deleting records matching: %s", filters)
+            raise DataValidationError(e) from e
+        finally:
+            cache.clear()  # the ids that changed are not known
+        return result.rowcount
+
+    @classmethod
+    def paginate(cls, query, after=None, limit: int = None, sort: str = "id"):
+        """Applies a sort order and keyset (cursor) pagination to a query
+
+        Only rows after the cursor are returned, so every page is an index
+        range scan no matter how deep it is. Rows are always ordered by id
+        last so that the order, and therefore the cursor, is stable.
+
+        :param query: the query to paginate
+        :param after: the cursor of the last Pet on the previous page. This
+            is the id when sorting by id, or a (value, id) tuple otherwise
+        :param limit: the maximum number of Pets to return
+        :type limit: int
+        :param sort: the field to sort by, prefixed with '-' for descending
+        :type sort: str
+
+        :return: the paginated query
+        """
+        field = sort.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise DataValidationError(f"Invalid sort field: {field}")
+        descending = sort.startswith("-")
+        keys = (cls.id,) if field == "id" else (getattr(cls, field), cls.id)
+
+        query = query.order_by(*[key.desc() if descending else key for key in keys])
+        if after is not None:
+            position = db.tuple_(*keys) if len(keys) > 1 else keys[0]
+            cursor = db.tuple_(*after) if len(keys) > 1 else after
+            query = query.filter(position < cursor if descending else position > cursor)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @classmethod
+    def filter_criteria(cls, **filters) -> list:
+        """Returns the SQL criteria that match all of the given attributes
+
+        :param filters: any of name, category, available, gender, the
+            inclusive birthday range birthday_from and birthday_to, and a
+            search query q. Filters that are None are ignored.
+
+        :return: a list of SQL criteria
+        """
+        criteria = []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if field == "birthday_from":
+                criteria.append(cls.birthday >= value)
+            elif field == "birthday_to":
+                criteria.append(cls.birthday <= value)
+            elif field in ("name", "category", "available", "gender"):
+                criteria.append(getattr(cls, field) == value)
+            elif field == "q":
+                criteria.append(cls.search_criteria(value))
+            else:
+                raise DataValidationError(f"Invalid filter field: {field}")
+        return criteria
+
+    ##################################################
+    # SEARCH
+    ##################################################
+
+    # The search mode of each database, see search_mode()
+    _search_modes = {}
+
+    @classmethod
+    def search_mode(cls) -> str:
+        """Returns how the database matches search queries
+
+        The mode is looked up once per database:
+
+        - "trigram" on Postgres with the pg_trgm extension, which matches
+          the prefixes of words with the full-text index and misspelt
+          names and categories with the trigram indexes
+        - "fulltext" on Postgres without pg_trgm, which only matches the
+          prefixes of words
+        - "like" on other databases such as SQLite, which match the
+          prefixes of words with LIKE and no index
+
+        :return: "trigram", "fulltext" or "like"
+        :rtype: str
+        """
+        url = str(db.engine.url)
+        if url not in cls._search_modes:
+            mode = "like"
+            if db.engine.dialect.name == "postgresql":
+                statement = db.text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                mode = "trigram" if db.session.execute(statement).first() else "fulltext"
+            logger.info("Pet search mode: %s", mode)
+            cls._search_modes[url] = mode
+        return cls._search_modes[url]
+
+    @staticmethod
+    def search_terms(query: str) -> list:
+        """Returns the lowercase words of a search query
+
+        :raises DataValidationError: when the query is too long or has no
+            words
+        """
+        # underscores separate words, as in the full-text parser
+        terms = re.findall(r"[^\W_]+", query.lower())
+        if not terms or len(query) > SEARCH_MAX_LENGTH:
+            raise DataValidationError(f"Invalid search query: it needs 1 to {SEARCH_MAX_LENGTH} characters with a word")
+        return terms[:SEARCH_MAX_TERMS]
+
+    @classmethod
+    def search_document(cls):
+        """Returns the full-text document of a Pet, as indexed by ix_pet_search"""
+        text = cls.name.op("||")(db.literal_column("' '")).op("||")(cls.category)
+        return db.func.to_tsvector(db.literal_column("'simple'::regconfig"), text)
+
+    @classmethod
+    def search_tsquery(cls, query: str):
+        """Returns the full-text query that matches a prefix of every word"""
+        tsquery = " & ".join(f"{term}:*" for term in cls.search_terms(query))
+        return db.func.to_tsquery(db.literal_column("'simple'::regconfig"), tsquery)
+
+    @classmethod
+    def search_criteria(cls, query: str):
+        """Returns the SQL criteria of the Pets that match a search query
+
+        Every word of the query must start a word of the name or category.
+        In trigram mode, names and categories similar to the whole query
+        match as well.
+        """
+        mode = cls.search_mode()
+        if mode == "like":
+            return db.and_(
+                *[
+                    db.or_(
+                        cls.name.istartswith(term, autoescape=True),
+                        cls.name.icontains(" " + term, autoescape=True),
+                        cls.category.istartswith(term, autoescape=True),
+                        cls.category.icontains(" " + term, autoescape=True),
+                    )
+                    for term in cls.search_terms(query)
+                ]
+            )
+        criteria = cls.search_document().op("@@")(cls.search_tsquery(query))
+        if mode == "trigram":
+            criteria = db.or_(criteria, cls.name.op("%")(query), cls.category.op("%")(query))
+        return criteria
+
+    @classmethod
+    def search_rank(cls, query: str):
+        """Returns the SQL expression that ranks the matches of a query
+
+        Higher is better. A Pet named exactly like the query comes first,
+        then the Pets whose names start with it, then any other match. On
+        Postgres ties are broken by the full-text rank, and in trigram mode
+        by how similar the name or category is to the query.
+        """
+        rank = db.case(
+            (db.func.lower(cls.name) == query.lower(), 3),
+            (cls.name.istartswith(query, autoescape=True), 2),
+            else_=1,
+        )
+        mode = cls.search_mode()
+        if mode != "like":
+            rank = rank + db.func.ts_rank(cls.search_document(), cls.search_tsquery(query))
+        if mode == "trigram":
+            rank = rank + db.func.greatest(db.func.similarity(cls.name, query), db.func.similarity(cls.category, query))
+        return rank
+
+    @classmethod
+    def find_by_attributes(cls, after=None, limit: int = None, sort: str = "id", **filters):
+        """Returns the Pets that match all of the given attributes
+
+        All of the filters are combined into a single SQL query so that the
+        database does the filtering instead of the client.
+
+        :param after: the cursor of the last Pet on the previous page
+        :param limit: the maximum number of Pets to return
+        :param sort: the field to sort by, prefixed with '-' for descending
+        :param filters: any of the attributes accepted by filter_criteria()
+
+        :return: a query of the matching Pets
+        """
+        logger.info("Processing attribute query for %s ...", filters)
+        query = cls.query.filter(*cls.filter_criteria(**filters))
+        return cls.paginate(query, after, limit, sort)
+
+    @classmethod
+    def bulk_create(cls, pets: list) -> list:
+        """
+        Saves many Pets to the database in a single transaction
+
+        The Pets are written with multi-row INSERT statements instead of one
+        INSERT per Pet, and their new ids are returned in the same order.
+
+        :param pets: the deserialized Pets to save
+        :type pets: list
+
+        :return: the ids of the new Pets
+        :rtype: list
+        """
+        logger.info("Creating %d Pets", len(pets))
+        if not pets:
+            return []
+        rows = [
+            {
+                "name": pet.name,
+                "category": pet.category,
+                "available": pet.available,
+                "gender": pet.gender,
+                "birthday": pet.birthday,
+            }
+            for pet in pets
+        ]
+        try:
+            statement = db.insert(cls).returning(cls.id, sort_by_parameter_order=True)
+            ids = db.session.scalars(statement, rows).all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error creating %d records", len(pets))
+            raise DataValidationError(e) from e
+        return ids
+
+    @classmethod
+    def all(cls, after: int = None, limit: int = None) -> list:
         """Returns all of the Pets in the database"""
         logger.info("Processing all Pets")
-        return cls.query.all()
+        return cls.paginate(cls.query, after, limit).all()
 
     @classmethod
     def find(cls, pet_id: int):
@@ -188,58 +704,341 @@ class Pet(db.Model):
         logger.info("Processing lookup for id %s ...", pet_id)
         return cls.query.session.get(cls, pet_id)
 
+    @staticmethod
+    def cache_key(pet_id: int) -> str:
+        """Returns the cache key of a Pet"""
+        return f"pet:{pet_id}"
+
+    @classmethod
+    def find_cached(cls, pet_id: int):
+        """Finds a Pet by it's ID and returns it serialized with its validators
+
+        Reads go through the cache, which is invalidated whenever a Pet is
+        changed, so this is the fast path for read only requests.
+
+        :param pet_id: the id of the Pet to find
+        :type pet_id: int
+
+        :return: a dict with the serialized "pet", its "etag" and the
+            "last_modified" time in ISO format, or None if not found
+        :rtype: dict
+
+        """
+
+        def load():
+            # a Pet read from a lagging replica would stay in the cache
+            with replicas.primary():
+                pet = cls.find(pet_id)
+            if not pet:
+                return None
+            return {
+                "pet": pet.serialize(),
+                "etag": pet.etag,
+                "last_modified": pet.last_updated.isoformat(),
+            }
+
+        return cache.get_or_load(cls.cache_key(pet_id), load)
+
+    @classmethod
+    def select_rows(cls, fields: list = None, after=None, limit: int = None, sort: str = "id", **filters):
+        """Returns the SQLAlchemy Core statement of find_rows()
+
+        The selected fields come first, in JSON_FIELDS order when there are
+        none, followed by the sort, id, version and last_updated columns
+        that paging and fingerprint() need.
+
+        With sort "relevance" the matches of the q filter are ranked by
+        search_rank(). They cannot be paged, only limited.
+        """
+        fields = list(fields or JSON_FIELDS)
+        unknown = set(fields) - set(JSON_FIELDS)
+        if unknown:
+            raise DataValidationError(f"Invalid fields: {', '.join(sorted(unknown))}")
+        # paginate() rejects sort fields that are not columns
+        extra = [sort.lstrip("-")] if sort.lstrip("-") in SORT_FIELDS else []
+        names = dict.fromkeys([*fields, *extra, "id", "version", "last_updated"])
+        statement = db.select(*(cls.__table__.c[name] for name in names))
+        statement = statement.where(*cls.filter_criteria(**filters))
+        if sort == "relevance":
+            if not filters.get("q"):
+                raise DataValidationError("Sorting by relevance needs a search query")
+            if after is not None:
+                raise DataValidationError("Search results sorted by relevance cannot be paged")
+            return statement.order_by(cls.search_rank(filters["q"]).desc(), cls.id).limit(limit)
+        return cls.paginate(statement, after, limit, sort)
+
+    @classmethod
+    def find_rows(cls, fields: list = None, yield_per: int = None, **query):
+        """Runs the query of find_by_attributes() with SQLAlchemy Core
+
+        This is the read-only fast path for listings. Rows come straight
+        from the database cursor without building Pets or tracking them
+        in the session, and are serialized with values_to_json() or
+        serialize_fields().
+
+        :param fields: the names of the columns to select, or None for all
+        :param yield_per: the number of rows fetched at a time when the
+            rows are streamed instead of all being returned at once
+        :param query: the after, limit, sort and filters arguments of
+            find_by_attributes()
+
+        :return: a list of rows, or an iterator of rows when yield_per is set.
+            The query of an iterator only runs when the iteration starts, so
+            that a streamed response reads it in the session of the stream
+        """
+        logger.info("Processing row query for %s ...", query)
+        statement = cls.select_rows(fields, **query)
+        if yield_per:
+            return cls._stream_rows(statement, yield_per)
+        return db.session.execute(statement).all()
+
+    @staticmethod
+    def _stream_rows(statement, yield_per: int):
+        # the session of the view is removed before a streamed response is
+        # sent, and its server-side cursor with it
+        yield from db.session.execute(statement, execution_options={"yield_per": yield_per})
+
+    @classmethod
+    def rows_to_json(cls, rows) -> str:
+        """Serializes rows from find_rows() without fields to a JSON array"""
+        return "[" + ",".join([cls.values_to_json(row) for row in rows]) + "]"
+
+    @classmethod
+    def fingerprint(cls, pets) -> str:
+        """Returns an entity tag for a collection of Pets
+
+        The tag changes whenever a Pet is added to, removed from or updated
+        in the collection. It is computed from the number of Pets, the sums
+        of their ids and versions, and the latest last_updated time.
+
+        :param pets: either a list of Pets, or a query which is aggregated
+            in the database without loading any of its rows
+
+        :return: the entity tag
+        :rtype: str
+        """
+        if isinstance(pets, list):
+            count = len(pets)
+            id_sum = sum(pet.id for pet in pets)
+            version_sum = sum(pet.version for pet in pets)
+            latest = max((pet.last_updated for pet in pets), default=None)
+        else:
+            rows = pets.subquery()
+            statement = db.select(
+                db.func.count(),
+                db.func.sum(rows.c.id),
+                db.func.sum(rows.c.version),
+                db.func.max(rows.c.last_updated),
+            )
+            count, id_sum, version_sum, latest = db.session.execute(statement).one()
+        latest = latest.isoformat() if latest else ""
+        fingerprint = f"{count}:{id_sum or 0}:{version_sum or 0}:{latest}"
+        return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def count(cls, **filters) -> int:
+        """Returns the number of Pets that match all of the given attributes
+
+        :param filters: any of the attributes accepted by filter_criteria()
+
+        :return: the number of matching Pets
+        :rtype: int
+        """
+        logger.info("Processing count query for %s ...", filters)
+        statement = db.select(db.func.count()).select_from(cls).where(*cls.filter_criteria(**filters))
+        return db.session.execute(statement).scalar()
+
     @classmethod
-    def find_by_name(cls, name: str) -> list:
+    def stats(cls, **filters) -> dict:
+        """Returns the counts of Pets by category, gender and availability
+
+        The Pets are counted by the database with a single GROUP BY query
+        over the three attributes, so no Pet is loaded.
+
+        :param filters: any of the attributes accepted by filter_criteria()
+
+        :return: the counts in the format of summarize()
+        :rtype: dict
+        """
+        logger.info("Processing stats query for %s ...", filters)
+        groups = (cls.category, cls.gender, cls.available)
+        statement = db.select(*groups, db.func.count()).where(*cls.filter_criteria(**filters)).group_by(*groups)
+        stats = cls.summarize(db.session.execute(statement))
+        stats["source"] = "live"
+        return stats
+
+    @staticmethod
+    def summarize(groups) -> dict:
+        """Adds up (category, gender, available, count) groups of Pets
+
+        :param groups: the counts of Pets grouped by all three attributes
+
+        :return: the total count and the counts by each attribute, e.g.
+            {"count": 3, "category": {"dog": 3}, "gender": {"MALE": 1, ...},
+            "available": {"true": 2, "false": 1}}
+        :rtype: dict
+        """
+        stats = {
+            "count": 0,
+            "category": {},
+            "gender": {gender.name: 0 for gender in Gender},
+            "available": {"true": 0, "false": 0},
+        }
+        for category, gender, available, count in groups:
+            stats["count"] += count
+            stats["category"][category] = stats["category"].get(category, 0) + count
+            stats["gender"][gender.name] += count
+            stats["available"]["true" if available else "false"] += count
+        return stats
+
+    @classmethod
+    def find_by_name(cls, name: str, after: int = None, limit: int = None) -> list:
         """Returns all Pets with the given name
 
         :param name: the name of the Pets you want to match
         :type name: str
+        :param after: the id of the last Pet on the previous page (cursor)
+        :param limit: the maximum number of Pets to return
 
         :return: a collection of Pets with that name
         :rtype: list
 
         """
         logger.info("Processing name query for %s ...", name)
-        return cls.query.filter(cls.name == name)
+        return cls.paginate(cls.query.filter(cls.name == name), after, limit)
 
     @classmethod
-    def find_by_category(cls, category: str) -> list:
+    def find_by_category(cls, category: str, after: int = None, limit: int = None) -> list:
         """Returns all of the Pets in a category
 
         :param category: the category of the Pets you want to match
         :type category: str
+        :param after: the id of the last Pet on the previous page (cursor)
+        :param limit: the maximum number of Pets to return
 
         :return: a collection of Pets in that category
         :rtype: list
 
         """
         logger.info("Processing category query for %s ...", category)
-        return cls.query.filter(cls.category == category)
+        return cls.paginate(cls.query.filter(cls.category == category), after, limit)
 
     @classmethod
-    def find_by_availability(cls, available: bool = True) -> list:
+    def find_by_availability(cls, available: bool = True, after: int = None, limit: int = None) -> list:
         """Returns all Pets by their availability
 
         :param available: True for pets that are available
         :type available: str
+        :param after: the id of the last Pet on the previous page (cursor)
+        :param limit: the maximum number of Pets to return
 
         :return: a collection of Pets that are available
         :rtype: list
 
         """
         logger.info("Processing available query for %s ...", available)
-        return cls.query.filter(cls.available == available)
+        return cls.paginate(cls.query.filter(cls.available == available), after, limit)
 
     @classmethod
-    def find_by_gender(cls, gender: Gender = Gender.UNKNOWN) -> list:
+    def find_by_gender(cls, gender: Gender = Gender.UNKNOWN, after: int = None, limit: int = None) -> list:
         """Returns all Pets by their Gender
 
         :param gender: values are ['MALE', 'FEMALE', 'UNKNOWN']
         :type available: enum
+        :param after: the id of the last Pet on the previous page (cursor)
+        :param limit: the maximum number of Pets to return
 
         :return: a collection of Pets that are available
         :rtype: list
 
         """
         logger.info("Processing gender query for %s ...", gender.name)
-        return cls.query.filter(cls.gender == gender)
+        return cls.paginate(cls.query.filter(cls.gender == gender), after, limit)
+
+
+class PetSummary(db.Model):
+    """
+    Class that represents the counts of Pets by category, gender and
+    availability
+
+    The summary is a copy of what Pet.stats() computes, refreshed by
+    refresh() every few minutes, so that stats can be read from a few rows
+    instead of counting every Pet
+    """
+
+    ##################################################
+    # Table Schema
+    # NOTE: Schema changes must also be added to service/migrations.py
+    ##################################################
+    category = db.Column(db.String(63), primary_key=True)
+    gender = db.Column(db.Enum(Gender), primary_key=True)
+    available = db.Column(db.Boolean(), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+    # Filters that can be answered from the summary
+    FILTERS = ("category", "gender", "available")
+
+    def __repr__(self):
+        return f"<PetSummary {self.category} {self.gender.name} available={self.available} count=[{self.count}]>"
+
+    @classmethod
+    def refresh(cls) -> int:
+        """Recounts the Pets and replaces the summary with the new counts
+
+        The old counts are replaced in a single transaction, so readers
+        always see a complete summary.
+
+        :return: the number of groups in the summary
+        :rtype: int
+        """
+        logger.info("Refreshing the pet summary")
+        columns = (Pet.category, Pet.gender, Pet.available)
+        refreshed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        counts = db.select(*columns, db.func.count(), db.literal(refreshed_at, db.DateTime)).group_by(*columns)
+        try:
+            if db.engine.dialect.name == "postgresql":
+                # two refreshes at once would insert the same groups twice
+                db.session.execute(db.text("LOCK TABLE pet_summary IN EXCLUSIVE MODE"))
+            db.session.execute(db.delete(cls))
+            db.session.execute(
+                db.insert(cls.__table__).from_select(["category", "gender", "available", "count", "refreshed_at"], counts)
+            )
+            # the driver does not report the rowcount of INSERT ... SELECT
+            groups = db.session.execute(db.select(db.func.count()).select_from(cls)).scalar()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error refreshing the pet summary")
+            raise DataValidationError(e) from e
+        return groups
+
+    @classmethod
+    def stats(cls, max_age: float = None, **filters) -> dict:
+        """Returns the stats of Pet.stats() from the summary
+
+        :param max_age: the age in seconds after which the summary is too
+            old to be used
+        :param filters: any of category, gender and available
+
+        :return: the stats with the time of the summary in as_of, or None
+            when the summary is empty, too old, or cannot answer the filters
+        :rtype: dict
+        """
+        filters = {field: value for field, value in filters.items() if value is not None}
+        if set(filters) - set(cls.FILTERS):
+            return None
+        refreshed_at = db.session.execute(db.select(db.func.min(cls.refreshed_at))).scalar()
+        if refreshed_at is None:
+            return None
+        age = (datetime.now(timezone.utc).replace(tzinfo=None) - refreshed_at).total_seconds()
+        if max_age is not None and age > max_age:
+            logger.warning("The pet summary is %.0f seconds old, counting the pets instead", age)
+            return None
+        logger.info("Processing summary stats query for %s ...", filters)
+        criteria = [getattr(cls, field) == value for field, value in filters.items()]
+        statement = db.select(cls.category, cls.gender, cls.available, cls.count).where(*criteria)
+        stats = Pet.summarize(db.session.execute(statement))
+        stats["source"] = "summary"
+        stats["as_of"] = refreshed_at.replace(tzinfo=timezone.utc).isoformat()
+        return stats
@@ -18,10 +18,24 @@
 """
 Pet Store Service with UI
 """
-from flask import jsonify, request, url_for, abort
+import json
+import base64
+import binascii
+from datetime import date, datetime, timezone
+from flask import jsonify, request, url_for, abort, Response, stream_with_context
 from flask import current_app as app  # Import Flask application
-from service.models import Pet, Gender
+from service.models import db, Pet, PetSummary, Gender, DataValidationError, JSON_FIELDS
 from service.common import status  # HTTP Status Codes
+from service.common.cache import cache
+from service.common.pool_metrics import pool_metrics
+from service.common.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from service.common.readiness import readiness
+from service.common.replicas import replicas
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Largest value of the integer id column, larger cursors cannot be compared with it
+MAX_PET_ID = 2**31 - 1
 
 
 ######################################################################
@@ -33,6 +47,65 @@ def health_check():
     return jsonify(status=200, message="Healthy"), status.HTTP_200_OK
 
 
+######################################################################
+# GET LIVENESS CHECK
+######################################################################
+@app.route("/live")
+def liveness_check():
+    """Tells whether the worker is running, without touching the database"""
+    return jsonify(status=200, message="Alive"), status.HTTP_200_OK
+
+
+######################################################################
+# GET READINESS CHECK
+######################################################################
+@app.route("/ready")
+def readiness_check():
+    """Tells whether the worker can serve requests
+
+    The database and the connection pool are checked at most once every
+    READY_CACHE_SECONDS, probes in between get the last result. Replicas
+    that are down are reported but do not make the worker unready, since
+    the primary answers their reads.
+    """
+    ready, checks = readiness.check(db.engine)
+    if replicas.keys:
+        checks = {**checks, "replicas": replicas.status()}
+    if not ready:
+        return (
+            jsonify(status=status.HTTP_503_SERVICE_UNAVAILABLE, message="Not Ready", checks=checks),
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    return jsonify(status=200, message="Ready", checks=checks), status.HTTP_200_OK
+
+
+######################################################################
+# GET CACHE STATISTICS
+######################################################################
+@app.route("/cache/stats")
+def cache_stats():
+    """Returns the hit and miss counters of the Pet cache in this worker"""
+    return jsonify(cache.stats()), status.HTTP_200_OK
+
+
+######################################################################
+# GET CONNECTION POOL STATISTICS
+######################################################################
+@app.route("/pool/stats")
+def pool_stats():
+    """Returns the state and counters of the database pool in this worker"""
+    return jsonify(pool_metrics.stats()), status.HTTP_200_OK
+
+
+######################################################################
+# GET METRICS
+######################################################################
+@app.route("/metrics")
+def get_metrics():
+    """Returns the metrics of all workers in the Prometheus text format"""
+    return Response(metrics.render(), status=status.HTTP_200_OK, content_type=METRICS_CONTENT_TYPE)
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -47,40 +120,90 @@ def index():
 ######################################################################
 @app.route("/pets", methods=["GET"])
 def list_pets():
-    """Returns all of the Pets"""
-    app.logger.info("Request to list Pets...")
+    """Returns all of the Pets that match the query string
 
-    pets = []
+    Any of name, category, available, gender, birthday_from and birthday_to
+    can be combined and are all applied as a single database query. With
+    fields, only those columns are selected and returned. With count=true,
+    the number of matching Pets on all pages is sent in X-Total-Count.
+
+    q searches the words of the names and categories. Its matches are
+    ranked best first unless another sort is asked for, and ranked results
+    come in a single page of at most limit Pets.
+    """
+    app.logger.info("Request to list Pets...")
 
     # Parse any arguments from the query string
-    category = request.args.get("category")
-    name = request.args.get("name")
-    available = request.args.get("available")
-    gender = request.args.get("gender")
-
-    if category:
-        app.logger.info("Find by category: %s", category)
-        pets = Pet.find_by_category(category)
-    elif name:
-        app.logger.info("Find by name: %s", name)
-        pets = Pet.find_by_name(name)
-    elif available:
-        app.logger.info("Find by available: %s", available)
-        # create bool from string
-        available_value = available.lower() in ["true", "yes", "1"]
-        pets = Pet.find_by_availability(available_value)
-    elif gender:
-        app.logger.info("Find by gender: %s", gender)
-        # create enum from string
-        gender_value = getattr(Gender, gender.upper())
-        pets = Pet.find_by_gender(gender_value)
+    filters = get_filters()
+    sort = request.args.get("sort", "relevance" if "q" in filters else "id")
+    after, limit = get_page_args()
+    fields = get_fields()
+
+    stream = is_stream_request()
+    if sort == "relevance":
+        # Ranked matches have no cursor, so there is never a next page
+        fetch = limit
+    elif stream:
+        # Streamed listings are not paged unless a limit is asked for
+        fetch = limit if "limit" in request.args else None
     else:
-        app.logger.info("Find all")
-        pets = Pet.all()
+        # Fetch one extra row to find out if there is a next page
+        fetch = limit + 1
+
+    # Listings are read only, so they skip the ORM and read plain rows
+    app.logger.info("Find by %s sorted by %s", filters or "all", sort)
+    query = {"after": after, "limit": fetch, "sort": sort, **filters}
+
+    # Counting every match costs an extra query, so it is only done on request
+    count_headers = {}
+    if request.args.get("count", "").lower() in ["true", "yes", "1"]:
+        count_headers["X-Total-Count"] = str(Pet.count(**filters))
+
+    if stream:
+        app.logger.info("Streaming Pets...")
+        response = stream_pets(Pet.find_rows(fields, yield_per=app.config["STREAM_BATCH_SIZE"], **query), fields)
+        response.headers.update(count_headers)
+        return response
+
+    # Answer conditional requests with an aggregate query instead of the rows
+    if request.if_none_match:
+        etag = Pet.fingerprint(Pet.select_rows(fields, **query))
+        if is_not_modified(etag):
+            return not_modified(etag, weak=bool(fields))
+
+    rows = Pet.find_rows(fields, **query)
+    page, headers = get_page(rows, limit)
+    app.logger.info("[%s] Pets returned", len(page))
+    if fields or app.debug:
+        response = jsonify([Pet.serialize_fields(row, fields or JSON_FIELDS) for row in page])
+    else:
+        response = app.response_class(Pet.rows_to_json(page) + "\n", mimetype="application/json")
+    response = set_validators(response, Pet.fingerprint(rows), weak=bool(fields))
+    return response, status.HTTP_200_OK, {**headers, **count_headers}
+
+
+######################################################################
+# GET PET STATISTICS
+######################################################################
+@app.route("/pets/stats", methods=["GET"])
+def pet_stats():
+    """Returns the number of Pets by category, gender and availability
+
+    The same filters as the listing can be used. The counts are computed by
+    the database, or read from the periodically refreshed pet summary when
+    STATS_SUMMARY is on and the summary can answer the filters
+    """
+    app.logger.info("Request for Pet statistics...")
+    filters = get_filters()
 
-    results = [pet.serialize() for pet in pets]
-    app.logger.info("[%s] Pets returned", len(results))
-    return jsonify(results), status.HTTP_200_OK
+    stats = None
+    if app.config["STATS_SUMMARY"]:
+        stats = PetSummary.stats(max_age=app.config["STATS_SUMMARY_MAX_AGE"], **filters)
+    if stats is None:
+        stats = Pet.stats(**filters)
+
+    app.logger.info("Counted [%s] Pets (%s)", stats["count"], stats["source"])
+    return jsonify(stats), status.HTTP_200_OK
 
 
 ######################################################################
@@ -91,17 +214,29 @@ def get_pets(pet_id):
     """
     Retrieve a single Pet
 
-    This endpoint will return a Pet based on it's id
+    This endpoint will return a Pet based on it's id, or only some of
+    its fields when they are listed in fields
     """
     app.logger.info("Request to Retrieve a pet with id [%s]", pet_id)
+    fields = get_fields()
 
     # Attempt to find the Pet and abort if not found
-    pet = Pet.find(pet_id)
-    if not pet:
+    found = Pet.find_cached(pet_id)
+    if not found:
         abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
 
-    app.logger.info("Returning pet: %s", pet.name)
-    return jsonify(pet.serialize()), status.HTTP_200_OK
+    # Answer conditional requests without serializing the Pet
+    last_modified = datetime.fromisoformat(found["last_modified"])
+    if is_not_modified(found["etag"], last_modified):
+        return not_modified(found["etag"], last_modified, weak=bool(fields))
+
+    app.logger.info("Returning pet: %s", found["pet"]["name"])
+    if fields:
+        # the cached Pet is smaller than a round trip for the selected columns
+        response = jsonify({name: found["pet"][name] for name in fields})
+    else:
+        response = jsonify(found["pet"])
+    return set_validators(response, found["etag"], last_modified, weak=bool(fields)), status.HTTP_200_OK
 
 
 ######################################################################
@@ -119,7 +254,7 @@ def create_pets():
     pet = Pet()
     # Get the data from the request and deserialize it
     data = request.get_json()
-    app.logger.info("Processing: %s", data)
+    app.logger.debug("Processing: %s", data)
     pet.deserialize(data)
 
     # Save the new Pet to the database
@@ -128,7 +263,53 @@ def create_pets():
 
     # Return the location of the new Pet
     location_url = url_for("get_pets", pet_id=pet.id, _external=True)
-    return jsonify(pet.serialize()), status.HTTP_201_CREATED, {"Location": location_url}
+    response = set_validators(jsonify(pet.serialize()), pet.etag, pet.last_updated)
+    return response, status.HTTP_201_CREATED, {"Location": location_url}
+
+
+######################################################################
+# CREATE MANY PETS
+######################################################################
+@app.route("/pets/bulk", methods=["POST"])
+def bulk_create_pets():
+    """
+    Create many Pets
+
+    This endpoint accepts either a JSON array of Pets or a stream of newline
+    delimited JSON (NDJSON) Pets. Each Pet is validated on its own and the
+    valid ones are saved in batches of BULK_BATCH_SIZE per transaction. The
+    response lists the outcome for every Pet in the order they were sent.
+    """
+    app.logger.info("Request to Bulk Create Pets...")
+    if request.headers.get("Content-Type") == NDJSON_MIMETYPE:
+        items = read_ndjson(request.stream)
+    else:
+        check_content_type("application/json")
+        items = request.get_json()
+        if not isinstance(items, list):
+            abort(status.HTTP_400_BAD_REQUEST, "Body must be a JSON array of pets")
+
+    batch_size = app.config["BULK_BATCH_SIZE"]
+    results = []
+    batch = []
+    for position, item in enumerate(items):
+        try:
+            if isinstance(item, DataValidationError):
+                raise item
+            batch.append((position, Pet().deserialize(item)))
+        except DataValidationError as error:
+            results.append({"index": position, "status": status.HTTP_400_BAD_REQUEST, "error": str(error)})
+        if len(batch) >= batch_size:
+            results += save_batch(batch)
+            batch = []
+    results += save_batch(batch)
+    results.sort(key=lambda result: result["index"])
+
+    created = sum(1 for result in results if result["status"] == status.HTTP_201_CREATED)
+    app.logger.info("[%d] of [%d] Pets created", created, len(results))
+    if created == len(results):
+        return jsonify(results), status.HTTP_201_CREATED
+    return jsonify(results), status.HTTP_207_MULTI_STATUS
 
 
 ######################################################################
@@ -144,21 +325,25 @@ def update_pets(pet_id):
     app.logger.info("Request to Update a pet with id [%s]", pet_id)
     check_content_type("application/json")
 
-    # Attempt to find the Pet and abort if not found
-    pet = Pet.find(pet_id)
-    if not pet:
-        abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
+    # Only update the version of the Pet the client has seen
+    version = get_if_match_version(pet_id)
 
-    # Update the Pet with the new data
+    # Get the new data from the request and deserialize it
     data = request.get_json()
-    app.logger.info("Processing: %s", data)
-    pet.deserialize(data)
+    app.logger.debug("Processing: %s", data)
+    changes = Pet().deserialize(data)
 
-    # Save the updates to the database
-    pet.update()
+    # Save the updates with a single UPDATE ... RETURNING, which also tells
+    # why the update failed
+    pet, current = Pet.update_by_id(pet_id, changes.values(), version)
+    if not pet:
+        if not current:
+            abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
+        abort(status.HTTP_412_PRECONDITION_FAILED, f"Pet with id '{pet_id}' has been changed.")
 
     app.logger.info("Pet with ID: %d updated.", pet.id)
-    return jsonify(pet.serialize()), status.HTTP_200_OK
+    response = set_validators(jsonify(pet.serialize()), pet.etag, pet.last_updated)
+    return response, status.HTTP_200_OK
 
 
 ######################################################################
@@ -183,40 +368,339 @@ def delete_pets(pet_id):
     return {}, status.HTTP_204_NO_CONTENT
 
 
+######################################################################
+# UPDATE MANY PETS
+######################################################################
+@app.route("/pets", methods=["PATCH"])
+def bulk_update_pets():
+    """
+    Update many Pets
+
+    This endpoint sets the attributes in the body on every Pet that matches
+    the query string filters, using a single UPDATE statement
+    """
+    app.logger.info("Request to Bulk Update Pets...")
+    check_content_type("application/json")
+    filters = get_bulk_filters()
+    values = Pet.deserialize_values(request.get_json())
+
+    count = Pet.update_where(values, **filters)
+    app.logger.info("[%d] Pets updated.", count)
+    return jsonify(count=count), status.HTTP_200_OK
+
+
+######################################################################
+# DELETE MANY PETS
+######################################################################
+@app.route("/pets", methods=["DELETE"])
+def bulk_delete_pets():
+    """
+    Delete many Pets
+
+    This endpoint deletes every Pet that matches the query string filters
+    using a single DELETE statement
+    """
+    app.logger.info("Request to Bulk Delete Pets...")
+    filters = get_bulk_filters()
+
+    count = Pet.delete_where(**filters)
+    app.logger.info("[%d] Pets deleted.", count)
+    return jsonify(count=count), status.HTTP_200_OK
+
+
 ######################################################################
 # PURCHASE A PET
 ######################################################################
 @app.route("/pets/<int:pet_id>/purchase", methods=["PUT"])
 def purchase_pets(pet_id):
-    """Purchasing a Pet makes it unavailable"""
+    """Purchasing a Pet makes it unavailable
+
+    The purchase is a single conditional update, so only one of several
+    concurrent purchases of the same Pet can succeed. Send If-Match with the
+    ETag of the Pet to only purchase it if it has not changed.
+    """
     app.logger.info("Request to purchase pet with id: %d", pet_id)
+    version = get_if_match_version(pet_id)
 
-    # Attempt to find the Pet and abort if not found
-    pet = Pet.find(pet_id)
+    # At this point you would execute code to purchase the pet
+    # For the moment, we will just set them to unavailable
+    pet, current = Pet.purchase(pet_id, version)
     if not pet:
-        abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
-
-    # you can only purchase pets that are available
-    if not pet.available:
+        if not current:
+            abort(status.HTTP_404_NOT_FOUND, f"Pet with id '{pet_id}' was not found.")
+        if version is not None and current[0] != version:
+            abort(status.HTTP_412_PRECONDITION_FAILED, f"Pet with id '{pet_id}' has been changed.")
+        # you can only purchase pets that are available, and a concurrent
+        # purchase may have made it unavailable after the statement began
         abort(
             status.HTTP_409_CONFLICT,
             f"Pet with id '{pet_id}' is not available.",
         )
 
-    # At this point you would execute code to purchase the pet
-    # For the moment, we will just set them to unavailable
-
-    pet.available = False
-    pet.update()
-
     app.logger.info("Pet with ID: %d has been purchased.", pet_id)
-    return pet.serialize(), status.HTTP_200_OK
+    response = set_validators(jsonify(pet.serialize()), pet.etag, pet.last_updated)
+    return response, status.HTTP_200_OK
 
 
 ######################################################################
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
 
+def get_filters() -> dict:
+    """Returns the Pet attribute filters from the query string"""
+    filters = {}
+    for field in ["name", "category", "q"]:
+        if request.args.get(field):
+            filters[field] = request.args[field]
+
+    available = request.args.get("available")
+    if available:
+        # create bool from string
+        filters["available"] = available.lower() in ["true", "yes", "1"]
+
+    try:
+        gender = request.args.get("gender")
+        if gender:
+            # create enum from string
+            filters["gender"] = Gender[gender.upper()]
+        for field in ["birthday_from", "birthday_to"]:
+            if request.args.get(field):
+                filters[field] = date.fromisoformat(request.args[field])
+    except (KeyError, ValueError) as error:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid filter value: {error}")
+
+    return filters
+
+
+def get_fields() -> list:
+    """Returns the fields asked for in the query string, or None for all"""
+    names = [name.strip() for name in request.args.get("fields", "").split(",") if name.strip()]
+    if not names:
+        return None
+    unknown = [name for name in names if name not in JSON_FIELDS]
+    if unknown:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def get_bulk_filters() -> dict:
+    """Returns the filters for a bulk operation
+
+    To guard against mistakes, a bulk operation on every Pet must be asked
+    for explicitly with all=true
+    """
+    filters = get_filters()
+    if not filters and request.args.get("all", "").lower() not in ["true", "yes", "1"]:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Bulk operations need a filter, or all=true to apply to every pet",
+        )
+    return filters
+
+
+def get_page_args() -> tuple:
+    """Returns the (after, limit) pagination arguments from the query string
+
+    The limit defaults to DEFAULT_PAGE_SIZE and is capped at MAX_PAGE_SIZE
+    so that no single request can load the whole table.
+    """
+    try:
+        after = decode_cursor(request.args["after"]) if "after" in request.args else None
+        limit = int(request.args.get("limit", app.config["DEFAULT_PAGE_SIZE"]))
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, "Pagination arguments 'after' and 'limit' are not valid")
+
+    if limit < 1:
+        abort(status.HTTP_400_BAD_REQUEST, "Pagination argument 'limit' must be positive")
+
+    return after, min(limit, app.config["MAX_PAGE_SIZE"])
+
+
+def encode_cursor(pet) -> str:
+    """Returns the cursor that points at a Pet or a row of selected fields
+
+    Listings sorted by id use the id itself. Other sort orders need the
+    sort value too, which is packed into an opaque url-safe token.
+    """
+    field = request.args.get("sort", "id").lstrip("-")
+    if field == "id":
+        return str(pet.id)
+    value = getattr(pet, field)
+    if isinstance(value, date):
+        value = value.isoformat()
+    token = json.dumps([value, pet.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(token).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """Returns the model cursor for a cursor made by encode_cursor()
+
+    Raises ValueError if the cursor is not valid for the sort order
+    """
+    field = request.args.get("sort", "id").lstrip("-")
+    if field == "id":
+        after = int(cursor)
+        if not 0 <= after <= MAX_PET_ID:
+            raise ValueError(f"cursor must be between 0 and {MAX_PET_ID}")
+        return after
+    try:
+        value, pet_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if field == "birthday":
+            value = date.fromisoformat(value)
+        elif not isinstance(value, str):
+            raise ValueError(f"cursor value must be a string for {field}")
+        if not isinstance(pet_id, int) or isinstance(pet_id, bool) or not 0 <= pet_id <= MAX_PET_ID:
+            raise ValueError("cursor id is out of range")
+        return value, pet_id
+    except (TypeError, binascii.Error, UnicodeError) as error:
+        raise ValueError("malformed cursor") from error
+
+
+def get_page(pets: list, limit: int) -> tuple:
+    """Trims the Pets to a page and returns it with its next page headers
+
+    The query is expected to have fetched one row more than the limit so
+    that the presence of a next page is known without counting rows.
+    """
+    headers = {}
+    if len(pets) > limit:
+        pets = pets[:limit]
+        next_cursor = encode_cursor(pets[-1])
+        next_args = request.args.to_dict()
+        next_args["after"] = next_cursor
+        next_url = url_for(request.endpoint, _external=True, **next_args)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+        headers["X-Next-Cursor"] = next_cursor
+    return pets, headers
+
+
+def is_stream_request() -> bool:
+    """Checks if the client asked for a streamed response"""
+    if request.args.get("stream", "").lower() in ["true", "yes", "1"]:
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def stream_pets(rows, fields: list = None) -> Response:
+    """Streams the Pets from rows without loading them all in memory
+
+    The rows from Pet.find_rows() are read in batches through a server-side
+    cursor and written out one at a time as either newline delimited JSON
+    or as the chunks of a single JSON array.
+    """
+    if fields:
+
+        def dump_pet(row) -> str:
+            return app.json.dumps(Pet.serialize_fields(row, fields))
+
+    else:
+        dump_pet = Pet.values_to_json
+    ndjson = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+    def generate_ndjson():
+        for pet in rows:
+            yield dump_pet(pet) + "\n"
+
+    def generate_json_array():
+        separator = "["
+        for pet in rows:
+            yield separator + dump_pet(pet)
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+
+    if ndjson:
+        return Response(stream_with_context(generate_ndjson()), mimetype=NDJSON_MIMETYPE)
+    return Response(stream_with_context(generate_json_array()), mimetype="application/json")
+
+
+def read_ndjson(stream):
+    """Reads newline delimited JSON one line at a time
+
+    Lines that are not valid JSON are returned as a DataValidationError so
+    they can be reported without stopping the rest of the stream.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield DataValidationError(f"Invalid JSON: {error}")
+
+
+def save_batch(batch: list) -> list:
+    """Saves a batch of (position, Pet) in one transaction and returns the results
+
+    When the database rejects the batch, its Pets are saved again one at a
+    time so that only the ones it rejects fail. The error of the database
+    is logged, not sent to the client.
+    """
+    try:
+        ids = Pet.bulk_create([pet for _, pet in batch])
+    except DataValidationError as error:
+        if len(batch) > 1:
+            app.logger.warning("Saving a batch of %d Pets one at a time: %s", len(batch), error)
+            return [result for item in batch for result in save_batch([item])]
+        app.logger.warning("Pet [%d] could not be saved: %s", batch[0][0], error)
+        return [{"index": batch[0][0], "status": status.HTTP_400_BAD_REQUEST, "error": "Invalid pet: it could not be saved"}]
+    return [
+        {"index": position, "status": status.HTTP_201_CREATED, "id": pet_id}
+        for (position, _), pet_id in zip(batch, ids)
+    ]
+
+
+def get_if_match_version(pet_id: int):
+    """Returns the Pet version required by If-Match, or None for any version
+
+    ETags are "<id>-<version>", so the version is read from the header
+    without looking the Pet up
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    for etag in request.if_match:
+        tag_id, _, tag_version = etag.partition("-")
+        if tag_id == str(pet_id) and tag_version.isdigit():
+            return int(tag_version)
+    abort(status.HTTP_412_PRECONDITION_FAILED, f"Pet with id '{pet_id}' has been changed.")
+
+
+def is_not_modified(etag: str, last_modified: datetime = None) -> bool:
+    """Checks the conditional request headers against a resource
+
+    If-None-Match takes precedence over If-Modified-Since when both are sent
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return as_utc(last_modified).replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def not_modified(etag: str, last_modified: datetime = None, weak: bool = False) -> Response:
+    """Returns a 304 Not Modified response with the validators"""
+    app.logger.info("Resource not modified: %s", etag)
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    return set_validators(response, etag, last_modified, weak)
+
+
+def set_validators(response: Response, etag: str, last_modified: datetime = None, weak: bool = False) -> Response:
+    """Sets the ETag and Last-Modified headers of a response
+
+    Partial representations, such as only some fields of a Pet, get a weak
+    ETag so that they can be revalidated but never match If-Match
+    """
+    response.set_etag(etag, weak)
+    if last_modified:
+        response.last_modified = as_utc(last_modified)
+    return response
+
+
+def as_utc(timestamp: datetime) -> datetime:
+    """Returns a timestamp from the database as an aware UTC datetime"""
+    return timestamp.replace(tzinfo=timezone.utc)
+
+
 def check_content_type(content_type) -> None:
     """Checks that the media type is correct"""
     if "Content-Type" not in request.headers:
@@ -194,7 +194,8 @@ $(function () {
         let queryString = ""
 
         if (name) {
-            queryString += 'name=' + name
+            // search the words of names and categories, best matches first
+            queryString += 'q=' + encodeURIComponent(name)
         }
         if (category) {
             if (queryString.length > 0) {
@@ -0,0 +1,173 @@
+"""
+Test cases for the Read-Through Cache
+"""
+import time
+import fnmatch
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from flask import Flask
+from service.common.cache import Cache, CacheBackend, LRUCache, NullCache, RedisCache
+
+
+class RedisStandIn:
+    """A local stand-in for a Redis client that keeps keys in a dict"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        """Returns the value of a key"""
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        """Sets the value of a key"""
+        self.data[key] = value.encode("utf-8")
+
+    def delete(self, *keys):
+        """Removes keys"""
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match="*"):
+        """Returns the keys that match a pattern"""
+        return [key for key in self.data if fnmatch.fnmatch(key, match)]
+
+
+######################################################################
+#  C A C H E   B A C K E N D   T E S T   C A S E S
+######################################################################
+class TestCacheBackends(TestCase):
+    """Cache Backend Tests"""
+
+    def test_lru_get_and_set(self):
+        """It should store and return values"""
+        backend = LRUCache()
+        self.assertIsNone(backend.get("a"))
+        backend.set("a", {"name": "fido"}, 60)
+        self.assertEqual(backend.get("a"), {"name": "fido"})
+        self.assertEqual(backend.size(), 1)
+        backend.delete("a")
+        self.assertIsNone(backend.get("a"))
+
+    def test_lru_evicts_least_recently_used(self):
+        """It should evict the least recently used value when full"""
+        backend = LRUCache(max_size=2)
+        backend.set("a", 1, 60)
+        backend.set("b", 2, 60)
+        backend.get("a")  # b is now the least recently used
+        backend.set("c", 3, 60)
+        self.assertEqual(backend.get("a"), 1)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("c"), 3)
+        backend.clear()
+        self.assertEqual(backend.size(), 0)
+
+    def test_lru_expires_values(self):
+        """It should not return values older than their ttl"""
+        backend = LRUCache()
+        backend.set("a", 1, 60)
+        with patch("service.common.cache.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(backend.get("a"))
+        self.assertEqual(backend.size(), 0)
+
+    def test_redis_backend(self):
+        """It should store values in a Redis compatible server"""
+        client = RedisStandIn()
+        backend = RedisCache(client=client, prefix="test:")
+        backend.set("a", {"name": "fido"}, 0.5)
+        self.assertEqual(backend.get("a"), {"name": "fido"})
+        self.assertIn("test:a", client.data)
+        backend.delete("a")
+        self.assertIsNone(backend.get("a"))
+        backend.set("b", 2, 60)
+        client.data["other:c"] = b"3"
+        backend.clear()
+        self.assertEqual(list(client.data), ["other:c"])
+        backend.clear()  # nothing left to clear
+        self.assertIsNone(backend.size())
+
+    def test_null_backend(self):
+        """It should not store anything"""
+        backend = NullCache()
+        backend.set("a", 1, 60)
+        self.assertIsNone(backend.get("a"))
+        backend.delete("a")
+        backend.clear()
+
+    def test_backend_interface(self):
+        """It should require backends to implement the interface"""
+        backend = CacheBackend()
+        self.assertRaises(NotImplementedError, backend.get, "a")
+        self.assertRaises(NotImplementedError, backend.set, "a", 1, 60)
+        self.assertRaises(NotImplementedError, backend.delete, "a")
+        self.assertRaises(NotImplementedError, backend.clear)
+
+
+######################################################################
+#  R E A D - T H R O U G H   C A C H E   T E S T   C A S E S
+######################################################################
+class TestCache(TestCase):
+    """Read-Through Cache Tests"""
+
+    def test_get_or_load(self):
+        """It should only call the loader on a miss"""
+        cache = Cache()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return {"name": "fido"}
+
+        self.assertEqual(cache.get_or_load("a", loader), {"name": "fido"})
+        self.assertEqual(cache.get_or_load("a", loader), {"name": "fido"})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        cache.delete("a")
+        cache.get_or_load("a", loader)
+        self.assertEqual(len(calls), 2)
+        cache.clear()
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_invalidated_while_loading(self):
+        """It should not cache a value whose key was invalidated as it loaded"""
+        cache = Cache()
+
+        def load_then_invalidate(invalidate):
+            def loader():
+                invalidate()  # e.g. an update committed by another thread
+                return {"name": "old"}
+
+            return loader
+
+        for invalidate in [lambda: cache.delete("a"), cache.clear]:
+            self.assertEqual(cache.get_or_load("a", load_then_invalidate(invalidate)), {"name": "old"})
+            self.assertEqual(cache.get_or_load("a", lambda: {"name": "new"}), {"name": "new"})
+            cache.delete("a")
+        # a load that fails leaves nothing behind
+        with self.assertRaises(RuntimeError):
+            cache.get_or_load("a", Mock(side_effect=RuntimeError))
+        self.assertEqual(cache.get_or_load("a", lambda: 1), 1)
+
+    def test_does_not_cache_none(self):
+        """It should not remember that a value was missing"""
+        cache = Cache()
+        self.assertIsNone(cache.get_or_load("a", lambda: None))
+        self.assertEqual(cache.get_or_load("a", lambda: 1), 1)
+
+    def test_init_app(self):
+        """It should create the backend from the app config"""
+        app = Flask(__name__)
+        cache = Cache()
+        app.config.update(CACHE_BACKEND="none", CACHE_TTL=5)
+        cache.init_app(app)
+        self.assertIsInstance(cache.backend, NullCache)
+        self.assertEqual(cache.ttl, 5)
+        app.config.update(CACHE_BACKEND="lru", CACHE_MAX_SIZE=10)
+        cache.init_app(app)
+        self.assertIsInstance(cache.backend, LRUCache)
+        self.assertEqual(cache.backend.max_size, 10)
+        app.config.update(CACHE_BACKEND="redis", CACHE_REDIS_URL="redis://localhost:6379/0")
+        with patch("service.common.cache.RedisCache") as redis_mock:
+            cache.init_app(app)
+            redis_mock.assert_called_once_with("redis://localhost:6379/0")
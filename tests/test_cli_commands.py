@@ -9,7 +9,7 @@ from click.testing import CliRunner
 
 # pylint: disable=unused-import
 from wsgi import app  # noqa: F401
-from service.common.cli_commands import db_create  # noqa: E402
+from service.common.cli_commands import db_create, db_migrate, refresh_stats  # noqa: E402
 
 
 class TestFlaskCLI(TestCase):
@@ -18,10 +18,33 @@ class TestFlaskCLI(TestCase):
     def setUp(self):
         self.runner = CliRunner()
 
+    @patch("service.common.cli_commands.migrations")
     @patch("service.common.cli_commands.db")
-    def test_db_create(self, db_mock):
+    def test_db_create(self, db_mock, migrations_mock):
         """It should call the db-create command"""
         db_mock.return_value = MagicMock()
         with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+            migrations_mock.upgrade.assert_called_once_with(db_mock.engine)
+
+    @patch("service.common.cli_commands.migrations")
+    @patch("service.common.cli_commands.db")
+    def test_db_migrate(self, db_mock, migrations_mock):
+        """It should call the db-migrate command"""
+        migrations_mock.upgrade.return_value = 2
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(db_migrate, ["--target", "2"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("version 2", result.output)
+            migrations_mock.upgrade.assert_called_once_with(db_mock.engine, target=2)
+
+    @patch("service.common.cli_commands.PetSummary")
+    def test_refresh_stats(self, summary_mock):
+        """It should call the refresh-stats command"""
+        summary_mock.refresh.return_value = 12
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(refresh_stats)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("12 groups", result.output)
+            summary_mock.refresh.assert_called_once_with()
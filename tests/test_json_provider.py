@@ -0,0 +1,58 @@
+"""
+Test cases for the JSON Providers
+"""
+from datetime import date, datetime
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from service.common import json_provider
+from service.common.json_provider import OrjsonProvider, PetJSONProvider, init_json
+
+NO_ORJSON = json_provider.orjson is None
+
+DOCUMENT = {"name": "Fido", "id": 1, "birthday": date(2020, 2, 29), "updated": datetime(2024, 1, 1, 12, 30)}
+
+
+######################################################################
+#  J S O N   P R O V I D E R   T E S T   C A S E S
+######################################################################
+class TestJSONProviders(TestCase):
+    """JSON Provider Tests"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.default = DefaultJSONProvider(self.app)
+
+    @skipIf(NO_ORJSON, "orjson is not installed")
+    def test_pretty_response(self):
+        """It should indent responses in debug mode"""
+        self.app.debug = True
+        provider = OrjsonProvider(self.app)
+        self.assertTrue(provider.is_pretty())
+        self.assertEqual(provider.response(DOCUMENT).get_data(), self.default.response(DOCUMENT).get_data())
+
+    @skipIf(NO_ORJSON, "orjson is not installed")
+    def test_orjson_provider(self):
+        """It should encode and decode like the default provider"""
+        provider = OrjsonProvider(self.app)
+        self.assertEqual(provider.dumps(DOCUMENT), self.default.dumps(DOCUMENT, separators=(",", ":")))
+        self.assertEqual(provider.loads(provider.dumps(DOCUMENT)), self.default.loads(self.default.dumps(DOCUMENT)))
+        self.assertEqual(provider.response(DOCUMENT).get_data(), self.default.response(DOCUMENT).get_data())
+        self.assertEqual(provider.dumps({"b": 1, "a": 2}, sort_keys=False), '{"b":1,"a":2}')
+        self.assertRaises(ValueError, provider.loads, "{")
+
+    @skipIf(NO_ORJSON, "orjson is not installed")
+    def test_init_json(self):
+        """It should pick the provider from JSON_BACKEND"""
+        for backend, provider in [("auto", OrjsonProvider), ("orjson", OrjsonProvider), ("stdlib", PetJSONProvider)]:
+            self.app.config["JSON_BACKEND"] = backend
+            init_json(self.app)
+            self.assertIsInstance(self.app.json, provider)
+
+    def test_init_json_without_orjson(self):
+        """It should fall back to the json module when orjson is missing"""
+        self.app.config["JSON_BACKEND"] = "orjson"
+        with patch.object(json_provider, "orjson", None):
+            init_json(self.app)
+        self.assertIs(type(self.app.json), PetJSONProvider)
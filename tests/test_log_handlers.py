@@ -0,0 +1,181 @@
+"""
+Test cases for the Log Handlers
+"""
+import sys
+import json
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from service.common import log_handlers
+from service.common.log_handlers import (
+    JsonFormatter, LogQueueHandler, LogQueue, RateLimitFilter, SamplingFilter, parse_sample_rates
+)
+
+
+class ListHandler(logging.Handler):
+    """Keeps the records it handles"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_record(msg="Pet %s", args=("fido",), level=logging.INFO, lineno=10, **extra):
+    """Returns a record as a logging call would create it"""
+    record = logging.LogRecord("flask.app", level, "routes.py", lineno, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+######################################################################
+#  F O R M A T T I N G   T E S T   C A S E S
+######################################################################
+class TestJsonFormatter(TestCase):
+    """JSON Formatter Tests"""
+
+    def test_format(self):
+        """It should write the record and its extra fields as JSON"""
+        entry = json.loads(JsonFormatter().format(make_record(attempt=2)))
+        self.assertEqual(entry["message"], "Pet fido")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "flask.app")
+        self.assertEqual(entry["attempt"], 2)
+        self.assertNotIn("args", entry)
+
+    def test_format_exception(self):
+        """It should add the traceback of an exception"""
+        record = make_record()
+        try:
+            raise ValueError("bad pet")
+        except ValueError:
+            record.exc_info = sys.exc_info()
+        record.stack_info = "Stack (most recent call last)"
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertIn("ValueError: bad pet", entry["exception"])
+        self.assertIn("Stack", entry["stack"])
+
+
+######################################################################
+#  Q U E U E   T E S T   C A S E S
+######################################################################
+class TestLogQueue(TestCase):
+    """Log Queue Tests"""
+
+    def test_prepare(self):
+        """It should merge the message with its arguments"""
+        record = make_record()
+        prepared = LogQueueHandler(None).prepare(record)
+        self.assertEqual(prepared.msg, "Pet fido")
+        self.assertIsNone(prepared.args)
+        self.assertEqual(record.args, ("fido",))
+
+    def test_start_and_stop(self):
+        """It should write the queued records from the listener thread"""
+        target = ListHandler()
+        log_queue = LogQueue()
+        handler = log_queue.start([target])
+        handler.handle(make_record())
+        log_queue.stop()
+        self.assertEqual([record.getMessage() for record in target.records], ["Pet fido"])
+        self.assertIsNone(log_queue.listener)
+        log_queue.stop()
+
+    def test_restart_after_fork(self):
+        """It should use a new queue and thread after a fork"""
+        target = ListHandler()
+        log_queue = LogQueue()
+        log_queue.restart_after_fork()
+        self.assertIsNone(log_queue.listener)
+        handler = log_queue.start([target])
+        old_queue = handler.queue
+        log_queue.restart_after_fork()
+        self.assertIsNot(handler.queue, old_queue)
+        handler.handle(make_record())
+        log_queue.stop()
+        self.assertEqual(len(target.records), 1)
+
+
+######################################################################
+#  R A T E   L I M I T I N G   T E S T   C A S E S
+######################################################################
+class TestRateLimitFilter(TestCase):
+    """Rate Limit and Sampling Tests"""
+
+    @patch("service.common.log_handlers.time.monotonic")
+    def test_rate_limit(self, monotonic_mock):
+        """It should drop the records of a busy call site and count them"""
+        monotonic_mock.return_value = 100.0
+        log_filter = RateLimitFilter(rate=2)
+        passed = [log_filter.filter(make_record()) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        # another call site has its own limit
+        self.assertTrue(log_filter.filter(make_record(lineno=20)))
+        # errors are never dropped
+        self.assertTrue(log_filter.filter(make_record(level=logging.ERROR)))
+        monotonic_mock.return_value = 101.0
+        record = make_record()
+        self.assertTrue(log_filter.filter(record))
+        self.assertEqual(record.getMessage(), "Pet fido (3 similar messages suppressed)")
+        self.assertEqual(record.suppressed, 3)
+
+    @patch("service.common.log_handlers.random.random", return_value=0.5)
+    def test_sampling(self, _):
+        """It should keep a fraction of the records below WARNING"""
+        self.assertFalse(SamplingFilter(0.1).filter(make_record()))
+        self.assertTrue(SamplingFilter(0.9).filter(make_record()))
+        self.assertTrue(SamplingFilter(0.1).filter(make_record(level=logging.WARNING)))
+
+    def test_parse_sample_rates(self):
+        """It should parse the rates of each logger"""
+        self.assertEqual(parse_sample_rates(""), {})
+        self.assertEqual(
+            parse_sample_rates("flask.app=0.1, gunicorn.access=0.01"),
+            {"flask.app": 0.1, "gunicorn.access": 0.01},
+        )
+
+
+######################################################################
+#  I N I T   L O G G I N G   T E S T   C A S E S
+######################################################################
+class TestInitLogging(TestCase):
+    """Init Logging Tests"""
+
+    def setUp(self):
+        self.target = ListHandler()
+        self.source = logging.getLogger("test.gunicorn")
+        self.source.handlers = [self.target]
+        self.source.setLevel(logging.INFO)
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        log_handlers.log_queue.stop()
+        self.source.handlers = []
+        for name in ("flask.app", "test.sampled", self.app.logger.name):
+            logger = logging.getLogger(name)
+            for log_filter in list(logger.filters):
+                logger.removeFilter(log_filter)
+
+    def test_json_queue(self):
+        """It should write JSON through the queue"""
+        self.app.config.update(LOG_FORMAT="json", LOG_QUEUE=True, LOG_RATE_LIMIT=0)
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        self.assertIsInstance(self.app.logger.handlers[0], LogQueueHandler)
+        self.app.logger.info("Pet %s", "fido", extra={"pet_id": 3})
+        log_handlers.log_queue.stop()
+        entry = json.loads(self.target.format(self.target.records[-1]))
+        self.assertEqual(entry["message"], "Pet fido")
+        self.assertEqual(entry["pet_id"], 3)
+
+    def test_filters(self):
+        """It should add the filters once however many times it runs"""
+        self.app.config.update(LOG_QUEUE=False, LOG_RATE_LIMIT=5, LOG_SAMPLE_RATES="test.sampled=0.5")
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        self.assertEqual(self.app.logger.handlers, [self.target])
+        self.assertEqual(len(self.app.logger.filters), 1)
+        self.assertEqual(len(logging.getLogger("test.sampled").filters), 1)
+        self.assertEqual(self.target.records[-1].getMessage(), "Logging handler established")
@@ -0,0 +1,113 @@
+"""
+Test cases for the Service Metrics
+"""
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from sqlalchemy import create_engine, text
+from service.common.metrics import Metrics, format_labels
+
+
+######################################################################
+#  M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestMetrics(TestCase):
+    """Service Metrics Tests"""
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_format_labels(self):
+        """It should format labels sorted by name"""
+        self.assertEqual(format_labels(route="/pets", method="GET"), 'method="GET",route="/pets"')
+
+    def test_render_counters(self):
+        """It should render counters and gauges"""
+        self.metrics.inc("http_requests_total", format_labels(method="GET", route="/pets", status=200))
+        self.metrics.inc("http_requests_total", format_labels(method="GET", route="/pets", status=200))
+        self.metrics.inc("http_requests_in_flight", "")
+        output = self.metrics.render()
+        self.assertIn("# TYPE http_requests_total counter", output)
+        self.assertIn('http_requests_total{method="GET",route="/pets",status="200"} 2', output)
+        self.assertIn("http_requests_in_flight 1", output)
+
+    def test_render_histograms(self):
+        """It should render cumulative histogram buckets"""
+        labels = format_labels(operation="SELECT")
+        self.metrics.observe("db_query_duration_seconds", labels, 0.002)
+        self.metrics.observe("db_query_duration_seconds", labels, 0.2)
+        output = self.metrics.render()
+        self.assertIn('db_query_duration_seconds_bucket{operation="SELECT",le="0.001"} 0', output)
+        self.assertIn('db_query_duration_seconds_bucket{operation="SELECT",le="0.0025"} 1', output)
+        self.assertIn('db_query_duration_seconds_bucket{operation="SELECT",le="0.25"} 2', output)
+        self.assertIn('db_query_duration_seconds_bucket{operation="SELECT",le="+Inf"} 2', output)
+        self.assertIn('db_query_duration_seconds_count{operation="SELECT"} 2', output)
+
+    def test_request_hooks(self):
+        """It should count requests by route and status"""
+        app = Flask(__name__)
+        app.add_url_rule("/pets/<int:pet_id>", "get_pet", lambda pet_id: ("", 204))
+        self.metrics.init_app(app)
+        client = app.test_client()
+        client.get("/pets/1")
+        client.get("/pets/2")
+        client.get("/nowhere")
+        samples = self.metrics.collect()
+        requests = samples["http_requests_total"]
+        self.assertEqual(requests[format_labels(method="GET", route="/pets/<int:pet_id>", status=204)], 2)
+        self.assertEqual(requests[format_labels(method="GET", route="<unmatched>", status=404)], 1)
+        self.assertEqual(samples["http_requests_in_flight"][""], 0)
+        latency = samples["http_request_duration_seconds"][format_labels(method="GET", route="/pets/<int:pet_id>")]
+        self.assertEqual(latency["count"], 2)
+
+    def test_query_timing(self):
+        """It should time database statements by operation"""
+        engine = create_engine("sqlite://")
+        self.metrics.instrument(engine)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("select 2"))
+        samples = self.metrics.collect()["db_query_duration_seconds"]
+        self.assertEqual(samples[format_labels(operation="SELECT")]["count"], 2)
+
+    def test_multiple_processes(self):
+        """It should add up the metrics of every worker process"""
+        with tempfile.TemporaryDirectory() as directory:
+            app = Flask(__name__)
+            app.config["METRICS_MULTIPROC_DIR"] = directory
+            labels = format_labels(method="GET", route="/pets", status=200)
+            workers = []
+            for pid in (101, 102):
+                worker = Metrics()
+                worker.init_app(app)
+                worker.inc("http_requests_total", labels, pid - 100)
+                worker.inc("http_requests_in_flight", "")
+                worker.observe("http_request_duration_seconds", "", 0.1)
+                with patch("os.getpid", return_value=pid):
+                    worker.flush()
+                workers.append(worker)
+            # a damaged file is skipped
+            with open(os.path.join(directory, "metrics_999.json"), "w", encoding="utf-8") as file:
+                file.write("{")
+
+            workers[0].mark_process_dead(102)
+            workers[0].mark_process_dead(103)
+            with patch("os.getpid", return_value=101):
+                samples = workers[0].collect()
+            self.assertEqual(samples["http_requests_total"][labels], 3)
+            self.assertEqual(samples["http_requests_in_flight"][""], 1)
+            self.assertEqual(samples["http_request_duration_seconds"][""]["count"], 2)
+            # the dead worker's counters were moved to the archive
+            self.assertNotIn("metrics_102.json", os.listdir(directory))
+            self.assertIn("metrics_archive.json", os.listdir(directory))
+            workers[0].mark_process_dead(101)
+            reader = Metrics()
+            reader.init_app(app)
+            with patch("os.getpid", return_value=104):
+                self.assertEqual(reader.collect()["http_requests_total"][labels], 3)
+
+            # a new run starts from an empty directory
+            workers[0].clear_directory()
+            self.assertEqual(os.listdir(directory), [])
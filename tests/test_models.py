@@ -16,12 +16,13 @@
 Test cases for Pet Model
 """
 import os
+import json
 import logging
 from unittest import TestCase
 from unittest.mock import patch
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
 from wsgi import app
-from service.models import Pet, Gender, DataValidationError, db
+from service.models import Pet, PetSummary, Gender, DataValidationError, DataConflictError, JSON_FIELDS, db
 from tests.factories import PetFactory
 
 DATABASE_URI = os.getenv(
@@ -53,6 +54,7 @@ class TestCaseBase(TestCase):
     def setUp(self):
         """This runs before each test"""
         db.session.query(Pet).delete()  # clean up the last tests
+        db.session.query(PetSummary).delete()
         db.session.commit()
 
     def tearDown(self):
@@ -63,7 +65,7 @@ class TestCaseBase(TestCase):
 ######################################################################
 #  P E T   M O D E L   T E S T   C A S E S
 ######################################################################
-class TestPetModel(TestCaseBase):
+class TestPetModel(TestCaseBase):  # pylint: disable=too-many-public-methods
     """Pet Model CRUD Tests"""
 
     ######################################################################
@@ -110,6 +112,15 @@ class TestPetModel(TestCaseBase):
         self.assertEqual(found_pet.name, pet.name)
         self.assertEqual(found_pet.category, pet.category)
 
+    def test_bulk_create_pets(self):
+        """It should Create many Pets at once"""
+        pets = PetFactory.create_batch(5)
+        ids = Pet.bulk_create(pets)
+        self.assertEqual(len(ids), 5)
+        for pet_id, pet in zip(ids, pets):
+            self.assertEqual(Pet.find(pet_id).name, pet.name)
+        self.assertEqual(Pet.bulk_create([]), [])
+
     def test_update_a_pet(self):
         """It should Update a Pet"""
         pet = PetFactory()
@@ -131,6 +142,59 @@ class TestPetModel(TestCaseBase):
         self.assertEqual(pets[0].id, original_id)
         self.assertEqual(pets[0].category, "k9")
 
+    def test_update_increments_version(self):
+        """It should increment the version of a Pet on every update"""
+        pet = PetFactory()
+        pet.create()
+        self.assertEqual(pet.version, 1)
+        self.assertEqual(pet.etag, f"{pet.id}-1")
+        pet.name = "Changed"
+        pet.update()
+        self.assertEqual(pet.version, 2)
+
+    def test_update_conflict(self):
+        """It should not Update a Pet that was changed by someone else"""
+        pet = PetFactory()
+        pet.create()
+        pet = Pet.find(pet.id)
+        # someone else updates the pet behind our back
+        db.session.execute(
+            db.update(Pet).where(Pet.id == pet.id).values(version=Pet.version + 1),
+            execution_options={"synchronize_session": False},
+        )
+        pet.name = "Changed"
+        self.assertRaises(DataConflictError, pet.update)
+
+    def test_delete_conflict(self):
+        """It should not Delete a Pet that was changed by someone else"""
+        pet = PetFactory()
+        pet.create()
+        pet = Pet.find(pet.id)
+        db.session.execute(
+            db.update(Pet).where(Pet.id == pet.id).values(version=Pet.version + 1),
+            execution_options={"synchronize_session": False},
+        )
+        self.assertRaises(DataConflictError, pet.delete)
+
+    def test_purchase_a_pet(self):
+        """It should Purchase an available Pet only once"""
+        pet = PetFactory(available=True)
+        pet.create()
+        purchased, current = Pet.purchase(pet.id)
+        self.assertFalse(purchased.available)
+        self.assertEqual(purchased.version, 2)
+        if db.engine.dialect.name == "postgresql":
+            self.assertEqual(current, (1, True))
+        # it is no longer available
+        self.assertEqual(Pet.purchase(pet.id), (None, (2, False)))
+
+    def test_purchase_a_pet_version(self):
+        """It should only Purchase a Pet at the expected version"""
+        pet = PetFactory(available=True)
+        pet.create()
+        self.assertEqual(Pet.purchase(pet.id, version=5), (None, (1, True)))
+        self.assertIsNotNone(Pet.purchase(pet.id, version=1)[0])
+
     def test_update_no_id(self):
         """It should not Update a Pet with no id"""
         pet = PetFactory()
@@ -138,6 +202,34 @@ class TestPetModel(TestCaseBase):
         pet.id = None
         self.assertRaises(DataValidationError, pet.update)
 
+    def test_update_by_id(self):
+        """It should Update a Pet by id without reading it first"""
+        pet = PetFactory()
+        pet.create()
+        available = pet.available
+        changes = PetFactory().values()
+        updated, current = Pet.update_by_id(pet.id, changes, version=1)
+        self.assertEqual(updated.values(), changes)
+        self.assertEqual(updated.version, 2)
+        if db.engine.dialect.name == "postgresql":
+            self.assertEqual(current, (1, available))
+        # a stale version or a missing Pet updates nothing
+        self.assertEqual(Pet.update_by_id(pet.id, changes, version=1), (None, (2, changes["available"])))
+        self.assertEqual(Pet.update_by_id(0, changes), (None, None))
+        self.assertEqual(Pet.find(pet.id).version, 2)
+
+    def test_update_by_id_other_databases(self):
+        """It should read why an update failed with a second query on other databases"""
+        pet = PetFactory()
+        pet.create()
+        changes = PetFactory().values()
+        with patch.object(db.engine.dialect, "name", "sqlite"):
+            self.assertEqual(Pet.update_by_id(pet.id, changes, version=5), (None, (1, pet.available)))
+            self.assertEqual(Pet.update_by_id(0, changes), (None, None))
+            updated, current = Pet.update_by_id(pet.id, changes, version=1)
+        self.assertEqual(updated.version, 2)
+        self.assertIsNone(current)
+
     def test_delete_a_pet(self):
         """It should Delete a Pet"""
         pet = PetFactory()
@@ -147,6 +239,24 @@ class TestPetModel(TestCaseBase):
         pet.delete()
         self.assertEqual(len(Pet.all()), 0)
 
+    def test_update_where(self):
+        """It should Update every Pet that matches the filters"""
+        for pet in PetFactory.create_batch(6):
+            pet.create()
+        available = Pet.find_by_availability(True).count()
+        count = Pet.update_where({"category": "k9"}, available=True)
+        self.assertEqual(count, available)
+        self.assertEqual(Pet.find_by_attributes(category="k9", available=True).count(), available)
+
+    def test_delete_where(self):
+        """It should Delete every Pet that matches the filters"""
+        for pet in PetFactory.create_batch(6):
+            pet.create()
+        available = Pet.find_by_availability(True).count()
+        self.assertEqual(Pet.delete_where(available=True), available)
+        self.assertEqual(len(Pet.all()), 6 - available)
+        self.assertEqual(Pet.delete_where(), 6 - available)
+
     def test_list_all_pets(self):
         """It should List all Pets in the database"""
         pets = Pet.all()
@@ -177,6 +287,14 @@ class TestPetModel(TestCaseBase):
         self.assertIn("birthday", data)
         self.assertEqual(date.fromisoformat(data["birthday"]), pet.birthday)
 
+    def test_serialize_values_to_json(self):
+        """It should serialize the values of a Pet straight to JSON text"""
+        for name in ["Fido", 'Say "hi"\\', "Fañch 🐕"]:
+            pet = PetFactory(id=7, name=name)
+            values = tuple(getattr(pet, field) for field in JSON_FIELDS)
+            expected = json.dumps(pet.serialize(), sort_keys=True, separators=(",", ":"))
+            self.assertEqual(Pet.values_to_json(values), expected)
+
     def test_deserialize_a_pet(self):
         """It should de-serialize a Pet"""
         data = PetFactory().serialize()
@@ -210,6 +328,19 @@ class TestPetModel(TestCaseBase):
         pet = Pet()
         self.assertRaises(DataValidationError, pet.deserialize, data)
 
+    def test_deserialize_bad_name(self):
+        """It should not deserialize a name that is not a short string"""
+        data = PetFactory().serialize()
+        for name in [None, 7, "x" * 64]:
+            data["name"] = name
+            self.assertRaises(DataValidationError, Pet().deserialize, data)
+
+    def test_deserialize_bad_birthday(self):
+        """It should not deserialize a birthday that is not a date"""
+        data = PetFactory().serialize()
+        data["birthday"] = "2020-13-01"
+        self.assertRaises(DataValidationError, Pet().deserialize, data)
+
     def test_deserialize_bad_gender(self):
         """It should not deserialize a bad gender attribute"""
         test_pet = PetFactory()
@@ -232,6 +363,13 @@ class TestExceptionHandlers(TestCaseBase):
         pet = PetFactory()
         self.assertRaises(DataValidationError, pet.create)
 
+    @patch("service.models.db.session.commit")
+    def test_bulk_create_exception(self, exception_mock):
+        """It should catch a bulk create exception"""
+        exception_mock.side_effect = Exception()
+        pets = PetFactory.create_batch(2)
+        self.assertRaises(DataValidationError, Pet.bulk_create, pets)
+
     @patch("service.models.db.session.commit")
     def test_update_exception(self, exception_mock):
         """It should catch a update exception"""
@@ -239,6 +377,30 @@ class TestExceptionHandlers(TestCaseBase):
         pet = PetFactory()
         self.assertRaises(DataValidationError, pet.update)
 
+    @patch("service.models.db.session.commit")
+    def test_purchase_exception(self, exception_mock):
+        """It should catch a purchase exception"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Pet.purchase, 0)
+
+    @patch("service.models.db.session.commit")
+    def test_update_where_exception(self, exception_mock):
+        """It should catch a bulk update exception"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Pet.update_where, {"available": True}, name="fido")
+
+    @patch("service.models.db.session.commit")
+    def test_delete_where_exception(self, exception_mock):
+        """It should catch a bulk delete exception"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Pet.delete_where, name="fido")
+
+    @patch("service.models.db.session.commit")
+    def test_refresh_summary_exception(self, exception_mock):
+        """It should catch a pet summary refresh exception"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, PetSummary.refresh)
+
     @patch("service.models.db.session.commit")
     def test_delete_exception(self, exception_mock):
         """It should catch a delete exception"""
@@ -270,6 +432,39 @@ class TestModelQueries(TestCaseBase):
         self.assertEqual(pet.gender, pets[1].gender)
         self.assertEqual(pet.birthday, pets[1].birthday)
 
+    def test_find_rows(self):
+        """It should find the same Pets as rows without the ORM"""
+        pets = PetFactory.create_batch(6)
+        for pet in pets:
+            pet.create()
+        for query in [{}, {"sort": "-birthday", "limit": 3}, {"category": pets[0].category, "available": True}]:
+            expected = [pet.serialize() for pet in Pet.find_by_attributes(**query)]
+            db.session.expunge_all()
+            rows = Pet.find_rows(**query)
+            self.assertEqual(len(db.session.identity_map), 0)
+            self.assertEqual(json.loads(Pet.rows_to_json(rows)), expected)
+            self.assertEqual([Pet.serialize_fields(row, JSON_FIELDS) for row in rows], expected)
+            streamed = Pet.find_rows(yield_per=2, **query)
+            self.assertEqual([row.id for row in streamed], [pet["id"] for pet in expected])
+
+    def test_find_rows_fields(self):
+        """It should only select some columns of Pets"""
+        pets = PetFactory.create_batch(3)
+        for pet in pets:
+            pet.create()
+        first = pets[0].serialize()
+        rows = Pet.find_rows(["name", "birthday"], sort="category")
+        self.assertEqual(rows[0]._fields, ("name", "birthday", "category", "id", "version", "last_updated"))
+        rows = Pet.find_rows(["name", "birthday"])
+        self.assertEqual(len(rows), 3)
+        self.assertNotIsInstance(rows[0], Pet)
+        self.assertEqual(
+            Pet.serialize_fields(rows[0], ["name", "birthday"]), {"name": first["name"], "birthday": first["birthday"]}
+        )
+        self.assertEqual(Pet.serialize_fields(Pet.find(first["id"]), ["gender"]), {"gender": first["gender"]})
+        self.assertRaises(DataValidationError, Pet.find_rows, ["color"])
+        self.assertRaises(DataValidationError, Pet.find_rows, ["name"], sort="color")
+
     def test_find_by_category(self):
         """It should Find Pets by Category"""
         pets = PetFactory.create_batch(10)
@@ -317,3 +512,179 @@ class TestModelQueries(TestCaseBase):
         self.assertEqual(found.count(), count)
         for pet in found:
             self.assertEqual(pet.gender, gender)
+
+    def test_find_with_cursor(self):
+        """It should page through Pets with a cursor"""
+        pets = PetFactory.create_batch(5)
+        for pet in pets:
+            pet.category = "dog"
+            pet.create()
+        ids = sorted(pet.id for pet in pets)
+        # first page
+        page = Pet.all(limit=2)
+        self.assertEqual([pet.id for pet in page], ids[:2])
+        # next page starts after the last id of the previous one
+        page = Pet.all(after=page[-1].id, limit=2)
+        self.assertEqual([pet.id for pet in page], ids[2:4])
+        # filtered queries accept the same cursor
+        found = Pet.find_by_category("dog", after=ids[3], limit=2)
+        self.assertEqual([pet.id for pet in found], ids[4:])
+
+    def test_find_by_attributes(self):
+        """It should Find Pets matching several attributes"""
+        pets = PetFactory.create_batch(20)
+        for pet in pets:
+            pet.create()
+        category = pets[0].category
+        gender = pets[0].gender
+        count = len([pet for pet in pets if pet.category == category and pet.gender == gender])
+        found = Pet.find_by_attributes(category=category, gender=gender)
+        self.assertEqual(found.count(), count)
+        for pet in found:
+            self.assertEqual(pet.category, category)
+            self.assertEqual(pet.gender, gender)
+        # no filters finds everything
+        self.assertEqual(Pet.find_by_attributes().count(), 20)
+
+    def test_find_by_attributes_sorted(self):
+        """It should Find Pets sorted by a field with a cursor"""
+        pets = PetFactory.create_batch(6)
+        for pet in pets:
+            pet.create()
+        expected = sorted(pets, key=lambda pet: (pet.birthday, pet.id))
+        found = Pet.find_by_attributes(sort="birthday", limit=3).all()
+        self.assertEqual([pet.id for pet in found], [pet.id for pet in expected[:3]])
+        last = found[-1]
+        found = Pet.find_by_attributes(sort="birthday", after=(last.birthday, last.id)).all()
+        self.assertEqual([pet.id for pet in found], [pet.id for pet in expected[3:]])
+        # descending ids
+        found = Pet.find_by_attributes(sort="-id", after=expected[0].id).all()
+        self.assertTrue(all(pet.id < expected[0].id for pet in found))
+
+    def test_find_by_attributes_bad_arguments(self):
+        """It should not Find Pets by an unknown field"""
+        self.assertRaises(DataValidationError, Pet.find_by_attributes, sort="weight")
+        self.assertRaises(DataValidationError, Pet.find_by_attributes, weight=10)
+        # None means the filter is not applied
+        self.assertEqual(Pet.find_by_attributes(name=None).count(), 0)
+
+    def test_count(self):
+        """It should Count the Pets matching some attributes"""
+        pets = PetFactory.create_batch(10)
+        Pet.bulk_create(pets)
+        category = pets[0].category
+        self.assertEqual(Pet.count(), 10)
+        self.assertEqual(Pet.count(category=category), len([pet for pet in pets if pet.category == category]))
+        self.assertEqual(Pet.count(name="no such pet"), 0)
+
+    def _create_search_pets(self) -> None:
+        Pet.bulk_create(
+            [
+                Pet(name=name, category=category, available=True, gender=Gender.MALE, birthday=date(2020, 1, 1))
+                for name, category in [("Big Fido", "dog"), ("fido", "dog"), ("fifi", "poodle"), ("kitty", "cat")]
+            ]
+        )
+
+    def test_search(self):
+        """It should Search the words of Pet names and categories"""
+        self._create_search_pets()
+        rows = Pet.find_rows(["name"], sort="relevance", q="fi")
+        self.assertEqual([row.name for row in rows], ["fido", "fifi", "Big Fido"])
+        self.assertEqual([row.name for row in Pet.find_rows(["name"], sort="relevance", q="big FI")], ["Big Fido"])
+        self.assertEqual(Pet.count(q="poo"), 1)
+        self.assertEqual(Pet.count(q="dog", name="fido"), 1)
+        self.assertEqual(len(Pet.find_rows(sort="relevance", limit=1, q="dog")), 1)
+        self.assertEqual(Pet.count(q="fido_dog"), 2)
+        self.assertRaises(DataValidationError, Pet.count, q="?!")
+        self.assertRaises(DataValidationError, Pet.count, q="x" * 64)
+        self.assertRaises(DataValidationError, Pet.find_rows, sort="relevance")
+        self.assertRaises(DataValidationError, Pet.find_rows, sort="relevance", after=1, q="fi")
+
+    def test_search_like(self):
+        """It should Search Pets with LIKE on databases without full-text search"""
+        self._create_search_pets()
+        with patch.object(Pet, "search_mode", return_value="like"):
+            rows = Pet.find_rows(["name"], sort="relevance", q="fi")
+            self.assertEqual([row.name for row in rows], ["fido", "fifi", "Big Fido"])
+            self.assertEqual(Pet.count(q="big fi"), 1)
+            self.assertEqual(Pet.count(q="ido"), 0)
+
+    def test_search_mode(self):
+        """It should look up the search mode of a database once"""
+        with patch.dict(Pet._search_modes, clear=True):  # pylint: disable=protected-access
+            mode = Pet.search_mode()
+            if db.engine.dialect.name == "postgresql":
+                self.assertIn(mode, ["trigram", "fulltext"])
+            else:
+                self.assertEqual(mode, "like")
+            with patch.object(db.session, "execute") as execute_mock:
+                self.assertEqual(Pet.search_mode(), mode)
+                execute_mock.assert_not_called()
+
+    def test_stats(self):
+        """It should Count the Pets by category, gender and availability"""
+        Pet.bulk_create(
+            [
+                Pet(name="fido", category="dog", available=True, gender=Gender.MALE, birthday=date(2020, 1, 1)),
+                Pet(name="rex", category="dog", available=False, gender=Gender.MALE, birthday=date(2021, 1, 1)),
+                Pet(name="kitty", category="cat", available=True, gender=Gender.FEMALE, birthday=date(2022, 1, 1)),
+            ]
+        )
+        stats = Pet.stats()
+        self.assertEqual(stats["count"], 3)
+        self.assertEqual(stats["category"], {"dog": 2, "cat": 1})
+        self.assertEqual(stats["gender"], {"MALE": 2, "FEMALE": 1, "UNKNOWN": 0})
+        self.assertEqual(stats["available"], {"true": 2, "false": 1})
+        self.assertEqual(stats["source"], "live")
+        # filters are applied before counting
+        stats = Pet.stats(category="dog", birthday_from=date(2021, 1, 1))
+        self.assertEqual(stats["count"], 1)
+        self.assertEqual(stats["available"], {"true": 0, "false": 1})
+
+
+######################################################################
+#  P E T   S U M M A R Y   T E S T   C A S E S
+######################################################################
+class TestPetSummary(TestCaseBase):
+    """Pet Summary Tests"""
+
+    def test_refresh(self):
+        """It should Refresh the summary with the counts of the Pets"""
+        self.assertEqual(repr(PetSummary(category="dog", gender=Gender.MALE, available=True, count=2)),
+                         "<PetSummary dog MALE available=True count=[2]>")
+        self.assertIsNone(PetSummary.stats())
+        Pet.bulk_create(PetFactory.create_batch(20))
+        groups = PetSummary.refresh()
+        self.assertEqual(groups, db.session.query(PetSummary).count())
+        live = Pet.stats()
+        summary = PetSummary.stats()
+        self.assertEqual(summary["source"], "summary")
+        self.assertIn("as_of", summary)
+        for name in ["count", "category", "gender", "available"]:
+            self.assertEqual(summary[name], live[name])
+        # the summary does not change until it is refreshed again
+        PetFactory().create()
+        self.assertEqual(PetSummary.stats()["count"], 20)
+        PetSummary.refresh()
+        self.assertEqual(PetSummary.stats()["count"], 21)
+
+    def test_stats_filters(self):
+        """It should answer only the filters that the summary has"""
+        pets = PetFactory.create_batch(20)
+        Pet.bulk_create(pets)
+        PetSummary.refresh()
+        category, gender = pets[0].category, pets[0].gender
+        stats = PetSummary.stats(category=category, gender=gender, available=None)
+        self.assertEqual(stats["count"], Pet.count(category=category, gender=gender))
+        self.assertIsNone(PetSummary.stats(name=pets[0].name))
+
+    def test_stats_too_old(self):
+        """It should not use a summary that is too old"""
+        Pet.bulk_create(PetFactory.create_batch(3))
+        PetSummary.refresh()
+        self.assertIsNotNone(PetSummary.stats(max_age=60))
+        refreshed_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=5)
+        db.session.query(PetSummary).update({"refreshed_at": refreshed_at})
+        db.session.commit()
+        self.assertIsNone(PetSummary.stats(max_age=60))
+        self.assertIsNotNone(PetSummary.stats())
@@ -0,0 +1,80 @@
+"""
+Test cases for the Connection Pool Metrics
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from service.common.pool_metrics import MeteredQueuePool, PoolMetrics, pool_metrics
+
+POOL_OPTIONS = {"pool_size": 2, "max_overflow": 1, "pool_timeout": 5, "pool_pre_ping": True}
+
+
+######################################################################
+#  P O O L   M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestPoolMetrics(TestCase):
+    """Connection Pool Metrics Tests"""
+
+    def setUp(self):
+        pool_metrics.reset()
+
+    def test_init_app(self):
+        """It should use the metered pool for server databases"""
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "postgresql+psycopg://localhost/petstore"
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = POOL_OPTIONS
+        PoolMetrics().init_app(app)
+        options = app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+        self.assertIs(options["poolclass"], MeteredQueuePool)
+        self.assertEqual(options["pool_size"], 2)
+        # the shared settings are not changed
+        self.assertNotIn("poolclass", POOL_OPTIONS)
+
+    def test_init_app_sqlite(self):
+        """It should drop the queue pool options for SQLite"""
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = POOL_OPTIONS
+        PoolMetrics().init_app(app)
+        self.assertEqual(app.config["SQLALCHEMY_ENGINE_OPTIONS"], {"pool_pre_ping": True})
+
+    def test_counts_checkouts(self):
+        """It should count connections and checkouts"""
+        engine = create_engine("sqlite://")
+        metrics = PoolMetrics()
+        self.assertIsNone(metrics.stats()["pool"])
+        metrics.instrument(engine)
+        for _ in range(3):
+            with engine.connect():
+                pass
+        stats = metrics.stats()
+        self.assertEqual(stats["connects"], 1)
+        self.assertEqual(stats["checkouts"], 3)
+        self.assertEqual(stats["checkins"], 3)
+        self.assertNotIn("size", stats)
+
+    def test_records_wait_time(self):
+        """It should record how long checkouts wait for a connection"""
+        pool = MeteredQueuePool(MagicMock, pool_size=1, max_overflow=0, timeout=0.01)
+        connection = pool.connect()
+        self.assertRaises(PoolTimeoutError, pool.connect)
+        connection.close()
+        stats = pool_metrics.stats()
+        self.assertEqual(stats["waits"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_seconds_max"], 0.01)
+        self.assertGreater(stats["wait_seconds_avg"], 0)
+
+    def test_queue_pool_state(self):
+        """It should report the state of a queue pool"""
+        engine = create_engine("sqlite://", poolclass=MeteredQueuePool, pool_size=3, max_overflow=2)
+        metrics = PoolMetrics()
+        metrics.instrument(engine)
+        with engine.connect():
+            stats = metrics.stats()
+        self.assertEqual(stats["pool"], "MeteredQueuePool")
+        self.assertEqual(stats["size"], 3)
+        self.assertEqual(stats["checked_out"], 1)
+        self.assertEqual(stats["max_overflow"], 2)
@@ -0,0 +1,54 @@
+"""
+Test cases for the Readiness Check
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+from service.common.readiness import ReadinessCheck
+
+
+######################################################################
+#  R E A D I N E S S   T E S T   C A S E S
+######################################################################
+class TestReadinessCheck(TestCase):
+    """Readiness Check Tests"""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=0)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_ready(self):
+        """It should be ready when the database answers"""
+        ready, checks = ReadinessCheck().check(self.engine)
+        self.assertTrue(ready)
+        self.assertEqual(checks["database"], "ok")
+        self.assertEqual(checks["pool"], {"capacity": 1, "in_use": 0})
+
+    def test_caches_result(self):
+        """It should reuse the result until it expires"""
+        check = ReadinessCheck(ttl=60)
+        check.check(self.engine)
+        with patch.object(ReadinessCheck, "_run") as run_mock:
+            check.check(self.engine)
+            run_mock.assert_not_called()
+            check.reset()
+            check.check(self.engine)
+            run_mock.assert_called_once()
+
+    def test_pool_exhausted(self):
+        """It should not be ready when no connection is free"""
+        with self.engine.connect():
+            ready, checks = ReadinessCheck().check(self.engine)
+        self.assertFalse(ready)
+        self.assertEqual(checks["database"], "skipped")
+
+    def test_database_unavailable(self):
+        """It should not be ready when the database does not answer"""
+        with patch.object(self.engine, "connect", side_effect=OperationalError("SELECT 1", {}, Exception())):
+            ready, checks = ReadinessCheck().check(self.engine)
+        self.assertFalse(ready)
+        self.assertEqual(checks["database"], "unavailable")
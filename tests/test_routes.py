@@ -15,19 +15,27 @@
 """
 Pet API Service Test Suite
 """
+# pylint: disable=too-many-lines
 
 import os
+import json
+import base64
 import logging
 from unittest import TestCase
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 
 # from unittest.mock import MagicMock, patch
 from urllib.parse import quote_plus
+from sqlalchemy import event
 from wsgi import app
 
 # from service import create_app
 from service.common import status
-from service.models import Pet, Gender, db, DataValidationError
+from service.models import Pet, PetSummary, Gender, db, DataValidationError, DataConflictError
+from service.common.cache import cache
 from tests.factories import PetFactory
 
 # Disable all but critical errors during normal test run
@@ -46,7 +54,7 @@ BASE_URL = "/pets"
 ######################################################################
 #  T E S T   P E T   S E R V I C E
 ######################################################################
-class TestPetService(TestCase):
+class TestPetService(TestCase):  # pylint: disable=too-many-public-methods
     """Pet Server Tests"""
 
     # pylint: disable=duplicate-code
@@ -69,7 +77,10 @@ class TestPetService(TestCase):
         """Runs before each test"""
         self.client = app.test_client()
         db.session.query(Pet).delete()  # clean up the last tests
+        db.session.query(PetSummary).delete()
         db.session.commit()
+        cache.clear()
+        cache.reset_stats()
 
     def tearDown(self):
         db.session.remove()
@@ -93,6 +104,25 @@ class TestPetService(TestCase):
             pets.append(test_pet)
         return pets
 
+    @staticmethod
+    def _cursor(value) -> str:
+        """Encodes a value as a keyset cursor, which may not be a valid one"""
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+    def _run_counting_statements(self, method: str, url: str, **kwargs) -> tuple:
+        """Sends a request and returns its response and the SQL it executed"""
+        statements = []
+
+        def record(conn, cursor, statement, *_):  # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            response = self.client.open(url, method=method, **kwargs)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return response, statements
+
     ######################################################################
     #  T E S T   C A S E S
     ######################################################################
@@ -111,6 +141,47 @@ class TestPetService(TestCase):
         self.assertEqual(data["status"], 200)
         self.assertEqual(data["message"], "Healthy")
 
+    def test_liveness(self):
+        """It should be alive"""
+        response = self.client.get("/live")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["message"], "Alive")
+
+    def test_readiness(self):
+        """It should be ready when the database answers"""
+        response = self.client.get("/ready")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["message"], "Ready")
+        self.assertEqual(data["checks"]["database"], "ok")
+
+    @patch("service.routes.readiness.check")
+    def test_not_ready(self, check_mock):
+        """It should not be ready when the database check fails"""
+        check_mock.return_value = (False, {"database": "unavailable"})
+        response = self.client.get("/ready")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.get_json()["checks"]["database"], "unavailable")
+
+    def test_pool_stats(self):
+        """It should return the connection pool statistics"""
+        self._create_pets(2)
+        response = self.client.get("/pool/stats")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertGreater(data["checkouts"], 0)
+        self.assertIn("wait_seconds_max", data)
+
+    def test_metrics(self):
+        """It should return the service metrics in the Prometheus format"""
+        self._create_pets(1)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="POST",route="/pets",status="201"}', text)
+        self.assertIn('db_query_duration_seconds_count{operation="INSERT"}', text)
+
     # ----------------------------------------------------------
     # TEST LIST
     # ----------------------------------------------------------
@@ -122,6 +193,113 @@ class TestPetService(TestCase):
         data = response.get_json()
         self.assertEqual(len(data), 5)
 
+    def test_get_pet_list_paged(self):
+        """It should Get a list of Pets one page at a time"""
+        pets = self._create_pets(5)
+        ids = sorted(pet.id for pet in pets)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([pet["id"] for pet in data], ids[:2])
+        self.assertEqual(response.headers["X-Next-Cursor"], str(ids[1]))
+        self.assertIn('rel="next"', response.headers["Link"])
+
+        # follow the next link to the last page
+        next_url = response.headers["Link"].split(";")[0].strip("<>")
+        response = self.client.get(next_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(BASE_URL, query_string=f"limit=2&after={ids[3]}")
+        data = response.get_json()
+        self.assertEqual([pet["id"] for pet in data], ids[4:])
+        self.assertNotIn("Link", response.headers)
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_get_pet_list_max_page_size(self):
+        """It should not return more than the maximum page size"""
+        self._create_pets(3)
+        max_page_size = app.config["MAX_PAGE_SIZE"]
+        app.config["MAX_PAGE_SIZE"] = 2
+        try:
+            response = self.client.get(BASE_URL, query_string="limit=100")
+        finally:
+            app.config["MAX_PAGE_SIZE"] = max_page_size
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertIn("X-Next-Cursor", response.headers)
+
+    def test_get_pet_list_bad_page_args(self):
+        """It should not Get a list of Pets with bad pagination arguments"""
+        for query_string in ["limit=0", "limit=ten", "after=-1", "after=abc", "after=99999999999"]:
+            response = self.client.get(BASE_URL, query_string=query_string)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_pet_list_conditional(self):
+        """It should not send a list of Pets again when it has not changed"""
+        pets = self._create_pets(3)
+        response = self.client.get(BASE_URL, query_string="limit=2")
+        etag = response.headers["ETag"]
+        response = self.client.get(BASE_URL, query_string="limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(response.data), 0)
+
+        # deleting a pet in the page changes the etag of the page
+        self.client.delete(f"{BASE_URL}/{pets[0].id}")
+        response = self.client.get(BASE_URL, query_string="limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_stream_pet_list_ndjson(self):
+        """It should stream a list of Pets as NDJSON"""
+        pets = self._create_pets(5)
+        response = self.client.get(BASE_URL, headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 5)
+        data = [json.loads(line) for line in lines]
+        self.assertEqual([pet["id"] for pet in data], sorted(pet.id for pet in pets))
+
+    def test_stream_pet_list_json(self):
+        """It should stream a list of Pets as a JSON array"""
+        pets = self._create_pets(4)
+        category = pets[0].category
+        count = len([pet for pet in pets if pet.category == category])
+        response = self.client.get(BASE_URL, query_string=f"stream=true&category={category}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/json")
+        data = response.get_json()
+        self.assertEqual(len(data), count)
+        for pet in data:
+            self.assertEqual(pet["category"], category)
+        # an explicit limit still applies to streams
+        response = self.client.get(BASE_URL, query_string="stream=true&limit=2")
+        self.assertEqual(len(response.get_json()), 2)
+
+    def test_stream_pets_in_batches(self):
+        """It should stream Pets that take several fetches of the cursor"""
+        self._create_pets(5)
+        batch_size = app.config["STREAM_BATCH_SIZE"]
+        app.config["STREAM_BATCH_SIZE"] = 2
+        try:
+            # in a new thread the request has an application context of its
+            # own, which is torn down before the stream is read, as in gunicorn
+            def stream():
+                response = self.client.get(BASE_URL, headers={"Accept": "application/x-ndjson"})
+                return response.status_code, response.get_data(as_text=True).splitlines()
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                status_code, lines = executor.submit(stream).result()
+        finally:
+            app.config["STREAM_BATCH_SIZE"] = batch_size
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(len(lines), 5)
+
+    def test_stream_empty_pet_list(self):
+        """It should stream an empty list of Pets"""
+        response = self.client.get(BASE_URL, query_string="stream=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), [])
+
     # ----------------------------------------------------------
     # TEST READ
     # ----------------------------------------------------------
@@ -134,6 +312,79 @@ class TestPetService(TestCase):
         data = response.get_json()
         self.assertEqual(data["name"], test_pet.name)
 
+    def test_get_pet_cached(self):
+        """It should Get a Pet from the cache until it changes"""
+        test_pet = self._create_pets(1)[0]
+        for _ in range(3):
+            response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = self.client.get("/cache/stats").get_json()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+
+        # writes invalidate the cached copy
+        data = response.get_json()
+        data["name"] = "Changed"
+        self.client.put(f"{BASE_URL}/{test_pet.id}", json=data)
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+        self.assertEqual(response.get_json()["name"], "Changed")
+        self.client.put(f"{BASE_URL}/{test_pet.id}/purchase")
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+        self.assertEqual(response.get_json()["available"], False)
+        self.client.patch(BASE_URL, query_string="all=true", json={"category": "bulk"})
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+        self.assertEqual(response.get_json()["category"], "bulk")
+        self.client.delete(f"{BASE_URL}/{test_pet.id}")
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_pet_conditional(self):
+        """It should not send a Pet again when it has not changed"""
+        test_pet = self._create_pets(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers["ETag"]
+        last_modified = response.last_modified
+        self.assertIsNotNone(last_modified)
+
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(response.data), 0)
+
+        future = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%a, %d %b %Y %H:%M:%S GMT")
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}", headers={"If-Modified-Since": future})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        past = (last_modified - timedelta(days=1)).strftime("%a, %d %b %Y %H:%M:%S GMT")
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}", headers={"If-Modified-Since": past})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # a change makes a new etag
+        data = response.get_json()
+        data["name"] = "Changed"
+        self.client.put(f"{BASE_URL}/{test_pet.id}", json=data)
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_get_pet_selected_fields(self):
+        """It should Get only the selected fields of a Pet"""
+        test_pet = self._create_pets(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}", query_string="fields=name,available")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"name": test_pet.name, "available": test_pet.available})
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+        response = self.client.get(
+            f"{BASE_URL}/{test_pet.id}", query_string="fields=name,available", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+        # a weak ETag never matches If-Match
+        data = test_pet.serialize()
+        response = self.client.put(f"{BASE_URL}/{test_pet.id}", json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
     def test_get_pet_not_found(self):
         """It should not Get a Pet thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -172,6 +423,88 @@ class TestPetService(TestCase):
         self.assertEqual(new_pet["available"], test_pet.available)
         self.assertEqual(new_pet["gender"], test_pet.gender.name)
 
+    def test_bulk_create_pets(self):
+        """It should Create many Pets from a JSON array"""
+        pets = [PetFactory().serialize() for _ in range(5)]
+        bulk_batch_size = app.config["BULK_BATCH_SIZE"]
+        app.config["BULK_BATCH_SIZE"] = 2
+        try:
+            response = self.client.post(f"{BASE_URL}/bulk", json=pets)
+        finally:
+            app.config["BULK_BATCH_SIZE"] = bulk_batch_size
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.get_json()
+        self.assertEqual([result["index"] for result in results], list(range(5)))
+        for pet, result in zip(pets, results):
+            self.assertEqual(result["status"], status.HTTP_201_CREATED)
+            response = self.client.get(f"{BASE_URL}/{result['id']}")
+            self.assertEqual(response.get_json()["name"], pet["name"])
+
+    def test_bulk_create_pets_ndjson(self):
+        """It should Create many Pets from an NDJSON stream"""
+        pets = [PetFactory().serialize() for _ in range(3)]
+        bad_pet = PetFactory().serialize()
+        bad_pet["available"] = "yes"
+        lines = [json.dumps(pet) for pet in pets] + ["", "{not json", json.dumps(bad_pet)]
+        response = self.client.post(
+            f"{BASE_URL}/bulk", data="\n".join(lines), content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.get_json()
+        self.assertEqual([result["status"] for result in results], [201, 201, 201, 400, 400])
+        self.assertIn("Invalid JSON", results[3]["error"])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 3)
+
+    def test_bulk_create_too_long(self):
+        """It should not Create the Pets with names too long for the column"""
+        pets = [PetFactory().serialize() for _ in range(2)]
+        pets[1]["name"] = "x" * 64
+        response = self.client.post(f"{BASE_URL}/bulk", json=pets)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.get_json()
+        self.assertEqual([result["status"] for result in results], [201, 400])
+        self.assertIn("longer than 63 characters", results[1]["error"])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 1)
+
+    def test_bulk_create_bad_date(self):
+        """It should not Create the Pets with birthdays that are not dates"""
+        pets = [PetFactory().serialize() for _ in range(3)]
+        pets[1]["birthday"] = "2020-13-01"
+        bulk_batch_size = app.config["BULK_BATCH_SIZE"]
+        app.config["BULK_BATCH_SIZE"] = 1
+        try:
+            response = self.client.post(f"{BASE_URL}/bulk", json=pets)
+        finally:
+            app.config["BULK_BATCH_SIZE"] = bulk_batch_size
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.get_json()
+        self.assertEqual([result["status"] for result in results], [201, 400, 201])
+        self.assertIn("Invalid pet", results[1]["error"])
+
+    def test_bulk_create_database_error(self):
+        """It should only fail the Pets of a batch that the database rejects"""
+        pets = [PetFactory().serialize() for _ in range(3)]
+        pets[1]["name"] = "rejected"
+        bulk_create = Pet.bulk_create
+
+        def reject(batch):
+            if any(pet.name == "rejected" for pet in batch):
+                raise DataValidationError("(psycopg.errors.CheckViolation) [SQL: INSERT INTO pet ...]")
+            return bulk_create(batch)
+
+        with patch.object(Pet, "bulk_create", side_effect=reject):
+            response = self.client.post(f"{BASE_URL}/bulk", json=pets)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.get_json()
+        self.assertEqual([result["status"] for result in results], [201, 400, 201])
+        self.assertNotIn("SQL", results[1]["error"])
+        self.assertEqual(len(self.client.get(BASE_URL).get_json()), 2)
+
+    def test_bulk_create_not_a_list(self):
+        """It should not Create many Pets from a JSON object"""
+        response = self.client.post(f"{BASE_URL}/bulk", json=PetFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # ----------------------------------------------------------
     # TEST UPDATE
     # ----------------------------------------------------------
@@ -191,6 +524,77 @@ class TestPetService(TestCase):
         updated_pet = response.get_json()
         self.assertEqual(updated_pet["category"], "unknown")
 
+    def test_update_pet_if_match(self):
+        """It should only Update a Pet that has not changed since it was read"""
+        test_pet = self._create_pets(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+        etag = response.headers["ETag"]
+        data = response.get_json()
+
+        data["name"] = "First"
+        response = self.client.put(f"{BASE_URL}/{test_pet.id}", json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        # the second writer still has the old etag
+        data["name"] = "Second"
+        response = self.client.put(f"{BASE_URL}/{test_pet.id}", json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.get(f"{BASE_URL}/{test_pet.id}")
+        self.assertEqual(response.get_json()["name"], "First")
+
+    def test_update_pet_not_found(self):
+        """It should not Update a Pet that does not exist"""
+        response = self.client.put(f"{BASE_URL}/0", json=PetFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_write_statements(self):
+        """It should write a Pet with a single SQL statement per request"""
+        # updates are UPDATE ... RETURNING in a CTE on Postgres
+        update = "WITH" if db.engine.dialect.name == "postgresql" else "UPDATE"
+        response, statements = self._run_counting_statements("POST", BASE_URL, json=PetFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([statement.split()[0] for statement in statements], ["INSERT"])
+
+        data = response.get_json()
+        data["name"], data["available"] = "Renamed", True
+        response, statements = self._run_counting_statements("PUT", f"{BASE_URL}/{data['id']}", json=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], "Renamed")
+        self.assertEqual([statement.split()[0] for statement in statements], [update])
+
+        response, statements = self._run_counting_statements("PUT", f"{BASE_URL}/{data['id']}/purchase")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([statement.split()[0] for statement in statements], [update])
+        self.assertEqual(response.headers["ETag"], f'"{data["id"]}-3"')
+
+    def test_write_failure_statements(self):
+        """It should tell why a write failed from the statement that tried it"""
+        # other databases look the Pet up with a second statement
+        count = 1 if db.engine.dialect.name == "postgresql" else 2
+        data = self.client.post(BASE_URL, json=PetFactory(available=False).serialize()).get_json()
+        stale = {"If-Match": f'"{data["id"]}-5"'}
+        failures = [
+            ("PUT", f"{BASE_URL}/{data['id']}/purchase", {}, status.HTTP_409_CONFLICT),
+            ("PUT", f"{BASE_URL}/{data['id']}/purchase", stale, status.HTTP_412_PRECONDITION_FAILED),
+            ("PUT", f"{BASE_URL}/0/purchase", {}, status.HTTP_404_NOT_FOUND),
+            ("PUT", f"{BASE_URL}/{data['id']}", stale, status.HTTP_412_PRECONDITION_FAILED),
+            ("PUT", f"{BASE_URL}/0", {}, status.HTTP_404_NOT_FOUND),
+        ]
+        for method, url, headers, expected in failures:
+            response, statements = self._run_counting_statements(method, url, json=data, headers=headers)
+            self.assertEqual(response.status_code, expected, url)
+            self.assertEqual(len(statements), count, url)
+
+    @patch("service.routes.Pet.delete")
+    def test_delete_pet_conflict(self, delete_mock):
+        """It should return a Conflict when a Pet changes during a delete"""
+        delete_mock.side_effect = DataConflictError("changed")
+        test_pet = self._create_pets(1)[0]
+        response = self.client.delete(f"{BASE_URL}/{test_pet.id}")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.get_json()["error"], "Conflict")
+
     # ----------------------------------------------------------
     # TEST DELETE
     # ----------------------------------------------------------
@@ -210,6 +614,54 @@ class TestPetService(TestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(len(response.data), 0)
 
+    def test_bulk_update_pets(self):
+        """It should Update every Pet that matches a filter"""
+        pets = self._create_pets(10)
+        test_category = pets[0].category
+        count = len([pet for pet in pets if pet.category == test_category])
+        response = self.client.patch(
+            BASE_URL, query_string=f"category={quote_plus(test_category)}", json={"available": False, "category": "sold"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], count)
+        data = self.client.get(BASE_URL, query_string="category=sold").get_json()
+        self.assertEqual(len(data), count)
+        for pet in data:
+            self.assertEqual(pet["available"], False)
+
+    def test_bulk_update_bad_data(self):
+        """It should not Update many Pets with bad data"""
+        self._create_pets(2)
+        bad_bodies = [
+            {}, {"weight": 10}, {"available": "no"}, {"gender": "dragon"}, {"birthday": "soon"},
+            {"name": None}, {"name": {"a": 1}}, {"category": 7},
+        ]
+        for body in bad_bodies:
+            response = self.client.patch(BASE_URL, query_string="all=true", json=body)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        response = self.client.patch(BASE_URL, query_string="all=true", json={"name": "x" * 64})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("longer than 63 characters", response.get_json()["message"])
+        names = {pet["name"] for pet in self.client.get(BASE_URL).get_json()}
+        self.assertNotIn("None", names)
+
+    def test_bulk_delete_pets(self):
+        """It should Delete every Pet that matches a filter"""
+        pets = self._create_pets(10)
+        test_category = pets[0].category
+        count = len([pet for pet in pets if pet.category == test_category])
+        response = self.client.delete(BASE_URL, query_string=f"category={quote_plus(test_category)}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], count)
+        data = self.client.get(BASE_URL).get_json()
+        self.assertEqual(len(data), 10 - count)
+        # deleting everything has to be asked for
+        response = self.client.delete(BASE_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.delete(BASE_URL, query_string="all=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 10 - count)
+
     # ----------------------------------------------------------
     # TEST QUERY
     # ----------------------------------------------------------
@@ -287,6 +739,182 @@ class TestPetService(TestCase):
         for pet in data:
             self.assertEqual(pet["gender"], Gender.FEMALE.name)
 
+    def test_query_by_multiple_attributes(self):
+        """It should Query Pets by several attributes at once"""
+        pets = self._create_pets(20)
+        test_category = pets[0].category
+        matches = [pet for pet in pets if pet.category == test_category and pet.available is True]
+        response = self.client.get(BASE_URL, query_string=f"category={quote_plus(test_category)}&available=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), len(matches))
+        for pet in data:
+            self.assertEqual(pet["category"], test_category)
+            self.assertEqual(pet["available"], True)
+
+    def test_query_by_birthday_range(self):
+        """It should Query Pets born within a range of dates"""
+        pets = self._create_pets(10)
+        birthdays = sorted(pet.birthday for pet in pets)
+        low, high = birthdays[2], birthdays[7]
+        count = len([pet for pet in pets if low <= pet.birthday <= high])
+        response = self.client.get(
+            BASE_URL, query_string=f"birthday_from={low.isoformat()}&birthday_to={high.isoformat()}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), count)
+        for pet in data:
+            self.assertTrue(low.isoformat() <= pet["birthday"] <= high.isoformat())
+
+    def test_query_sorted_and_paged(self):
+        """It should page through Pets sorted by name"""
+        pets = self._create_pets(7)
+        found = []
+        query_string = "sort=-name&limit=3"
+        while True:
+            response = self.client.get(BASE_URL, query_string=query_string)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            found += [pet["id"] for pet in response.get_json()]
+            if "X-Next-Cursor" not in response.headers:
+                break
+            query_string = f"sort=-name&limit=3&after={response.headers['X-Next-Cursor']}"
+        # every pet is seen exactly once (name order follows the db collation)
+        self.assertEqual(sorted(found), sorted(pet.id for pet in pets))
+
+    def test_query_sorted_by_birthday(self):
+        """It should page through Pets sorted by birthday"""
+        pets = self._create_pets(5)
+        expected = [pet.id for pet in sorted(pets, key=lambda pet: (pet.birthday, pet.id))]
+        response = self.client.get(BASE_URL, query_string="sort=birthday&limit=2")
+        cursor = response.headers["X-Next-Cursor"]
+        response = self.client.get(BASE_URL, query_string=f"sort=birthday&limit=5&after={cursor}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([pet["id"] for pet in response.get_json()], expected[2:])
+
+    def test_query_selected_fields(self):
+        """It should only return the selected fields of Pets"""
+        pets = self._create_pets(5)
+        expected = [pet.id for pet in sorted(pets, key=lambda pet: (pet.birthday, pet.id))]
+        response = self.client.get(BASE_URL, query_string="fields=name, id,name&sort=birthday&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([list(pet) for pet in data], [["id", "name"], ["id", "name"]])
+        self.assertEqual([pet["id"] for pet in data], expected[:2])
+        self.assertTrue(response.headers["ETag"].startswith("W/"))
+        # the sort column is not returned but still pages
+        cursor = response.headers["X-Next-Cursor"]
+        response = self.client.get(BASE_URL, query_string=f"fields=gender,birthday&sort=birthday&after={cursor}")
+        data = response.get_json()
+        self.assertEqual(len(data), 3)
+        self.assertEqual(set(data[0]), {"gender", "birthday"})
+        self.assertIn(data[0]["gender"], [gender.name for gender in Gender])
+        # a partial listing can be revalidated
+        etag = self.client.get(BASE_URL, query_string="fields=name").headers["ETag"]
+        response = self.client.get(BASE_URL, query_string="fields=name", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_stream_selected_fields(self):
+        """It should stream only the selected fields of Pets"""
+        self._create_pets(3)
+        response = self.client.get(BASE_URL, query_string="fields=category", headers={"Accept": "application/x-ndjson"})
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(set(json.loads(lines[0])), {"category"})
+
+    def test_query_with_count(self):
+        """It should send the number of matching Pets when asked to"""
+        pets = self._create_pets(5)
+        category = pets[0].category
+        count = len([pet for pet in pets if pet.category == category])
+        response = self.client.get(BASE_URL, query_string="limit=2&count=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertEqual(response.headers["X-Total-Count"], "5")
+        response = self.client.get(BASE_URL, query_string=f"category={quote_plus(category)}&count=true&stream=true")
+        self.assertEqual(response.headers["X-Total-Count"], str(count))
+        # counting is not free, so it is only done on request
+        response = self.client.get(BASE_URL)
+        self.assertNotIn("X-Total-Count", response.headers)
+
+    def test_query_by_search(self):
+        """It should Search Pets and return the best matches first"""
+        for name, category in [("Big Fido", "dog"), ("fido", "dog"), ("kitty", "cat")]:
+            pet = PetFactory(name=name, category=category)
+            self.client.post(BASE_URL, json=pet.serialize())
+        response = self.client.get(BASE_URL, query_string="q=fido&count=true")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([pet["name"] for pet in response.get_json()], ["fido", "Big Fido"])
+        self.assertEqual(response.headers["X-Total-Count"], "2")
+        # ranked results come in a single page
+        response = self.client.get(BASE_URL, query_string="q=dog&limit=1")
+        self.assertEqual(len(response.get_json()), 1)
+        self.assertNotIn("Link", response.headers)
+        # other sort orders page as usual
+        response = self.client.get(BASE_URL, query_string="q=dog&sort=name&limit=1")
+        self.assertIn("X-Next-Cursor", response.headers)
+        response = self.client.get(BASE_URL, query_string="q=dog&after=1")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string="q=%3F%3F")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pet_stats(self):
+        """It should count the Pets by category, gender and availability"""
+        pets = self._create_pets(10)
+        response = self.client.get(f"{BASE_URL}/stats")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["count"], 10)
+        self.assertEqual(data["source"], "live")
+        self.assertEqual(sum(data["category"].values()), 10)
+        self.assertEqual(sum(data["gender"].values()), 10)
+        available = len([pet for pet in pets if pet.available])
+        self.assertEqual(data["available"], {"true": available, "false": 10 - available})
+        # with the same filters as the listing
+        category = pets[0].category
+        response = self.client.get(f"{BASE_URL}/stats", query_string=f"category={quote_plus(category)}")
+        self.assertEqual(response.get_json()["category"], {category: len([pet for pet in pets if pet.category == category])})
+        response = self.client.get(f"{BASE_URL}/stats", query_string="gender=dragon")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pet_stats_from_summary(self):
+        """It should read the Pet stats from the summary when it is on"""
+        self._create_pets(5)
+        app.config["STATS_SUMMARY"] = True
+        try:
+            # there is no summary yet
+            self.assertEqual(self.client.get(f"{BASE_URL}/stats").get_json()["source"], "live")
+            PetSummary.refresh()
+            self._create_pets(1)
+            data = self.client.get(f"{BASE_URL}/stats").get_json()
+            self.assertEqual(data["source"], "summary")
+            self.assertEqual(data["count"], 5)
+            self.assertIn("as_of", data)
+            # filters that the summary cannot answer count the pets
+            data = self.client.get(f"{BASE_URL}/stats", query_string="birthday_from=1900-01-01").get_json()
+            self.assertEqual(data["source"], "live")
+            self.assertEqual(data["count"], 6)
+        finally:
+            app.config["STATS_SUMMARY"] = False
+
+    def test_query_bad_arguments(self):
+        """It should not Query Pets with bad filter or sort arguments"""
+        bad_query_strings = [
+            "gender=dragon",
+            "birthday_from=yesterday",
+            "sort=gender",
+            "sort=name&after=not-a-cursor",
+            f"sort=name&after={self._cursor([1, 2])}",
+            f"sort=-category&after={self._cursor([None, 2])}",
+            f"sort=birthday&after={self._cursor([20200101, 2])}",
+            f"sort=name&after={self._cursor(['fido', 99999999999])}",
+            f"sort=name&after={self._cursor(['fido', '2'])}",
+            "fields=id,color",
+        ]
+        for query_string in bad_query_strings:
+            response = self.client.get(BASE_URL, query_string=query_string)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query_string)
+
     # ----------------------------------------------------------
     # TEST ACTIONS
     # ----------------------------------------------------------
@@ -314,6 +942,44 @@ class TestPetService(TestCase):
         response = self.client.put(f"{BASE_URL}/{pet.id}/purchase")
         self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
 
+    def test_purchase_a_pet_twice(self):
+        """It should only let one buyer Purchase a Pet"""
+        pet = PetFactory(available=True)
+        response = self.client.post(BASE_URL, json=pet.serialize())
+        pet_id = response.get_json()["id"]
+        response = self.client.put(f"{BASE_URL}/{pet_id}/purchase")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["available"], False)
+        response = self.client.put(f"{BASE_URL}/{pet_id}/purchase")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_purchase_not_found(self):
+        """It should not Purchase a Pet that is not found"""
+        response = self.client.put(f"{BASE_URL}/0/purchase")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_purchase_if_match(self):
+        """It should only Purchase a Pet that has not changed since it was read"""
+        pet = PetFactory(available=True)
+        response = self.client.post(BASE_URL, json=pet.serialize())
+        etag = response.headers["ETag"]
+        pet_id = response.get_json()["id"]
+        # a tag for another pet never matches
+        response = self.client.put(f"{BASE_URL}/{pet_id}/purchase", headers={"If-Match": '"0-1"'})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        # the pet changes after it was read
+        data = self.client.get(f"{BASE_URL}/{pet_id}").get_json()
+        data["name"] = "Renamed"
+        self.client.put(f"{BASE_URL}/{pet_id}", json=data)
+        response = self.client.put(f"{BASE_URL}/{pet_id}/purchase", headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        # with the current etag it succeeds
+        etag = self.client.get(f"{BASE_URL}/{pet_id}").headers["ETag"]
+        response = self.client.put(f"{BASE_URL}/{pet_id}/purchase", headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(f"{BASE_URL}/{pet_id}/purchase", headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
 
 ######################################################################
 #  T E S T   S A D   P A T H S
@@ -368,16 +1034,17 @@ class TestSadPaths(TestCase):
     #  T E S T   M O C K S
     ######################################################################
 
-    @patch("service.routes.Pet.find_by_name")
+    @patch("service.routes.Pet.find_rows")
     def test_bad_request(self, bad_request_mock):
-        """It should return a Bad Request error from Find By Name"""
+        """It should return a Bad Request error from Find By Attributes"""
         bad_request_mock.side_effect = DataValidationError()
         response = self.client.get(BASE_URL, query_string="name=fido")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-    @patch("service.routes.Pet.find_by_name")
+    @patch("service.routes.Pet.find_rows")
     def test_mock_search_data(self, pet_find_mock):
         """It should showing how to mock data"""
-        pet_find_mock.return_value = [MagicMock(serialize=lambda: {"name": "fido"})]
+        row = namedtuple("Row", ["id", "name", "category", "available", "gender", "birthday", "version", "last_updated"])
+        pet_find_mock.return_value = [row(1, "fido", "dog", True, Gender.MALE, date(2020, 1, 1), 1, datetime(2024, 1, 1))]
         response = self.client.get(BASE_URL, query_string="name=fido")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,137 @@
+"""
+Test cases for the Gunicorn Server Settings
+"""
+import os
+import logging
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from service.common import server
+from service.common.metrics import metrics, format_labels
+
+
+def write_file(root: str, path: str, text: str) -> None:
+    """Writes a fake cgroup file"""
+    path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+def fake_server(**cfg) -> MagicMock:
+    """Returns a gunicorn arbiter with the given settings"""
+    arbiter = MagicMock()
+    arbiter.log = logging.getLogger("gunicorn.error")
+    settings = {"workers": 2, "threads": 4, "worker_class_str": "gthread", "preload_app": False, **cfg}
+    for name, value in settings.items():
+        setattr(arbiter.cfg, name, value)
+    return arbiter
+
+
+######################################################################
+#  S E T T I N G S   T E S T   C A S E S
+######################################################################
+class TestServerSettings(TestCase):
+    """Gunicorn Settings Tests"""
+
+    def test_cpu_limit(self):
+        """It should read the CPU limit from cgroup v2 or v1"""
+        with tempfile.TemporaryDirectory() as root:
+            self.assertIsNone(server.cpu_limit(root))
+            write_file(root, "cpu/cpu.cfs_quota_us", "150000\n")
+            write_file(root, "cpu/cpu.cfs_period_us", "100000\n")
+            self.assertEqual(server.cpu_limit(root), 1.5)
+            write_file(root, "cpu.max", "50000 100000\n")
+            self.assertEqual(server.cpu_limit(root), 0.5)
+            write_file(root, "cpu.max", "max 100000\n")
+            self.assertIsNone(server.cpu_limit(root))
+            with patch("os.sched_getaffinity", return_value={0, 1}, create=True):
+                self.assertEqual(server.available_cpus(root), 2)
+                write_file(root, "cpu.max", "50000 100000\n")
+                self.assertEqual(server.available_cpus(root), 0.5)
+
+    def test_unlimited_cgroup_v1(self):
+        """It should treat a quota of -1 as no CPU limit"""
+        with tempfile.TemporaryDirectory() as root:
+            write_file(root, "cpu/cpu.cfs_quota_us", "-1\n")
+            write_file(root, "cpu/cpu.cfs_period_us", "100000\n")
+            self.assertIsNone(server.cpu_limit(root))
+
+    def test_default_settings(self):
+        """It should run one threaded worker per CPU by default"""
+        settings = server.settings(env={}, cpus=0.5)
+        self.assertEqual(settings["workers"], 1)
+        self.assertEqual(settings["threads"], 4)
+        self.assertEqual(settings["worker_class"], "gthread")
+        self.assertEqual(settings["bind"], "0.0.0.0:8080")
+        self.assertEqual(settings["max_requests_jitter"], settings["max_requests"] // 10)
+        self.assertFalse(settings["preload_app"])
+        self.assertEqual(server.settings(env={}, cpus=2.5)["workers"], 3)
+
+    def test_settings_from_environment(self):
+        """It should take the settings from the environment"""
+        env = {
+            "PORT": "5000",
+            "WEB_CONCURRENCY": "3",
+            "GUNICORN_THREADS": "1",
+            "GUNICORN_KEEPALIVE": "75",
+            "GUNICORN_MAX_REQUESTS": "500",
+            "GUNICORN_PRELOAD": "true",
+        }
+        settings = server.settings(env=env, cpus=8)
+        self.assertEqual(settings["bind"], "0.0.0.0:5000")
+        self.assertEqual(settings["workers"], 3)
+        self.assertEqual(settings["worker_class"], "sync")
+        self.assertEqual(settings["keepalive"], 75)
+        self.assertEqual(settings["max_requests_jitter"], 50)
+        self.assertTrue(settings["preload_app"])
+
+
+######################################################################
+#  S E R V E R   H O O K S   T E S T   C A S E S
+######################################################################
+class TestServerHooks(TestCase):
+    """Gunicorn Server Hook Tests"""
+
+    def tearDown(self):
+        metrics.set_directory(None)
+        metrics.reset()
+
+    def test_on_starting(self):
+        """It should empty the metrics directory and check the pool size"""
+        with tempfile.TemporaryDirectory() as directory:
+            write_file(directory, "metrics_123.json", "{}")
+            with patch.object(server.config, "METRICS_MULTIPROC_DIR", directory):
+                with self.assertLogs("gunicorn.error", level="INFO") as logs:
+                    server.on_starting(fake_server(threads=64))
+            self.assertEqual(os.listdir(directory), [])
+        self.assertIn("64 threads", logs.output[-1])
+
+    def test_post_fork(self):
+        """It should drop the connections of the master in a preloaded worker"""
+        engine = MagicMock()
+        arbiter = fake_server(preload_app=True)
+        metrics.inc("http_requests_total", "", 1)
+        with patch("service.models.db") as db_mock:
+            db_mock.engines = {None: engine}
+            server.post_fork(arbiter, MagicMock())
+        engine.dispose.assert_called_once_with(close=False)
+        self.assertEqual(metrics.samples["http_requests_total"], {})
+        # without preload the worker creates its own engine
+        engine.reset_mock()
+        server.post_fork(fake_server(), MagicMock())
+        engine.dispose.assert_not_called()
+
+    def test_worker_exit(self):
+        """It should save the metrics of an exiting worker and archive them"""
+        labels = format_labels(method="GET", route="/pets", status=200)
+        with tempfile.TemporaryDirectory() as directory:
+            metrics.set_directory(directory)
+            metrics.inc("http_requests_total", labels, 2)
+            worker = MagicMock(pid=os.getpid())
+            server.worker_exit(fake_server(), worker)
+            with patch.object(server.config, "METRICS_MULTIPROC_DIR", directory):
+                server.child_exit(fake_server(), worker)
+            self.assertEqual(os.listdir(directory), ["metrics_archive.json"])
+            metrics.reset()
+            self.assertEqual(metrics.collect()["http_requests_total"][labels], 2)
@@ -0,0 +1,63 @@
+"""
+Test cases for the Startup Checks
+"""
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from sqlalchemy.exc import OperationalError
+from service.common.startup import DatabaseUnavailableError, wait_for_database
+
+CONNECTION_REFUSED = OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+
+def engine_failing(times: int) -> MagicMock:
+    """Returns an engine that fails to connect a number of times"""
+    engine = MagicMock()
+    engine.connect.side_effect = [CONNECTION_REFUSED] * times + [MagicMock()]
+    return engine
+
+
+######################################################################
+#  S T A R T U P   T E S T   C A S E S
+######################################################################
+@patch("retry.api.time.sleep")
+class TestWaitForDatabase(TestCase):
+    """Wait For Database Tests"""
+
+    def test_connects_first_time(self, sleep_mock):
+        """It should not wait when the database answers"""
+        self.assertEqual(wait_for_database(engine_failing(0)), 1)
+        sleep_mock.assert_not_called()
+
+    def test_retries_with_backoff(self, sleep_mock):
+        """It should wait longer after each failed attempt"""
+        with self.assertLogs("flask.app", level="WARNING") as logs:
+            attempts = wait_for_database(engine_failing(4), tries=5, delay=1, backoff=2, max_delay=5)
+        self.assertEqual(attempts, 5)
+        self.assertEqual([call.args[0] for call in sleep_mock.call_args_list], [1, 2, 4, 5])
+        self.assertEqual(len(logs.records), 4)
+        self.assertEqual(logs.records[0].attempt, 1)
+        self.assertEqual(logs.records[3].retry_in, 5)
+
+    def test_gives_up_after_tries(self, sleep_mock):
+        """It should give up after the last attempt"""
+        engine = engine_failing(5)
+        self.assertRaises(DatabaseUnavailableError, wait_for_database, engine, tries=3)
+        self.assertEqual(engine.connect.call_count, 3)
+        self.assertEqual(sleep_mock.call_count, 2)
+
+    def test_gives_up_after_max_wait(self, sleep_mock):
+        """It should not wait longer than max_wait in total"""
+        engine = engine_failing(5)
+        with patch("service.common.startup.time.monotonic", side_effect=[0, 0, 6]):
+            self.assertRaises(
+                DatabaseUnavailableError, wait_for_database, engine, tries=10, delay=5, backoff=1, max_wait=10
+            )
+        self.assertEqual(engine.connect.call_count, 2)
+        sleep_mock.assert_called_once_with(5)
+
+    def test_other_errors_are_not_retried(self, sleep_mock):
+        """It should not retry errors other than connection errors"""
+        engine = MagicMock()
+        engine.connect.side_effect = ValueError()
+        self.assertRaises(ValueError, wait_for_database, engine)
+        sleep_mock.assert_not_called()